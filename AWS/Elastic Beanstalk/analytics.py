@@ -0,0 +1,213 @@
+import numpy as np
+
+#---------------------------------------------------------------------------------------------
+
+# days in a rolling average and between the averages of a week-over-week change
+WEEK = 7
+# derived views of the trends, besides the daily values
+MODES = ['average', 'week_over_week', 'z_score']
+
+#---------------------------------------------------------------------------------------------
+
+def rolling_mean(values, window = WEEK):
+    """mean of the window of days ending on every day, skipping missing values
+    every series is averaged at once from cumulative sums, so the cost doesn't depend on the window
+    Input:
+        values (numpy array): series shaped (series, day)
+        window (int): days in the window, the first days average the days so far
+    Output:
+        means (numpy array): float64 shaped like values, NaN where a window has no values
+    """
+    present = ~np.isnan(values)
+    # cumulative sums with a leading zero, a window's sum is the difference of two of them
+    sums = np.zeros((len(values), values.shape[1] + 1))
+    np.cumsum(np.where(present, values, 0), axis = 1, out = sums[:, 1:])
+    counts = np.zeros((len(values), values.shape[1] + 1), dtype = np.int64)
+    np.cumsum(present, axis = 1, out = counts[:, 1:])
+    window_start = np.maximum(np.arange(values.shape[1]) + 1 - window, 0)
+    window_sums = sums[:, 1:] - sums[:, window_start]
+    window_counts = counts[:, 1:] - counts[:, window_start]
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return np.where(window_counts > 0, window_sums / window_counts, np.nan)
+
+def week_over_week(values):
+    """change of the rolling average since the week before
+    Input:
+        values (numpy array): series shaped (series, day)
+    Output:
+        changes (numpy array): float64 shaped like values in percentage points,
+                               NaN for the first week
+    """
+    means = rolling_mean(values)
+    changes = np.full(means.shape, np.nan)
+    changes[:, WEEK:] = means[:, WEEK:] - means[:, :-WEEK]
+
+    return changes
+
+def z_scores(values, n_history):
+    """standardize every series by the mean and standard deviation of its historical days
+    Input:
+        values (numpy array): series shaped (series, day)
+        n_history (int): number of historical days, later days are forecasted
+    Output:
+        scores (numpy array): float64 shaped like values, NaN for series without spread
+    """
+    history = values[:, :n_history]
+    present = ~np.isnan(history)
+    counts = present.sum(axis = 1)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        means = np.where(present, history, 0).sum(axis = 1, dtype = np.float64) / counts
+        deviations = np.where(present, history - means[:, None], 0)
+        stds = np.sqrt((deviations ** 2).sum(axis = 1) / counts)
+        stds[stds == 0] = np.nan
+
+        return (values - means[:, None]) / stds[:, None]
+
+def derive(values, mode, n_history):
+    """
+    Input:
+        values (numpy array): series shaped (series, day)
+        mode (string): one of MODES
+        n_history (int): number of historical days, later days are forecasted
+    Output:
+        derived (numpy array): float64 shaped like values, rounded to 2 decimals
+    """
+    if mode == 'average':
+        derived = rolling_mean(values)
+    elif mode == 'week_over_week':
+        derived = week_over_week(values)
+    elif mode == 'z_score':
+        derived = z_scores(values, n_history)
+    else:
+        raise ValueError('Unknown trend mode ' + str(mode) + '.')
+
+    return np.round(derived, 2)
+
+def build_analytics(values, n_history):
+    """derive every mode for all series of a data version at once
+    Input:
+        values (numpy array): trends shaped (..., day), e.g. a trend store's
+                              (country, transportation type, day) values
+        n_history (int): number of historical days, later days are forecasted
+    Output:
+        analytics (dict): mode -> array shaped like values in their dtype, float32 values
+                          keep float32 views so LOW_MEMORY halves them too
+    """
+    # a single 2-D array of series, whatever the leading axes
+    series = np.asarray(values).reshape(-1, values.shape[-1])
+
+    return {mode: derive(series, mode, n_history).astype(values.dtype, copy = False).reshape(values.shape)
+            for mode in MODES}
+
+def day_means(values):
+    """mean of every row's trends on every day, a single mean over the axes between the first and the last
+    Input:
+        values (numpy array): trends shaped (row, ..., day), e.g. (country, transportation type, day)
+    Output:
+        means (numpy array): float64 shaped (row, day), skipping missing values,
+                             NaN where a row has no values on a day
+    """
+    series = np.asarray(values).reshape(len(values), -1, values.shape[-1])
+    present = ~np.isnan(series)
+    counts = present.sum(axis = 1)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return np.where(counts > 0, np.where(present, series, 0).sum(axis = 1, dtype = np.float64) / counts, np.nan)
+
+class RangeMeans:
+    """mean of every row's trends over any range of days, from prefix sums over the day axis
+    a range's mean is the difference of two prefix sums over the difference of two prefix
+    counts, so the means of all rows cost a single vectorized subtraction whatever the range
+    """
+    def __init__(self, values):
+        """
+        Input:
+            values (numpy array): trends shaped (row, ..., day), e.g. (country, transportation type, day);
+                                  every axis between the first and the last is averaged too
+        """
+        series = np.asarray(values).reshape(len(values), -1, values.shape[-1])
+        present = ~np.isnan(series)
+        # prefix sums with a leading zero, so a range starting on the first day needs no special case
+        self.sums = np.zeros((len(series), series.shape[-1] + 1))
+        np.cumsum(np.where(present, series, 0).sum(axis = 1, dtype = np.float64), axis = 1, out = self.sums[:, 1:])
+        self.counts = np.zeros((len(series), series.shape[-1] + 1), dtype = np.int64)
+        np.cumsum(present.sum(axis = 1), axis = 1, out = self.counts[:, 1:])
+
+    @classmethod
+    def from_sums(cls, sums, counts):
+        """
+        Input:
+            sums (numpy array): prefix sums written by another RangeMeans, e.g. memory-mapped
+            counts (numpy array): prefix counts written by the same RangeMeans
+        Output:
+            range_means (RangeMeans): means over the prefix sums
+        """
+        range_means = cls.__new__(cls)
+        range_means.sums = sums
+        range_means.counts = counts
+
+        return range_means
+
+    def means(self, first_day, last_day):
+        """
+        Input:
+            first_day (int): offset of the first day
+            last_day (int): offset after the last day
+        Output:
+            means (numpy array): mean of every row over the range, skipping missing values,
+                                 NaN for rows without values in the range
+        """
+        counts = self.counts[:, last_day] - self.counts[:, first_day]
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            return np.where(counts > 0, (self.sums[:, last_day] - self.sums[:, first_day]) / counts, np.nan)
+
+def range_deltas(values, first_day, last_day, rows = None, window = WEEK):
+    """change of every series over a range of days, from the average of its first days to
+    the average of its last days. only the two windows are read, so the cost grows with the
+    number of series but not with the range
+    Input:
+        values (numpy array): series shaped (series, day)
+        first_day (int): offset of the first day
+        last_day (int): offset after the last day
+        rows (numpy array): rows of the series to compare, None compares every series
+        window (int): days averaged at either end, fewer for ranges shorter than 2 windows
+    Output:
+        deltas (numpy array): float64 change of every series in percentage points,
+                              NaN for series without values at either end
+    """
+    n_series = len(values) if rows is None else len(rows)
+    if last_day - first_day < 2:
+        return np.full(n_series, np.nan)
+    window = max(1, min(window, (last_day - first_day) // 2))
+
+    def window_mean(start):
+        # slice the window before picking rows, so only the window is copied
+        chunk = values[:, start:start + window]
+        if rows is not None:
+            chunk = chunk[rows]
+        present = ~np.isnan(chunk)
+        counts = present.sum(axis = 1)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            return np.where(counts > 0, np.where(present, chunk, 0).sum(axis = 1, dtype = np.float64) / counts, np.nan)
+
+    return window_mean(last_day - window) - window_mean(first_day)
+
+def top_movers(deltas, n):
+    """find the largest increases and decreases without sorting every series
+    Input:
+        deltas (numpy array): change of every series, NaN for series without a change
+        n (int): number of series of either kind
+    Output:
+        increases (numpy array): positions of up to n series with the largest positive changes, largest first
+        decreases (numpy array): positions of up to n series with the largest negative changes, largest first
+    """
+    movers = []
+    for sign in [1, -1]:
+        # flipping the sign makes decreases positive, NaN compares false and is skipped
+        changes = sign * deltas
+        candidates = np.flatnonzero(changes > 0)
+        if len(candidates) > n:
+            candidates = candidates[np.argpartition(-changes[candidates], n - 1)[:n]]
+        movers.append(candidates[np.argsort(-changes[candidates], kind = 'stable')])
+        pass
+
+    return movers[0], movers[1]
@@ -1,207 +1,339 @@
-import boto3
-
+import flask
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 
-import pandas as pd
 import numpy as np
 
+import os
+import gc
+import sys
+import time
+import ctypes
+import functools
+import threading
+import traceback
+from collections import namedtuple
 from datetime import datetime
 from datetime import timedelta
 
-import plotly.express as px
-
-#---------------------------------------------------------------------------------------------
+from figure_cache import FigureCache
+from analytics import build_analytics, derive, day_means, range_deltas, top_movers, RangeMeans
+from downsample import downsample_trace, zoom_range
+from precompressed import PrecompressedJSON
+from metrics import stage_metrics, memory_usage
+from request_profiler import RequestProfiler
 
-app = dash.Dash(__name__)
-application = app.server
+# plotly express and the data modules are only imported when data is loaded and pandas
+# when the app is created, so importing the module stays fast
 
 #---------------------------------------------------------------------------------------------
 
-def clean_data(trends):
-    """Clean data to desired format
+# seconds between attempts to load the first data version after a failure
+WARM_UP_RETRY_SECONDS = 30
+# milliseconds every day of the map timeline is shown while it plays
+MAP_FRAME_MILLISECONDS = 200
+# month and day the slider of the map timeline marks
+QUARTER_STARTS = ['01-01', '04-01', '07-01', '10-01']
+# number of largest increases and of largest decreases on the movers chart
+N_MOVERS = 5
+
+def read_config(environ):
+    """read the app settings from environment variables
     Input:
-        trends (dataframe): original Apple Mobility Trends report as a dataframe
+        environ (dict): environment variables, e.g. os.environ
     Output:
-        trends (dataframe): hierarchical columns by 'country' and 'transportation type'
-                            indexed are dates
-        country_names (list): a list of all country names in the Trends report
-    """
-    # filter by country level data
-    trends = trends[trends['geo_type'] == 'country/region']
-    # drop unused columns and change column name
-    trends = trends.drop(['geo_type', 'alternative_name', 'sub-region', 'country'], axis = 1)
-    trends = trends.rename({'region': 'country'}, axis = 1)
-    # get country names
-    country_names = trends['country'].unique()
-    # remove Untied Arab Emirates
-    country_names = [country for country in country_names if country != 'United Arab Emirates']
-    # set hierarchical index
-    trends.set_index(['country', 'transportation_type'], inplace = True)
-    # get difference from baseline
-    trends = trends - 100
-    # transpose dataframe so indices are dates
-    trends = trends.transpose()
-    # change index to datetime format
-    trends.index = pd.to_datetime(trends.index)
-
-    return trends, country_names
-
-def get_country_trend(trends_countries, country_names, country_name = 'United States'):
-    """filter trends by user-defined country
+        config (dict): setting name -> value
+    """
+    return {# draw the trend graph in the browser instead of on every server callback
+            'CLIENTSIDE_TRENDS': environ.get('CLIENTSIDE_TRENDS', '0') == '1',
+            # S3 bucket holding the trends, data is read from ./data if not set
+            'DATA_BUCKET': environ.get('DATA_BUCKET'),
+            # seconds between checks for new data, 0 disables reloading
+            'DATA_REFRESH_SECONDS': float(environ.get('DATA_REFRESH_SECONDS', 600)),
+            # show the 30-day forecast controls
+            'SHOW_FORECAST': environ.get('SHOW_FORECAST', '1') == '1',
+            # forecast with the built-in forecaster instead of reading forecasted_trends.csv
+            'BUILTIN_FORECAST': environ.get('BUILTIN_FORECAST', '0') == '1',
+            # downsample trend traces longer than this many points, 0 sends every point
+            'MAX_TRACE_POINTS': int(environ.get('MAX_TRACE_POINTS', 0)),
+            # directory shared by worker processes for a single copy of the data, e.g. /dev/shm/mobility,
+            # every worker loads its own copy if not set
+            'SHARED_DATA_DIR': environ.get('SHARED_DATA_DIR'),
+            # save cProfile dumps of sampled callback requests here, profiling is off if not set
+            'PROFILE_DIR': environ.get('PROFILE_DIR'),
+            # profile 1 in this many callback requests, 0 only profiles requests with PROFILE_HEADER
+            'PROFILE_EVERY': int(environ.get('PROFILE_EVERY', 0)),
+            'PROFILE_HEADER': environ.get('PROFILE_HEADER', 'X-Profile'),
+            'PROFILE_KEEP': int(environ.get('PROFILE_KEEP', 100)),
+            # number of finished figures kept in the figure cache
+            'FIGURE_CACHE_SIZE': int(environ.get('FIGURE_CACHE_SIZE', 512)),
+            # build the default figure of every country when data is loaded, server-side trends only
+            'FIGURE_CACHE_WARM': environ.get('FIGURE_CACHE_WARM', '1') == '1',
+            # compress callback responses larger than this many bytes, with brotli when it's installed
+            'COMPRESS_MIN_SIZE': int(environ.get('COMPRESS_MIN_SIZE', 1024)),
+            # parse and store trends as float32, lowering the peak memory of loading
+            'LOW_MEMORY': environ.get('LOW_MEMORY', '0') == '1',
+            # load the sub-regions, cities and counties of every country for drilling down, server-side trends only
+            'DRILL_DOWN': environ.get('DRILL_DOWN', '0') == '1',
+            # ship the map's colors on every day to the browser for playing and scrubbing through them
+            'MAP_TIMELINE': environ.get('MAP_TIMELINE', '0') == '1',
+            # load the data on a background thread after the app is created ('background'),
+            # or before create_app returns ('sync')
+            'WARM_UP': environ.get('WARM_UP', 'background'),
+           }
+
+# settings of the app, replaced by create_app
+app_config = read_config(os.environ)
+
+#---------------------------------------------------------------------------------------------
+
+# modes of the trend graph -> label and y-axis title, every mode but daily is derived
+# from the trends once per data version, see analytics.py
+TREND_MODES = {'daily': ('Daily', 'Mobilitys % Change From Baseline'),
+               'average': ('7-Day Average', '7-Day Average % Change From Baseline'),
+               'week_over_week': ('Week-over-Week', 'Change From the Week Before (% Points)'),
+               'z_score': ('Z-Score', 'Standard Deviations From Mean')}
+
+# built once per mode, validating it on every callback dominated the callback time
+@functools.lru_cache(maxsize = None)
+def build_trend_layout(mode = 'daily', legend_title = 'Transportation Types:'):
+    """build the constant part of the trend graph: dark template, axes, legend, fonts and margins
     Input:
-        trends (dataframe): hierarchical columns by 'country' and 'transportation type'
-                            indexed are dates
-        country_names (list): a list of all country names in the Trends report
-        country_name (string): user defined country name
+        mode (string): trend mode the y-axis is titled for, see TREND_MODES
+        legend_title (string): title of the legend
     Output:
-        trends_country (dataframe): trends for user-specified country
-                                    indexed by date
-                                    columns are transportation type
+        layout (dict): validated plotly layout, shared by every trend figure and never modified
     """
-    # check if country exists
-    # return corresponding data if yet
-    if country_name in country_names:
-        trends_country = trends_countries[country_name]
+    import plotly.express as px
 
-        return trends_country
-    # return US data if not
-    else:
-        print('No Data available for ' + country_name + '.')
-        trends_country = trends_countries['United States']
+    # create an empty line plot
+    fig = px.line(template = 'plotly_dark')
+    fig.update_xaxes(title='Date')
+    fig.update_yaxes(title=TREND_MODES[mode][1])
+    fig.update_layout(margin = dict(l = 50, r = 30, t = 20, b = 30, pad = 20),
+                      legend = dict(x = 0.8, y = 1.1,
+                                    itemclick = False,
+                                    title = dict(text = legend_title,
+                                                 side = 'top',
+                                                 font = dict(family = 'Arial',
+                                                             size = 18)),
+                                    orientation="h",
+                                    font = dict(family = 'Arial',
+                                                size = 15)
+                                  ),
+                      font = dict(family = 'Arial',
+                                  size = 15),
+                      hoverlabel = dict(bordercolor = 'white',
+                                        font = dict(family = 'Arial',
+                                                    size = 15))
+                     )
+
+    return fig.layout.to_plotly_json()
 
-        return trends_country
+# line colors of the 3 transportation types
+TREND_COLORS = ['#636EFA', '#EF553B', '#00CC96']
+# line colors of the countries compared on the trend graph, repeated for more countries
+COMPARE_COLORS = TREND_COLORS + ['#AB63FA', '#FFA15A', '#19D3F3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52']
 
-def get_country_forecast(forecast_countries, country_names, country_name = 'United States'):
-    """filter forecasted trends by user-defined country
+def series_traces(store, country, transportation, first_day, last_day, values, max_points, color, name):
+    """create the traces of a single series over a range of days, historical trends are drawn
+    solid and forecasted trends dashed when they continue a historical trend
     Input:
-        trends (dataframe): hierarchical columns by 'country' and 'transportation type'
-                            indexed are dates
-        country_names (list): a list of all country names in the Trends report
-        country_name (string): user defined country name
+        store (TrendStore): historical and forecasted trends for all countries
+        country (string): country name, as in store.country_names
+        transportation (string): transportation type
+        first_day (int): offset of the first day
+        last_day (int): offset after the last day
+        values (numpy array): derived trends shaped like the store's values, None draws the trends
+        max_points (int): downsample traces to this many points with LTTB, None keeps every point
+        color (string): line color
+        name (string): legend entry
     Output:
-        forecast_country (dataframe): forecasted trends for user-specified country
-                                      indexed by date
-                                      columns are transportation type
+        traces (list): plain trace dicts
     """
-    # check if country exists
-    # return corresponding data if yet
-    if country_name in country_names:
-        forecast_country = forecast_countries[country_name]
+    # split the selection into its historical and forecasted parts
+    history_end = max(first_day, min(last_day, store.n_history))
+    forecast_start = max(first_day, store.n_history)
+    has_forecast = last_day > forecast_start
+    has_history = history_end > first_day or not has_forecast
 
-        return forecast_country
-    # return US data if not
-    else:
-        print('No Data available for ' + country_name + '.')
-        forecast_country = forecast_countries['United States']
+    traces = []
+    if has_history:
+        x, y = downsample_trace(*store.series(country, transportation, first_day, history_end, values),
+                                max_points)
+        traces.append({'type': 'scatter',
+                       'x': x,
+                       'y': y,
+                       'line': {'color': color},
+                       'name': name})
+    if has_forecast:
+        x, y = downsample_trace(*store.series(country, transportation, forecast_start, last_day, values),
+                                max_points)
+        line = {'color': color, 'dash': 'dash'} if has_history else {'color': color}
+        traces.append({'type': 'scatter',
+                       'x': x,
+                       'y': y,
+                       'line': line,
+                       'name': name,
+                       'showlegend': not has_history})
 
-        return forecast_country
+    return traces
 
-def add_trend(country, trend, forecast, include_forecast, start_date, end_date):
+def add_trend(country, store, include_forecast, start_date, end_date, max_points = None,
+              mode = 'daily', analytics = None):
     """creates a line plot and adds historical and forecasted trend based on country
+    traces are plain dicts on the prebuilt layout, skipping plotly validation
     Input:
         country (string): country name
-        trend (dataframe): historical trends for all countries
-                          hierarchical columns by 'country' and 'transportation type'
-                          indexed are dates
-        forecast (dataframe): forecasted trends for all countries
-                              hierarchical columns by 'country' and 'transportation type'
-                              indexed are dates
+        store (TrendStore): historical and forecasted trends for all countries
         include_forecast (boolean): whether or not to include forecasted trends
         start_date (datetime): trend start date in %Y-%m-%d, e.g datetime(2020, 1, 14, 0, 0)
         end_date (datetime): trend end date in %Y-%m-%d, e.g datetime(2021, 2, 2, 0, 0)
+        max_points (int): downsample traces to this many points with LTTB, None keeps every point
+        mode (string): trend mode to draw, see TREND_MODES
+        analytics (dict): mode -> derived trends shaped like the store's values, needed by every mode but daily
     Output
-        fig (plotly express figure): line plot
+        fig (dict): line plot figure
     """
-    # define line colors for 3 transportation types
-    line_color = np.array(['#636EFA', '#EF553B', '#00CC96'])
-    # get historical and forecasted trends for a country
-    country_trend = get_country_trend(trend, country_names, country)
-    country_forecast = get_country_forecast(forecast, country_names, country)
+    values = None if mode == 'daily' else analytics[mode]
+    # get the country to plot and resolve selected dates to day offsets
+    country = store.resolve_country(country)
+    first_day, last_day = store.day_range(start_date, end_date, include_forecast)
 
-    # create a line plot
-    fig = px.line(template = 'plotly_dark')
-    fig.update_xaxes(title='Date')
-    fig.update_yaxes(title='Mobilitys % Change From Baseline')
-
-    # there are 4 scenarios in total:
-    # 1 - while include_forecast is ON, dates are picked from historical timeline
-    # 2 - while include_forecast is ON, dates are picked from forecasted timeline
-    # 3 - while include_forecast is ON, dates span both historical and forecasted timeline
-    # 4 - while include_forecast is OFF, dates could only be picked from historical timeline
-
-    # figure response for the first 3 scenarios where include_forecast is ON
-    if include_forecast:
-        # scenario 1, datepicker end date in historical timeline
-        if end_date in country_trend.index:
-            # fitler data based on selected date
-            filtered_trend = country_trend.loc[start_date:end_date, :]
-            # add trends
-            for idx, transportation in enumerate(filtered_trend.columns):
-                fig.add_scatter(x = filtered_trend.index,
-                                y = filtered_trend[transportation],
-                                line = dict(color = line_color[idx]),
-                                name = transportation)
-                pass
-            pass
-        # scenario 2, datepicker start date in forecasted timeline
-        elif start_date in country_forecast.index:
-            # fitler data based on selected date
-            filtered_forecast = country_forecast.loc[start_date:end_date, :]
-            # add trends
-            for idx, transportation in enumerate(filtered_forecast.columns):
-                fig.add_scatter(x = filtered_forecast.index,
-                                y = filtered_forecast[transportation],
-                                line = dict(color = line_color[idx]),
-                                name = transportation)
-                pass
-            pass
-        # scenario 3, datepicker start date in historical timeline
-        # datepicker end date in forecasted timeline
+    traces = []
+    for idx, transportation in enumerate(store.country_transports[country]):
+        traces.extend(series_traces(store, country, transportation, first_day, last_day, values, max_points,
+                                    TREND_COLORS[idx], transportation))
+        pass
+
+    return {'data': traces, 'layout': build_trend_layout(mode)}
+
+def add_comparison(countries, transportation, store, include_forecast, start_date, end_date, max_points = None,
+                   mode = 'daily', analytics = None):
+    """creates a line plot overlaying the trends of a transportation type in several countries
+    Input:
+        countries (list): country names, as in store.country_names
+        transportation (string): transportation type, countries not reporting it are left out
+        store (TrendStore): historical and forecasted trends for all countries
+        include_forecast (boolean): whether or not to include forecasted trends
+        start_date (string): trend start date in %Y-%m-%d
+        end_date (string): trend end date in %Y-%m-%d
+        max_points (int): downsample traces to this many points with LTTB, None keeps every point
+        mode (string): trend mode to draw, see TREND_MODES
+        analytics (dict): mode -> derived trends shaped like the store's values, needed by every mode but daily
+    Output
+        fig (dict): line plot figure
+    """
+    values = None if mode == 'daily' else analytics[mode]
+    first_day, last_day = store.day_range(start_date, end_date, include_forecast)
+
+    traces = []
+    for idx, country in enumerate(countries):
+        if transportation in store.country_transports[country]:
+            traces.extend(series_traces(store, country, transportation, first_day, last_day, values, max_points,
+                                        COMPARE_COLORS[idx % len(COMPARE_COLORS)], country))
+        pass
+
+    return {'data': traces, 'layout': build_trend_layout(mode, transportation.capitalize() + ' in:')}
+
+def add_region_trend(geo, regions, start_date, end_date, max_points = None, mode = 'daily'):
+    """creates a line plot of the historical trends of a region within a country, regions have no forecast
+    Input:
+        geo (int): geography number in the geo index
+        regions (GeoIndex): historical trends of regions within countries
+        start_date (string): trend start date in %Y-%m-%d
+        end_date (string): trend end date in %Y-%m-%d
+        max_points (int): downsample traces to this many points with LTTB, None keeps every point
+        mode (string): trend mode to draw, see TREND_MODES
+    Output
+        fig (dict): line plot figure
+    """
+    first_day, last_day = regions.day_range(start_date, end_date)
+    series_rows = regions.series_rows[geo]
+    # a region has at most a few series, derived on request with the kernels of the countries' analytics
+    if mode != 'daily':
+        derived = derive(regions.values[list(series_rows.values())], mode, len(regions.days))
+    traces = []
+    for idx, transportation in enumerate(series_rows):
+        if mode == 'daily':
+            x, y = regions.series(geo, transportation, first_day, last_day)
         else:
-            # fitler data based on selected date
-            filtered_trend = country_trend.loc[start_date:, :]
-            filtered_forecast = country_forecast.loc[:end_date, :]
-            # add trends for both historical data and forecasted data
-            for idx, transportation in enumerate(filtered_trend.columns):
-                fig.add_scatter(x = filtered_trend.index,
-                                y = filtered_trend[transportation],
-                                line = dict(color = line_color[idx]),
-                                name = transportation)
-                fig.add_scatter(x = filtered_forecast.index,
-                                y = filtered_forecast[transportation],
-                                line = dict(color = line_color[idx],
-                                            dash='dash'),
-                                showlegend = False)
-                pass
-            pass
+            x, y = regions.day_labels[first_day:last_day], derived[idx, first_day:last_day]
+        x, y = downsample_trace(x, y, max_points)
+        traces.append({'type': 'scatter',
+                       'x': x,
+                       'y': y,
+                       'line': {'color': TREND_COLORS[idx]},
+                       'name': transportation})
         pass
-    # figure response for the 4th scenario where include_forecast is OFF
+
+    return {'data': traces, 'layout': build_trend_layout(mode)}
+
+def cached_trend(data, country, include_forecast, start_date, end_date, max_points = None, region = None,
+                 mode = 'daily', pinned = None, transportation = None):
+    """get a trend figure from the figure cache, building it with add_trend on a miss
+    Input:
+        data (DashboardData): data version to plot
+        country (string): country name
+        include_forecast (boolean): whether or not to include forecasted trends
+        start_date (string): trend start date in %Y-%m-%d
+        end_date (string): trend end date in %Y-%m-%d
+        max_points (int): downsample traces to this many points, None keeps every point
+        region (string): key of a region within a country to plot instead, see GeoIndex.keys
+        mode (string): trend mode to draw, see TREND_MODES
+        pinned (list): country names to compare with the country, on a single transportation type
+        transportation (string): transportation type the countries are compared on
+    Output
+        fig (dict): line plot
+    """
+    store = data.trend_store
+    regions = store.regions
+    # a region missing from this data version's index falls back to the country
+    geo = regions.lookup(region) if region is not None and regions is not None else None
+    # normalize inputs so equivalent selections share a cache entry
+    countries = None
+    if geo is None:
+        country = store.resolve_country(country)
+        first_day, last_day = store.day_range(start_date, end_date, include_forecast)
+        key = (store.version, country, include_forecast, first_day, last_day, max_points, mode)
+        # the country under the mouse comes first, followed by the pinned countries in the data version
+        if pinned and transportation in store.transport_slots:
+            countries = tuple(dict.fromkeys([country] + [c for c in pinned if c in store.country_transports]))
+            key = (store.version, countries, transportation, include_forecast, first_day, last_day, max_points, mode)
     else:
-        # fitler data based on selected date
-        filtered_trend = country_trend.loc[start_date:end_date, :]
-        # add trends
-        for idx, transportation in enumerate(filtered_trend.columns):
-            fig.add_scatter(x = filtered_trend.index,
-                            y = filtered_trend[transportation],
-                            line = dict(color = line_color[idx]),
-                            name = transportation)
-            pass
-        pass
+        first_day, last_day = regions.day_range(start_date, end_date)
+        key = (store.version, regions.keys[geo], first_day, last_day, max_points, mode)
 
-    fig.update_layout(margin = dict(l = 50, r = 30, t = 20, b = 30, pad = 20),
-                      legend = dict(x = 0.8, y = 1.1,
-                                    itemclick = False,
-                                    title = dict(text = 'Transportation Types:',
-                                                 side = 'top',
-                                                 font = dict(family = 'Arial',
-                                                             size = 18)),
-                                    orientation="h",
-                                    font = dict(family = 'Arial',
-                                                size = 15)
-                                  ),
+    def build():
+        with stage_metrics.timer('figure'):
+            if countries is not None:
+                return add_comparison(countries, transportation, store, include_forecast, start_date, end_date,
+                                      max_points, mode, data.analytics)
+            if geo is None:
+                return add_trend(country, store, include_forecast, start_date, end_date, max_points,
+                                 mode, data.analytics)
+            return add_region_trend(geo, regions, start_date, end_date, max_points, mode)
+
+    return figure_cache.get_or_build(key, build)
+
+# built once, like the trend graph's layout
+@functools.lru_cache(maxsize = None)
+def build_movers_layout():
+    """build the constant part of the movers chart
+    Output:
+        layout (dict): validated plotly layout, shared by every movers chart and never modified
+    """
+    import plotly.express as px
+
+    fig = px.bar(template = 'plotly_dark', height = 400)
+    fig.update_xaxes(title = 'Change From the First to the Last Week (% Points)')
+    # largest increase on top, largest decrease at the bottom
+    fig.update_yaxes(title = '', autorange = 'reversed')
+    fig.update_layout(margin = dict(l = 50, r = 30, t = 20, b = 30, pad = 10),
+                      showlegend = False,
                       font = dict(family = 'Arial',
                                   size = 15),
                       hoverlabel = dict(bordercolor = 'white',
@@ -209,204 +341,741 @@ def add_trend(country, trend, forecast, include_forecast, start_date, end_date):
                                                     size = 15))
                      )
 
-    return fig
+    return fig.layout.to_plotly_json()
 
-#---------------------------------------------------------------------------------------------
+def add_movers(deltas, label, n = N_MOVERS):
+    """creates a bar chart of the largest increases and decreases
+    Input:
+        deltas (numpy array): change of every geography over a range in percentage points
+        label (function): position in deltas -> name of the geography, only called for the movers
+        n (int): number of increases and of decreases
+    Output:
+        fig (dict): horizontal bar chart
+    """
+    increases, decreases = top_movers(deltas, n)
+    traces = []
+    for positions, color, name in [(increases, '#00CC96', 'Increase'), (decreases[::-1], '#EF553B', 'Decrease')]:
+        traces.append({'type': 'bar',
+                       'orientation': 'h',
+                       'x': np.round(deltas[positions], 2),
+                       'y': [label(position) for position in positions],
+                       'marker': {'color': color},
+                       'name': name})
+        pass
 
-# define bucket name
-bucket = "applemobilitytrends"
-# define s3 client
-s3 = boto3.client('s3')
-# define file names
-historical_file_name = 'applemobilitytrends.csv'
-forecast_file_name = 'forecasted_trends.csv'
-# load historical data from s3
-data_obj = s3.get_object(Bucket= bucket, Key= historical_file_name)
-trend_data = pd.read_csv(data_obj['Body'],
-                        # './data/applemobilitytrends.csv', #### for offline testing ####
-                         low_memory = False)
-trends_countries, country_names = clean_data(trend_data)
-# load forecasted data from s3
-data_obj = s3.get_object(Bucket= bucket, Key= forecast_file_name)
-forecast_countries = pd.read_csv(data_obj['Body'],
-                                # './data/forecasted_trends.csv', #### for offline testing ####
-                                 parse_dates = True,
-                                 header = [0,1],
-                                 index_col = 0)
-
-# convert index to string for both historical and forecasted data
-trends_countries_index = [str(date)[:10] for date in trends_countries.index]
-trends_countries.index = trends_countries_index
-forecast_countries_index = [str(date)[:10] for date in forecast_countries.index]
-forecast_countries.index = forecast_countries_index
+    return {'data': traces, 'layout': build_movers_layout()}
 
-#---------------------------------------------------------------------------------------------
+def cached_movers(data, transportation, include_forecast, start_date, end_date, scope = 'countries'):
+    """get a movers chart from the figure cache, ranking every geography on a miss
+    Input:
+        data (DashboardData): data version to rank
+        transportation (string): transportation type to rank the geographies on
+        include_forecast (boolean): whether or not forecasted days may be selected, regions have no forecast
+        start_date (string): range start date in %Y-%m-%d
+        end_date (string): range end date in %Y-%m-%d
+        scope (string): 'countries', or 'regions' for the regions of every country when they're loaded
+    Output
+        fig (dict): horizontal bar chart
+    """
+    store = data.trend_store
+    regions = store.regions
+    if scope == 'regions' and regions is not None:
+        first_day, last_day = regions.day_range(start_date, end_date)
+    else:
+        scope = 'countries'
+        first_day, last_day = store.day_range(start_date, end_date, include_forecast)
+    key = (store.version, 'movers', scope, transportation, first_day, last_day)
 
-# define most recent trend by taking the mean of transportation types
-most_recent_trends = [trends_countries[c].iloc[-1, :].mean().round(2) for c in country_names]
-hover_df_colname  = 'Avg % Change on: ' + trends_countries.index[-1]
-hover_df = pd.DataFrame(data = np.array(most_recent_trends)/100,
-                        index = country_names,
-                        columns = [hover_df_colname])
-# hover_df = hover_df.transpose()
-# use reversed color scale for map
-color_scale = list(reversed(px.colors.sequential.Oryel))
-# create a choropleth geo map
-fig_map = px.choropleth(data_frame = hover_df,
-                        locations = country_names,
-                        locationmode = "country names",
-                        color = hover_df_colname,
-                        hover_name = country_names,
-                        hover_data = {hover_df_colname:':.2%'},
-                        color_continuous_scale = color_scale,
-                        projection = "natural earth",
-                        template = 'plotly_dark',
-                        height = 400,
-                      )
-# update choropleth map specs
-geo = dict(projection_type = "natural earth",
-          countrycolor = "RebeccaPurple",
-          showocean = True, oceancolor = "rgb(136,204,238)", lakecolor = "rgb(136,204,238)",
-          showland = True, landcolor = 'rgb(255,255,255)'
-          )
-fig_map.update_geos(geo)
-# update map layout
-fig_map.update_layout(margin = {"l":50,"r":20,"t":20,"b":20},
-                      hoverlabel = dict(bordercolor = 'white',
-                                      font = dict(family = 'Arial',
-                                                  size = 15)
-                                      ),
-                      coloraxis = dict(colorbar = dict(title = dict(text = '',
-                                                                    font = dict(family = 'Arial',
-                                                                                size = 18),
-                                                                    side = 'right'
-                                                                  ),
-                                                      x = 1,
-                                                      tickformat = '%{n}f',
-                                                      tickwidth = 100
-                                                      )
-                                      )
-                      )
+    def build():
+        with stage_metrics.timer('movers'):
+            if scope == 'regions':
+                geos, rows = regions.transport_series.get(transportation, (np.zeros(0, dtype = np.int64),) * 2)
+                deltas = range_deltas(regions.values, first_day, last_day, rows)
+
+                return add_movers(deltas, lambda position: regions.labels[geos[position]] + ', ' +
+                                                           regions.countries[geos[position]])
+            country_names = data.country_names
+            slot = store.transport_slots.get(transportation)
+            if slot is None:
+                return add_movers(np.zeros(0), country_names.__getitem__)
+            # a strided view of one transportation type, ranking only the rows of the countries
+            # the dashboard shows, the store also holds dropped and forecast-only countries
+            rows = np.array([store.country_rows[country] for country in country_names], dtype = np.int64)
+            deltas = range_deltas(store.values[:, slot, :], first_day, last_day, rows)
+
+            return add_movers(deltas, country_names.__getitem__)
+
+    return figure_cache.get_or_build(key, build)
+
+def warm_figure_cache(data):
+    """build the default-range figure for every country
+    Input:
+        data (DashboardData): data version to build figures for
+    """
+    store = data.trend_store
+    for country in data.country_names:
+        cached_trend(data, country, False, store.labels[0], store.labels[store.n_history - 1],
+                     app_config['MAX_TRACE_POINTS'] or None)
+        pass
+
+def map_color_label(store, first_day, last_day):
+    """
+    Input:
+        store (TrendStore): historical and forecasted trends for all countries
+        first_day (int): offset of the first day
+        last_day (int): offset after the last day
+    Output:
+        label (string): name of the map's color over the range, e.g. 'Avg % Change from 2020-01-13 to 2020-12-16'
+    """
+    if last_day - first_day == 1:
+        return 'Avg % Change on: ' + store.labels[first_day]
+
+    return 'Avg % Change from ' + store.labels[first_day] + ' to ' + store.labels[last_day - 1]
+
+def map_colors(store, map_means, first_day, last_day):
+    """color every country by its average trend over a range of days
+    Input:
+        store (TrendStore): historical and forecasted trends for all countries
+        map_means (RangeMeans): range means of the countries in store.country_names
+        first_day (int): offset of the first day
+        last_day (int): offset after the last day
+    Output:
+        colors (numpy array): mean of every country's transportation types over the range,
+                              as a fraction for the map's percent format
+        label (string): name of the color, see map_color_label
+    """
+    # the report's 2 decimals like the trends on the graph, rounded after scaling so the
+    # fractions serialize short
+    colors = np.round(map_means.means(first_day, last_day) / 100, 4)
+
+    return colors, map_color_label(store, first_day, last_day)
+
+def build_map(store, map_means):
+    """create a choropleth map colored by the trends over the default date range
+    Input:
+        store (TrendStore): historical and forecasted trends for all countries
+        map_means (RangeMeans): range means of the countries in store.country_names
+    Output:
+        fig_map (plotly express figure): choropleth geo map
+    """
+    import pandas as pd
+    import plotly.express as px
+
+    country_names = store.country_names
+    # the datepicker starts out selecting every historical day
+    colors, hover_df_colname = map_colors(store, map_means, 0, store.n_history)
+    hover_df = pd.DataFrame(data = colors,
+                            index = country_names,
+                            columns = [hover_df_colname])
+    # hover_df = hover_df.transpose()
+    # use reversed color scale for map
+    color_scale = list(reversed(px.colors.sequential.Oryel))
+    # create a choropleth geo map
+    fig_map = px.choropleth(data_frame = hover_df,
+                            locations = country_names,
+                            locationmode = "country names",
+                            color = hover_df_colname,
+                            hover_name = country_names,
+                            hover_data = {hover_df_colname:':.2%'},
+                            color_continuous_scale = color_scale,
+                            projection = "natural earth",
+                            template = 'plotly_dark',
+                            height = 400,
+                          )
+    # update choropleth map specs
+    geo = dict(projection_type = "natural earth",
+              countrycolor = "RebeccaPurple",
+              showocean = True, oceancolor = "rgb(136,204,238)", lakecolor = "rgb(136,204,238)",
+              showland = True, landcolor = 'rgb(255,255,255)'
+              )
+    fig_map.update_geos(geo)
+    # update map layout
+    fig_map.update_layout(margin = {"l":50,"r":20,"t":20,"b":20},
+                          hoverlabel = dict(bordercolor = 'white',
+                                          font = dict(family = 'Arial',
+                                                      size = 15)
+                                          ),
+                          coloraxis = dict(colorbar = dict(title = dict(text = '',
+                                                                        font = dict(family = 'Arial',
+                                                                                    size = 18),
+                                                                        side = 'right'
+                                                                      ),
+                                                          x = 1,
+                                                          tickformat = '%{n}f',
+                                                          tickwidth = 100
+                                                          )
+                                          )
+                          )
+
+    return fig_map
+
+def build_map_frames(store, fig_map):
+    """encode the map's colors on every day for the map timeline
+    Input:
+        store (TrendStore): historical and forecasted trends for all countries,
+                            with the day means of its countries, see build_country_means
+        fig_map (plotly express figure): choropleth geo map, sent once with the layout
+    Output:
+        frames (dict): date labels, number of historical days, the hover template around the date
+                       and a color vector per day in hundredths of a percent, missing colors are None
+    """
+    # integers in the countries' order are a fraction of the size of the figure's floats,
+    # the browser divides them by scale
+    means = store.country_day_means.T
+    colors = np.round(np.nan_to_num(means) * 100).astype(np.int64).astype(object)
+    colors[np.isnan(means)] = None
+    head, tail = fig_map.data[0].hovertemplate.split(map_color_label(store, 0, store.n_history))
+
+    return {'dates': store.labels.tolist(),
+            'n_history': store.n_history,
+            'scale': 10000,
+            'hovertemplate': [head + 'Avg % Change on: ', tail],
+            'colors': colors.tolist()}
+
+def build_country_means(store):
+    """average the trends of every country for the map, once per data version
+    Input:
+        store (TrendStore): store to set country_means of, and country_day_means of with the map timeline
+    """
+    country_values = store.values[[store.country_rows[country] for country in store.country_names]]
+    # prefix sums of every country's trends, recoloring the map for a date range reads two columns
+    store.country_means = RangeMeans(country_values)
+    # the colors of every day at once, shipped with the layout
+    if app_config['MAP_TIMELINE']:
+        store.country_day_means = day_means(country_values)
+
+# everything the dashboard shows for one version of the data, never modified after
+# it's built so callbacks always see a consistent version
+DashboardData = namedtuple('DashboardData', ['country_names', 'trend_store', 'analytics', 'map_means',
+                                             'fig_map', 'map_frames', 'trend_payload', 'layout_json'])
+
+def load_store(source):
+    """load trends from a data source into a trend store
+    Input:
+        source (LocalSource or S3Source): where to load trends from
+    Output:
+        trend_store (TrendStore): historical and forecasted trends for all countries
+    """
+    from trend_store import TrendStore
+
+    trends_countries, country_names, forecast_countries, regions = source.load()
+
+    # stitch historical and forecasted trends into a single array for fast slicing,
+    # the store reads dates from either index and leaves the frames unmodified
+    with stage_metrics.timer('store'):
+        trend_store = TrendStore(trends_countries, forecast_countries, country_names,
+                                 dtype = np.float32 if app_config['LOW_MEMORY'] else np.float64,
+                                 regions = regions)
+    # rolling averages, week-over-week changes and z-scores of every series at once, kept in
+    # the store so a shared data directory shares them like the values
+    if not app_config['CLIENTSIDE_TRENDS']:
+        with stage_metrics.timer('analytics'):
+            trend_store.analytics = build_analytics(trend_store.values, trend_store.n_history)
+    # averaged for the map, kept in the store too
+    with stage_metrics.timer('map_means'):
+        build_country_means(trend_store)
+
+    return trend_store
+
+def build_data(source):
+    """load trends from a data source and derive everything the dashboard shows
+    with a shared data directory, the first worker to take the loader lock loads the
+    data and every worker attaches to the store it published
+    Input:
+        source (LocalSource or S3Source): where to load trends from
+    Output:
+        data (DashboardData): new data version
+    """
+    if shared_store is None:
+        trend_store = load_store(source)
+    else:
+        with shared_store.lock():
+            stamp = source.stamp()
+            if not shared_store.is_current(stamp):
+                trend_store = load_store(source)
+                with stage_metrics.timer('shared_publish'):
+                    shared_store.publish(trend_store, stamp)
+            # map the store before releasing the lock, the next publish removes its file
+            trend_store = shared_store.attach()
+            pass
+    # a shared store published by a worker without the map timeline has no day means
+    if trend_store.country_means is None or (app_config['MAP_TIMELINE'] and trend_store.country_day_means is None):
+        with stage_metrics.timer('map_means'):
+            build_country_means(trend_store)
+    map_means = trend_store.country_means
+    with stage_metrics.timer('map'):
+        fig_map = build_map(trend_store, map_means)
+    map_frames = None
+    if app_config['MAP_TIMELINE']:
+        with stage_metrics.timer('map_frames'):
+            map_frames = build_map_frames(trend_store, fig_map)
+    trend_payload = None
+    analytics = None
+    if app_config['CLIENTSIDE_TRENDS']:
+        trend_payload = trend_store.to_payload()
+        trend_payload['layout'] = build_trend_layout()
+    else:
+        analytics = trend_store.analytics
+        # a shared store published by a worker drawing trends in the browser has none
+        if analytics is None:
+            with stage_metrics.timer('analytics'):
+                analytics = build_analytics(trend_store.values, trend_store.n_history)
+
+    data = DashboardData(trend_store.country_names, trend_store, analytics, map_means, fig_map, map_frames,
+                         trend_payload, None)
+    # serialize and compress the layout, including the map, once per data version
+    with stage_metrics.timer('layout'):
+        layout_json = PrecompressedJSON(build_layout(data))
+
+    return data._replace(layout_json = layout_json)
+
+def publish_data(data):
+    """make a new data version current
+    the figure cache is warmed before the swap so requests never wait for it
+    Input:
+        data (DashboardData): new data version
+    """
+    global dashboard_data
+    if app_config['FIGURE_CACHE_WARM'] and not app_config['CLIENTSIDE_TRENDS']:
+        with stage_metrics.timer('warm_cache'):
+            warm_figure_cache(data)
+    # a single assignment, callbacks read either the old or the new version
+    dashboard_data = data
+    figure_cache.retain_version(data.trend_store.version)
+
+def release_free_memory():
+    """hand memory freed while loading back to the operating system
+    glibc keeps freed heap memory for reuse, which otherwise keeps the peak of loading resident
+    """
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    # not glibc
+    except (OSError, AttributeError):
+        pass
+
+def load_data(source):
+    """load, build and publish a new data version
+    Input:
+        source (LocalSource or S3Source): where to load trends from
+    """
+    publish_data(build_data(source))
+    release_free_memory()
 
 #---------------------------------------------------------------------------------------------
 
 available_trends = ['No', 'Yes']
 
-# define dashboard layout
-app.layout = html.Div(style={'backgroundColor': 'rgb(17,17,17)'}, children = [
-    html.Div(style={'backgroundColor': 'rgb(17,17,17)'}, children = [
-        html.H1('Apple Mobility Trends Dashboard',
-                style = {'color':'white',
-                         'font-family':'Helvetica',
-                         'font-size': '85px',
-                         'width':'30%',
-                         'display': 'inline-block',
-                         'vertical-align': 'middle',
-                         'margin-left': '50px',
-                         'margin-right': '10px',
-                         'margin-top': '10px',
-                         'margin-bottom': '10px'}),
-        dcc.Graph(id = 'world_map',
-                  figure = fig_map,
-                  hoverData = {'points': [{'hovertext': 'United States'}]},
-                  style = {'width':'62%',
-                          'display': 'inline-block',
-                          'vertical-align': 'middle',
-                          'align': 'left'})
-    ]),
-
-    html.Div(style={'backgroundColor': 'rgb(17,17,17)'}, children = [
-        html.Div('Include a 30-Day Forecast: ',
-                 style = {'color':'white',
-                          'font-family':'Helvetica',
-                          'font-size': '20px',
-                          'textAlign': 'right',
-                          'width':'30%',
-                          'display': 'inline-block',
-                          'display':'none' ##### hide component #####
-                          }),
-        dcc.RadioItems(id = 'include_forecast',
-                      options = [{'label': " " + i, 'value': i} for i in available_trends],
-                      value = 'No',
-                      labelStyle = {'display': 'inline-block', 'cursor': 'pointer', 'margin-right': '30px'},
-                      style = {
-                                'color':'white',
-                                'font-family':'Helvetica',
-                                'font-size': '20px',
-                                'textAlign': 'left',
-                                'width':'20%',
-                                'display': 'inline-block',
-                                'margin-left': '30px',
-                                'display':'none' ##### hide component #####
-                                }),
-        dcc.DatePickerRange(id = 'select_date',
-                            clearable = True,
-                            number_of_months_shown = 2,
-                            minimum_nights = 1,
-                            day_size = 30,
-                            start_date = trends_countries.index[0],
-                            end_date = trends_countries.index[-1],
-                            min_date_allowed = trends_countries.index[0],
-                            display_format = 'Y-M-D',
-                            style = {'font-family':'Helvetica',
-                                     'textAlign': 'right',
-                                     'display': 'inline-block',
-                                     'width':'73%',
-                                     })
-    ]),
-
-    html.Div(children = [
-        html.Div(style = {'width':'2.5%',
-                          'display': 'inline-block'}),
-        dcc.Graph(id = 'trend', style = {'width':'95%',
-                                  'align': 'right',
-                                  'display': 'inline-block'}),
-        html.Div(style = {'width':'2.5%',
-                          'display': 'inline-block'})
-    ]),
-    html.Div(children = [
-        dcc.Markdown(children = ['Data sourced from [Apple Mobility Trends Reports](https://covid19.apple.com/mobility)'],
-                     style = {'color':'white',
-                              'font-family':'Helvetica',
-                              'font-size': '12px',
-                              'textAlign': 'left',
-                              'width':'23%',
-                              'margin-left': '20px',
-                              'display': 'inline-block'}),
-        dcc.Markdown(children = ['''
-                                 These graphs are interactive and responsive. **Hover** over points to see their values,
+def build_layout(data):
+    """build the dashboard layout
+    Input:
+        data (DashboardData): data version to show
+    Output:
+        layout (dash component): dashboard layout
+    """
+    store = data.trend_store
+    # define dashboard layout
+    layout = html.Div(style={'backgroundColor': 'rgb(17,17,17)'}, children = [
+        html.Div(style={'backgroundColor': 'rgb(17,17,17)'}, children = [
+            html.H1('Apple Mobility Trends Dashboard',
+                    style = {'color':'white',
+                             'font-family':'Helvetica',
+                             'font-size': '85px',
+                             'width':'30%',
+                             'display': 'inline-block',
+                             'vertical-align': 'middle',
+                             'margin-left': '50px',
+                             'margin-right': '10px',
+                             'margin-top': '10px',
+                             'margin-bottom': '10px'}),
+            dcc.Graph(id = 'world_map',
+                      figure = data.fig_map,
+                      hoverData = {'points': [{'hovertext': 'United States'}]},
+                      style = {'width':'62%',
+                              'display': 'inline-block',
+                              'vertical-align': 'middle',
+                              'align': 'left'})
+        ]),
 
-                                 **click** and **drag** to zoom, **hold down** shift, and **click** and **drag** to pan.
-                                 '''],
+        # play or scrub through the map's colors day by day, in the browser
+        html.Div(style = {'backgroundColor': 'rgb(17,17,17)',
+                          'display': 'block' if data.map_frames is not None else 'none'}, children = [
+            html.Button('Play', id = 'map_play', n_clicks = 0,
+                        style = {'font-family':'Helvetica',
+                                 'font-size': '16px',
+                                 'width':'6%',
+                                 'display': 'inline-block',
+                                 'vertical-align': 'top',
+                                 'margin-left': '50px',
+                                 }),
+            html.Div(id = 'map_day_label',
                      style = {'color':'white',
                               'font-family':'Helvetica',
-                              'font-size': '13px',
+                              'font-size': '16px',
+                              'width':'14%',
+                              'display': 'inline-block',
+                              'vertical-align': 'top',
                               'textAlign': 'center',
-                              'width':'50%',
-                              'margin-left': '10px',
-                              'margin-right': '10px',
-                              'display': 'inline-block'}),
-        dcc.Markdown(children = ['Designed and developed by [Michael Tang](http://www.linkedin.com/in/mtang0728)'],
+                              }),
+            html.Div(style = {'width':'70%', 'display': 'inline-block'}, children = [
+                dcc.Slider(id = 'map_day',
+                           min = 0,
+                           max = store.n_history - 1,
+                           step = 1,
+                           value = store.n_history - 1,
+                           # mark the first day of every quarter
+                           marks = {day: {'label': label[:7], 'style': {'color': 'white'}}
+                                    for day, label in enumerate(store.labels) if label[5:] in QUARTER_STARTS},
+                           updatemode = 'drag')
+            ]),
+            dcc.Interval(id = 'map_timer', interval = MAP_FRAME_MILLISECONDS, disabled = True)
+        ]),
+
+        html.Div(style={'backgroundColor': 'rgb(17,17,17)'}, children = [
+            html.Div('Include a 30-Day Forecast: ',
                      style = {'color':'white',
                               'font-family':'Helvetica',
-                              'font-size': '12px',
+                              'font-size': '20px',
                               'textAlign': 'right',
-                              'width':'22%',
-                              'margin-right': '25px',
+                              'width':'20%',
+                              'display': 'inline-block' if app_config['SHOW_FORECAST'] else 'none',
+                              }),
+            dcc.RadioItems(id = 'include_forecast',
+                          options = [{'label': " " + i, 'value': i} for i in available_trends],
+                          value = 'No',
+                          labelStyle = {'display': 'inline-block', 'cursor': 'pointer', 'margin-right': '30px'},
+                          style = {
+                                    'color':'white',
+                                    'font-family':'Helvetica',
+                                    'font-size': '20px',
+                                    'textAlign': 'left',
+                                    'width':'30%',
+                                    'display': 'inline-block' if app_config['SHOW_FORECAST'] else 'none',
+                                    'margin-left': '30px',
+                                    }),
+            dcc.DatePickerRange(id = 'select_date',
+                                clearable = True,
+                                number_of_months_shown = 2,
+                                minimum_nights = 1,
+                                day_size = 30,
+                                start_date = store.labels[0],
+                                end_date = store.labels[store.n_history - 1],
+                                min_date_allowed = store.labels[0],
+                                display_format = 'Y-M-D',
+                                # right-align the datepicker when the forecast controls are hidden
+                                style = {'font-family':'Helvetica',
+                                         'Align': 'center',
+                                         'display': 'inline-block',
+                                         'margin-left': '20px',
+                                         } if app_config['SHOW_FORECAST'] else {'font-family':'Helvetica',
+                                                                  'textAlign': 'right',
+                                                                  'display': 'inline-block',
+                                                                  'width':'73%',
+                                                                  }),
+            # drill down from the country clicked on the map to its sub-regions, cities and counties
+            dcc.Dropdown(id = 'select_region',
+                         placeholder = 'Click a country on the map to drill down',
+                         style = {'font-family':'Helvetica',
+                                  'width':'25%',
+                                  'display': 'inline-block' if store.regions is not None else 'none',
+                                  'vertical-align': 'middle',
+                                  'margin-left': '20px',
+                                  })
+        ]),
+
+        # draw the daily trends or one of the views derived from them, and compare the country under
+        # the mouse with pinned countries on a transportation type, server-side trends only
+        html.Div(style = {'display': 'none' if app_config['CLIENTSIDE_TRENDS'] else 'block'}, children = [
+            dcc.RadioItems(id = 'trend_mode',
+                           options = [{'label': " " + label, 'value': mode} for mode, (label, _) in TREND_MODES.items()],
+                           value = 'daily',
+                           labelStyle = {'display': 'inline-block', 'cursor': 'pointer', 'margin-right': '30px'},
+                           style = {'color':'white',
+                                    'font-family':'Helvetica',
+                                    'font-size': '20px',
+                                    'margin-left': '50px',
+                                    'display': 'inline-block',
+                                    'vertical-align': 'middle',
+                                    }),
+            dcc.Dropdown(id = 'pinned_countries',
+                         options = [{'label': country, 'value': country} for country in data.country_names],
+                         multi = True,
+                         placeholder = 'Pin countries to compare',
+                         style = {'font-family':'Helvetica',
+                                  'width':'30%',
+                                  'display': 'inline-block',
+                                  'vertical-align': 'middle',
+                                  'margin-left': '20px',
+                                  }),
+            dcc.RadioItems(id = 'compare_transport',
+                           options = [{'label': " " + transportation.capitalize(), 'value': transportation}
+                                      for transportation in store.transport_slots],
+                           value = next(iter(store.transport_slots)),
+                           labelStyle = {'display': 'inline-block', 'cursor': 'pointer', 'margin-right': '20px'},
+                           style = {'color':'white',
+                                    'font-family':'Helvetica',
+                                    'font-size': '20px',
+                                    'margin-left': '20px',
+                                    'display': 'inline-block',
+                                    'vertical-align': 'middle',
+                                    })
+        ]),
+
+        html.Div(children = [
+            html.Div(style = {'width':'2.5%',
+                              'display': 'inline-block'}),
+            dcc.Graph(id = 'trend', style = {'width':'95%',
+                                      'align': 'right',
+                                      'display': 'inline-block'}),
+            html.Div(style = {'width':'2.5%',
                               'display': 'inline-block'})
         ]),
-])
+
+        # the countries, or regions, whose trends on the compared transportation type changed the most
+        # over the dates on the datepicker, server-side trends only
+        html.Div(style = {'display': 'none' if app_config['CLIENTSIDE_TRENDS'] else 'block'}, children = [
+            html.Div('Top Movers Over the Selected Dates',
+                     style = {'color':'white',
+                              'font-family':'Helvetica',
+                              'font-size': '20px',
+                              'display': 'inline-block',
+                              'margin-left': '50px',
+                              }),
+            dcc.RadioItems(id = 'movers_scope',
+                           options = [{'label': ' Countries', 'value': 'countries'},
+                                      {'label': ' Regions', 'value': 'regions'}],
+                           value = 'countries',
+                           labelStyle = {'display': 'inline-block', 'cursor': 'pointer', 'margin-right': '20px'},
+                           style = {'color':'white',
+                                    'font-family':'Helvetica',
+                                    'font-size': '20px',
+                                    'margin-left': '30px',
+                                    'display': 'inline-block' if store.regions is not None else 'none',
+                                    }),
+            dcc.Graph(id = 'movers', style = {'width':'95%',
+                                              'margin-left': '2.5%'})
+        ]),
+        html.Div(children = [
+            dcc.Markdown(children = ['Data sourced from [Apple Mobility Trends Reports](https://covid19.apple.com/mobility)'],
+                         style = {'color':'white',
+                                  'font-family':'Helvetica',
+                                  'font-size': '12px',
+                                  'textAlign': 'left',
+                                  'width':'23%',
+                                  'margin-left': '20px',
+                                  'display': 'inline-block'}),
+            dcc.Markdown(children = ['''
+                                     These graphs are interactive and responsive. **Hover** over points to see their values,
+
+                                     **click** and **drag** to zoom, **hold down** shift, and **click** and **drag** to pan.
+                                     '''],
+                         style = {'color':'white',
+                                  'font-family':'Helvetica',
+                                  'font-size': '13px',
+                                  'textAlign': 'center',
+                                  'width':'50%',
+                                  'margin-left': '10px',
+                                  'margin-right': '10px',
+                                  'display': 'inline-block'}),
+            dcc.Markdown(children = ['Designed and developed by [Michael Tang](http://www.linkedin.com/in/mtang0728)'],
+                         style = {'color':'white',
+                                  'font-family':'Helvetica',
+                                  'font-size': '12px',
+                                  'textAlign': 'right',
+                                  'width':'22%',
+                                  'margin-right': '25px',
+                                  'display': 'inline-block'})
+            ]),
+    ])
+
+    # colors of the map for the date range on the datepicker, patched into the map in the browser
+    layout.children.append(dcc.Store(id = 'map_colors'))
+    # colors of the map on every day for the map timeline, None unless it's on
+    layout.children.append(dcc.Store(id = 'map_frames', data = data.map_frames))
+    # ship every country's series once so hovering needs no server requests
+    if app_config['CLIENTSIDE_TRENDS']:
+        layout.children.append(dcc.Store(id = 'trend_data', data = data.trend_payload))
+
+    return layout
+
+def build_loading_layout():
+    """build the page shown until the first data version is loaded
+    Output:
+        layout (dash component): loading page
+    """
+    return html.Div(style = {'backgroundColor': 'rgb(17,17,17)', 'height': '100vh'}, children = [
+        html.H1('Apple Mobility Trends Dashboard',
+                style = {'color':'white',
+                         'font-family':'Helvetica',
+                         'font-size': '85px',
+                         'margin-left': '50px',
+                         'margin-top': '10px'}),
+        html.Div('Loading the latest trends, refresh the page in a moment.',
+                 style = {'color':'white',
+                          'font-family':'Helvetica',
+                          'font-size': '20px',
+                          'margin-left': '50px'})
+    ])
+
+def build_validation_layout():
+    """build a layout holding every component the callbacks use, without data
+    dash checks callbacks against it instead of calling serve_layout when the app is created
+    Output:
+        layout (dash component): validation layout
+    """
+    return html.Div([dcc.Graph(id = 'world_map'),
+                     html.Button(id = 'map_play'),
+                     html.Div(id = 'map_day_label'),
+                     dcc.Slider(id = 'map_day'),
+                     dcc.Interval(id = 'map_timer'),
+                     dcc.Store(id = 'map_frames'),
+                     dcc.RadioItems(id = 'include_forecast'),
+                     dcc.DatePickerRange(id = 'select_date'),
+                     dcc.Dropdown(id = 'select_region'),
+                     dcc.RadioItems(id = 'trend_mode'),
+                     dcc.Dropdown(id = 'pinned_countries'),
+                     dcc.RadioItems(id = 'compare_transport'),
+                     dcc.RadioItems(id = 'movers_scope'),
+                     dcc.Graph(id = 'movers'),
+                     dcc.Graph(id = 'trend'),
+                     dcc.Store(id = 'map_colors'),
+                     dcc.Store(id = 'trend_data')])
+
+def serve_layout():
+    """build the dashboard layout from the current data, or the loading page until data is loaded"""
+    data = dashboard_data
+    if data is None:
+        return build_loading_layout()
+
+    return build_layout(data)
+
+#---------------------------------------------------------------------------------------------
+
+# current data version, None until the warm-up loaded the first one
+dashboard_data = None
+data_source = None
+shared_store = None
+data_refresher = None
+# cache finished figures, keyed on the data version
+figure_cache = FigureCache(max_size = app_config['FIGURE_CACHE_SIZE'])
+# seconds the warm-up took and the error of its last failed attempt, for the readiness endpoint
+warm_up_seconds = None
+warm_up_error = None
+
+def build_source(config):
+    """
+    Input:
+        config (dict): app settings
+    Output:
+        source (LocalSource or S3Source): where to load trends from
+    """
+    from data_refresh import LocalSource, S3Source, REGION_KEYS
+
+    dtype = 'float32' if config['LOW_MEMORY'] else None
+    # regions are only drawn by server-side trends
+    regions = config['DRILL_DOWN'] and not config['CLIENTSIDE_TRENDS']
+    # load trends from S3 when a bucket is configured, otherwise from ./data
+    if config['DATA_BUCKET']:
+        return S3Source(config['DATA_BUCKET'],
+                        forecast_key = None if config['BUILTIN_FORECAST'] else 'forecasted_trends.csv',
+                        dtype = dtype,
+                        region_keys = REGION_KEYS if regions else None)
+
+    return LocalSource('./data/applemobilitytrends.csv',
+                       None if config['BUILTIN_FORECAST'] else './data/forecasted_trends.csv',
+                       dtype = dtype,
+                       regions = regions)
+
+def warm_up():
+    """load the first data version, then start polling the data source for new data
+    the app serves the loading page until this is done
+    """
+    global data_source, shared_store, data_refresher, warm_up_seconds
+    from data_refresh import DataRefresher
+    from shared_data import SharedStore
+
+    start = time.perf_counter()
+    data_source = build_source(app_config)
+    data_stamp = data_source.stamp()
+    shared_store = SharedStore(app_config['SHARED_DATA_DIR']) if app_config['SHARED_DATA_DIR'] else None
+    load_data(data_source)
+    warm_up_seconds = time.perf_counter() - start
+    stage_metrics.observe('warm_up', warm_up_seconds)
+    rss, peak_rss = memory_usage()
+    # on stderr, stdout is left to whatever runs the app, e.g. the benchmarks reading its stages
+    print('Loaded data in {:.1f}s, {} MB resident, {:.0f} MB at peak.'.format(
+          warm_up_seconds, '?' if rss is None else '{:.0f}'.format(rss / 2**20), peak_rss / 2**20),
+          file = sys.stderr)
+
+    # poll the data source and swap in new data without restarting
+    if app_config['DATA_REFRESH_SECONDS'] > 0:
+        data_refresher = DataRefresher(data_source,
+                                       lambda: load_data(data_source),
+                                       interval = app_config['DATA_REFRESH_SECONDS'],
+                                       stamp = data_stamp)
+        data_refresher.start()
+
+def warm_up_in_background():
+    """warm up, retrying until the first data version is loaded"""
+    global warm_up_error
+    while True:
+        try:
+            warm_up()
+            warm_up_error = None
+
+            return
+        # keep serving the loading page and readiness errors while the source is unavailable
+        except Exception as error:
+            warm_up_error = repr(error)
+            traceback.print_exc()
+        time.sleep(WARM_UP_RETRY_SECONDS)
 
 #---------------------------------------------------------------------------------------------
 
+def timed_callback(callback):
+    """time a callback as a stage named after it
+    the time is kept for the request, so what dash spends around the callback,
+    mostly serializing its output, is timed as the serialize stage
+    Input:
+        callback (function): dash callback
+    Output:
+        timed (function): callback recording its time
+    """
+    @functools.wraps(callback)
+    def timed(*args):
+        start = time.perf_counter()
+        try:
+            return callback(*args)
+        finally:
+            seconds = time.perf_counter() - start
+            stage_metrics.observe(callback.__name__, seconds)
+            if flask.has_request_context():
+                flask.g.callback_seconds = seconds
+
+    return timed
+
+def start_request_timer():
+    flask.g.request_start = time.perf_counter()
+
+def record_callback_metrics(response):
+    if 'callback_seconds' in flask.g:
+        seconds = time.perf_counter() - flask.g.request_start
+        stage_metrics.observe('serialize', seconds - flask.g.callback_seconds)
+        stage_metrics.observe_payload(flask.request.get_json()['output'], response.calculate_content_length() or 0)
+
+    return response
+
 # callback for updating datepicker component based on include_forecast radioitem
-@app.callback(
-    [Output(component_id = 'select_date', component_property = 'max_date_allowed'),
-     Output(component_id = 'select_date', component_property = 'end_date'),
-     Output(component_id = 'select_date', component_property = 'start_date')],
-    Input(component_id = 'include_forecast', component_property = 'value')
-)
 def update_datepicker_range(radioitem_value):
+    # read the data version once, the refresher may swap in a new one during the callback
+    data = dashboard_data
+    # pages opened before a restart keep sending requests while the data loads
+    if data is None:
+        raise PreventUpdate
+    store = data.trend_store
+    first_date = store.labels[0]
+    last_date = store.labels[store.n_history - 1]
+    last_forecast_date = store.labels[-1]
     # convert include forecast selection to boolean
     include_forecast = True if radioitem_value == 'Yes' else False
     # define a 1 day deltatime object
@@ -414,27 +1083,62 @@ def update_datepicker_range(radioitem_value):
     # update maxmium allowed date on datepicker based on include_forecast
     if include_forecast == True:
         # fix 1-day-short bug with the max_date_allowed property by adding 1 day
-        max_date = datetime.strptime(forecast_countries.index[-1], '%Y-%m-%d')
+        max_date = datetime.strptime(last_forecast_date, '%Y-%m-%d')
         max_date = (max_date + delta).strftime('%Y-%m-%d')
 
-        return max_date, forecast_countries.index[-1], trends_countries.index[0]
+        return max_date, last_forecast_date, first_date
     else:
         # fix 1-day-short bug with  the max_date_allowed property by adding 1 day
-        max_date = datetime.strptime(trends_countries.index[-1], '%Y-%m-%d')
+        max_date = datetime.strptime(last_date, '%Y-%m-%d')
         max_date = (max_date + delta).strftime('%Y-%m-%d')
 
-        return max_date, trends_countries.index[-1], trends_countries.index[0]
-
-# callback for updating graph component based on selected country on map,
-# include_forecast radioitem, and date range on datepicker
-@app.callback(
-    Output(component_id = 'trend', component_property = 'figure'),
-    [Input(component_id = 'world_map', component_property = 'hoverData'),
-     Input(component_id = 'include_forecast', component_property = 'value'),
-     Input(component_id = 'select_date', component_property = 'start_date'),
-     Input(component_id = 'select_date', component_property = 'end_date')]
-)
-def update_trend(map_value, radioitem_value, datepicker_start, datepicker_end):
+        return max_date, last_date, first_date
+
+# callback for recoloring the map by the average trends over the date range on the datepicker,
+# only the colors and the hover label are sent, the browser patches them into the map
+def update_map_colors(datepicker_start, datepicker_end, radioitem_value):
+    # the colors, hover template and dates all come from one data version
+    data = dashboard_data
+    if data is None:
+        raise PreventUpdate
+    store = data.trend_store
+    first_day, last_day = store.day_range(datepicker_start, datepicker_end, radioitem_value == 'Yes')
+    # an empty range, e.g. while the forecast is toggled off with forecasted dates picked, keeps the colors
+    if first_day >= last_day:
+        raise PreventUpdate
+    colors, label = map_colors(store, data.map_means, first_day, last_day)
+    hovertemplate = data.fig_map.data[0].hovertemplate.replace(map_color_label(store, 0, store.n_history), label)
+
+    return {'z': np.where(np.isnan(colors), None, colors).tolist(), 'hovertemplate': hovertemplate}
+
+# callback for listing the regions of the country clicked on the map in the drill-down
+def update_region_options(map_click):
+    data = dashboard_data
+    if data is None or data.trend_store.regions is None:
+        raise PreventUpdate
+    store = data.trend_store
+    regions = store.regions
+    # list the regions of the default country until a country is clicked
+    country = store.default_country if map_click is None else map_click['points'][0]['hovertext']
+    options = [{'label': regions.labels[geo], 'value': regions.keys[geo]} for geo in regions.regions_of(country)]
+    placeholder = 'Drill down into ' + country if options else 'No regions reported for ' + country
+
+    return options, None, placeholder
+
+# callback for updating graph component based on selected country on map or region
+# in the drill-down, include_forecast radioitem, date range on datepicker, trend mode,
+# pinned countries and the transportation type they're compared on and, when traces
+# are downsampled, zooming in on the graph
+def update_trend(map_value, radioitem_value, datepicker_start, datepicker_end, region = None,
+                 mode = 'daily', pinned = None, transportation = None, relayout_data = None):
+    data = dashboard_data
+    if data is None:
+        raise PreventUpdate
+    # a region picked in the drill-down stays on the graph while the mouse moves over the map
+    if region is not None:
+        triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+        if triggered == ['world_map.hoverData']:
+            raise PreventUpdate
     # get country name from hoverData
     country = map_value['points'][0]['hovertext']
     # convert include forecast selection to boolean
@@ -442,9 +1146,212 @@ def update_trend(map_value, radioitem_value, datepicker_start, datepicker_end):
     # rename input variables
     start_time = datepicker_start
     end_time = datepicker_end
+    # after zooming, only the zoomed dates are sent, at full resolution if they fit the budget
+    zoom_start, zoom_end = zoom_range(relayout_data)
+    if zoom_start is not None:
+        triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+        if 'trend.relayoutData' in triggered:
+            start_time = zoom_start if start_time is None else max(start_time[:10], zoom_start)
+            end_time = zoom_end if end_time is None else min(end_time[:10], zoom_end)
+
+    return cached_trend(data, country, include_forecast, start_time, end_time,
+                        app_config['MAX_TRACE_POINTS'] or None, region,
+                        mode if mode in TREND_MODES else 'daily', pinned, transportation)
+
+# callback for ranking the countries or regions that changed the most over the date range
+# on the datepicker, on the compared transportation type
+def update_movers(transportation, datepicker_start, datepicker_end, scope, radioitem_value):
+    data = dashboard_data
+    if data is None:
+        raise PreventUpdate
+
+    return cached_movers(data, transportation, radioitem_value == 'Yes', datepicker_start,
+                         datepicker_end, scope)
+
+def register_callbacks(app):
+    """
+    Input:
+        app (dash app): app to register the callbacks on
+    """
+    app.callback([Output(component_id = 'select_date', component_property = 'max_date_allowed'),
+                  Output(component_id = 'select_date', component_property = 'end_date'),
+                  Output(component_id = 'select_date', component_property = 'start_date')],
+                 Input(component_id = 'include_forecast', component_property = 'value')
+                )(timed_callback(update_datepicker_range))
+
+    # the server averages the picked dates, the browser patches the colors into the map,
+    # see assets/trends.js
+    app.callback(Output(component_id = 'map_colors', component_property = 'data'),
+                 [Input(component_id = 'select_date', component_property = 'start_date'),
+                  Input(component_id = 'select_date', component_property = 'end_date')],
+                 [State(component_id = 'include_forecast', component_property = 'value')]
+                )(timed_callback(update_map_colors))
+    # the map timeline runs in the browser: the play button and the timer move the slider,
+    # and the slider's day picks a color vector from the map_frames store
+    app.clientside_callback(ClientsideFunction(namespace = 'map', function_name = 'recolor'),
+                            Output(component_id = 'world_map', component_property = 'figure'),
+                            [Input(component_id = 'map_colors', component_property = 'data'),
+                             Input(component_id = 'map_day', component_property = 'value')],
+                            [State(component_id = 'world_map', component_property = 'figure'),
+                             State(component_id = 'map_frames', component_property = 'data')],
+                            prevent_initial_call = True)
+    app.clientside_callback(ClientsideFunction(namespace = 'map', function_name = 'play'),
+                            [Output(component_id = 'map_timer', component_property = 'disabled'),
+                             Output(component_id = 'map_play', component_property = 'children'),
+                             Output(component_id = 'map_day', component_property = 'value')],
+                            [Input(component_id = 'map_play', component_property = 'n_clicks'),
+                             Input(component_id = 'map_timer', component_property = 'n_intervals')],
+                            [State(component_id = 'map_timer', component_property = 'disabled'),
+                             State(component_id = 'map_day', component_property = 'value'),
+                             State(component_id = 'map_day', component_property = 'max'),
+                             State(component_id = 'map_frames', component_property = 'data')],
+                            prevent_initial_call = True)
+    # the timeline runs into the forecast when it's included
+    app.clientside_callback(ClientsideFunction(namespace = 'map', function_name = 'update_timeline'),
+                            [Output(component_id = 'map_day', component_property = 'max'),
+                             Output(component_id = 'map_day_label', component_property = 'children')],
+                            [Input(component_id = 'include_forecast', component_property = 'value'),
+                             Input(component_id = 'map_day', component_property = 'value')],
+                            [State(component_id = 'map_frames', component_property = 'data')])
+
+    trend_inputs = [Input(component_id = 'world_map', component_property = 'hoverData'),
+                    Input(component_id = 'include_forecast', component_property = 'value'),
+                    Input(component_id = 'select_date', component_property = 'start_date'),
+                    Input(component_id = 'select_date', component_property = 'end_date')]
+    # in clientside mode the browser draws the graph from the trend_data store,
+    # see assets/trends.js, otherwise every change is a server round-trip
+    if app_config['CLIENTSIDE_TRENDS']:
+        app.clientside_callback(ClientsideFunction(namespace = 'trends', function_name = 'update_trend'),
+                                Output(component_id = 'trend', component_property = 'figure'),
+                                trend_inputs,
+                                [State(component_id = 'trend_data', component_property = 'data')])
+    else:
+        trend_inputs.append(Input(component_id = 'select_region', component_property = 'value'))
+        trend_inputs.append(Input(component_id = 'trend_mode', component_property = 'value'))
+        trend_inputs.append(Input(component_id = 'pinned_countries', component_property = 'value'))
+        trend_inputs.append(Input(component_id = 'compare_transport', component_property = 'value'))
+        if app_config['MAX_TRACE_POINTS']:
+            trend_inputs.append(Input(component_id = 'trend', component_property = 'relayoutData'))
+        app.callback(Output(component_id = 'trend', component_property = 'figure'),
+                     trend_inputs)(timed_callback(update_trend))
+        app.callback(Output(component_id = 'movers', component_property = 'figure'),
+                     [Input(component_id = 'compare_transport', component_property = 'value'),
+                      Input(component_id = 'select_date', component_property = 'start_date'),
+                      Input(component_id = 'select_date', component_property = 'end_date'),
+                      Input(component_id = 'movers_scope', component_property = 'value')],
+                     [State(component_id = 'include_forecast', component_property = 'value')]
+                    )(timed_callback(update_movers))
+        if app_config['DRILL_DOWN']:
+            app.callback([Output(component_id = 'select_region', component_property = 'options'),
+                          Output(component_id = 'select_region', component_property = 'value'),
+                          Output(component_id = 'select_region', component_property = 'placeholder')],
+                         Input(component_id = 'world_map', component_property = 'clickData')
+                        )(timed_callback(update_region_options))
+
+#---------------------------------------------------------------------------------------------
+
+# report figure cache counters for sizing the cache
+def figure_cache_stats():
+    return figure_cache.stats()
+
+# stage timings, payload sizes and cache counters for Prometheus, built only when scraped
+def metrics():
+    cache = figure_cache.stats()
+    extra = {'figure_cache_hits_total': cache['hits'],
+             'figure_cache_misses_total': cache['misses'],
+             'figure_cache_evictions_total': cache['evictions'],
+             'figure_cache_size': cache['size'],
+             'data_reloads_total': data_refresher.reloads if data_refresher is not None else 0,
+             'ready': int(dashboard_data is not None)}
+    rss, peak_rss = memory_usage()
+    extra['peak_resident_memory_bytes'] = peak_rss
+    if rss is not None:
+        extra['resident_memory_bytes'] = rss
+
+    return flask.Response(stage_metrics.render(extra), mimetype = 'text/plain; version=0.0.4')
+
+# 503 until the first data version is loaded, for load balancer health checks
+def readiness():
+    data = dashboard_data
+    if data is None:
+        return {'ready': False, 'error': warm_up_error}, 503
+
+    return {'ready': True,
+            'version': data.trend_store.version,
+            'warm_up_seconds': warm_up_seconds}
+
+def create_app(config = None):
+    """create the dash app, loading its data in the warm-up phase
+    the app answers requests as soon as it's created, with the loading page and a 503 from
+    /ready until the data is loaded. the app's state lives in this module, so a process
+    runs a single app
+    Input:
+        config (dict): settings overriding the environment variables, see read_config
+    Output:
+        app (dash app): dashboard, app.server is the WSGI application
+    """
+    global app_config, figure_cache, dashboard_data, data_refresher, warm_up_seconds, warm_up_error
+    # plotly's json encoder checks values against pandas once pandas is in sys.modules, import it
+    # before requests are served so none of them sees it half imported by the warm-up thread
+    import pandas
+
+    app_config = dict(read_config(os.environ), **(config or {}))
+    # start over from the loading page when an app was created before
+    if data_refresher is not None:
+        data_refresher.stop()
+    dashboard_data, data_refresher, warm_up_seconds, warm_up_error = None, None, None, None
+
+    server = flask.Flask(__name__)
+    server.config['COMPRESS_MIN_SIZE'] = app_config['COMPRESS_MIN_SIZE']
+    server.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+    app = dash.Dash(__name__, server = server, compress = True)
+    figure_cache = FigureCache(max_size = app_config['FIGURE_CACHE_SIZE'])
+
+    # setting a layout function calls it to validate the layout unless there is a validation layout
+    app.validation_layout = build_validation_layout()
+    app.layout = serve_layout
+
+    # layout requests get the layout serialized and compressed for the current data version
+    layout_path = app.config.routes_pathname_prefix + '_dash-layout'
+
+    @server.before_request
+    def serve_precompressed_layout():
+        data = dashboard_data
+        if data is not None and flask.request.path == layout_path:
+            return data.layout_json.response(flask.request)
+
+    server.before_request(start_request_timer)
+    # runs before Flask-Compress, so payload sizes are uncompressed
+    server.after_request(record_callback_metrics)
+    if app_config['PROFILE_DIR']:
+        request_profiler = RequestProfiler(app_config['PROFILE_DIR'], sample_every = app_config['PROFILE_EVERY'],
+                                           header = app_config['PROFILE_HEADER'], keep = app_config['PROFILE_KEEP'])
+        request_profiler.init_app(server, app.config.routes_pathname_prefix + '_dash-update-component')
+
+    register_callbacks(app)
+    server.add_url_rule('/figure-cache', view_func = figure_cache_stats)
+    server.add_url_rule('/metrics', view_func = metrics)
+    server.add_url_rule('/ready', view_func = readiness)
+
+    if app_config['WARM_UP'] == 'sync':
+        warm_up()
+    else:
+        threading.Thread(target = warm_up_in_background, name = 'warm-up', daemon = True).start()
+
+    return app
+
+def __getattr__(name):
+    """create the app from the environment variables the first time app or application is
+    looked up, so WSGI servers loading application:application get it and importing the
+    module alone stays cheap
+    """
+    if name in ('app', 'application'):
+        global app, application
+        app = create_app()
+        application = app.server
 
-    return add_trend(country, trends_countries, forecast_countries,
-                     include_forecast, start_time, end_time)
+        return globals()[name]
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 if __name__ == '__main__':
-    app.run_server()
+    create_app().run_server(debug = True)
@@ -0,0 +1,131 @@
+// draws the trend graph in the browser from the series shipped once in the
+// trend_data store, mirroring add_trend in application.py, recolors the map with
+// the colors update_map_colors sends for a date range and runs the map timeline
+// from the colors of every day in the map_frames store
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    trends: {
+        update_trend: function(map_value, radioitem_value, datepicker_start, datepicker_end, data) {
+            if (!data) {
+                return window.dash_clientside.no_update;
+            }
+            // define line colors for 3 transportation types
+            var line_color = ['#636EFA', '#EF553B', '#00CC96'];
+            // get country name from hoverData, fall back to the default country
+            var country = map_value['points'][0]['hovertext'];
+            if (!(country in data.series)) {
+                country = data.default_country;
+            }
+            // resolve selected dates to day offsets, dates in %Y-%m-%d sort as strings
+            var include_forecast = radioitem_value === 'Yes';
+            var n_days = include_forecast ? data.dates.length : data.n_history;
+            var bisect = function(date, right) {
+                var lo = 0, hi = data.dates.length;
+                while (lo < hi) {
+                    var mid = (lo + hi) >> 1;
+                    if (data.dates[mid] < date || (right && data.dates[mid] === date)) {
+                        lo = mid + 1;
+                    } else {
+                        hi = mid;
+                    }
+                }
+                return lo;
+            };
+            var first_day = datepicker_start ? bisect(datepicker_start.slice(0, 10), false) : 0;
+            var last_day = datepicker_end ? bisect(datepicker_end.slice(0, 10), true) : n_days;
+            first_day = Math.min(first_day, n_days);
+            last_day = Math.min(last_day, n_days);
+            // split the selection into its historical and forecasted parts
+            var history_end = Math.max(first_day, Math.min(last_day, data.n_history));
+            var forecast_start = Math.max(first_day, data.n_history);
+            var has_forecast = last_day > forecast_start;
+            var has_history = history_end > first_day || !has_forecast;
+
+            var traces = [];
+            data.transports[country].forEach(function(transportation, idx) {
+                var values = data.series[country][transportation];
+                if (has_history) {
+                    traces.push({type: 'scatter',
+                                 x: data.dates.slice(first_day, history_end),
+                                 y: values.slice(first_day, history_end),
+                                 line: {color: line_color[idx]},
+                                 name: transportation});
+                }
+                if (has_forecast) {
+                    traces.push({type: 'scatter',
+                                 x: data.dates.slice(forecast_start, last_day),
+                                 y: values.slice(forecast_start, last_day),
+                                 line: has_history ? {color: line_color[idx], dash: 'dash'}
+                                                   : {color: line_color[idx]},
+                                 name: transportation,
+                                 showlegend: !has_history});
+                }
+            });
+
+            return {data: traces, layout: data.layout};
+        }
+    },
+    map: {
+        recolor: function(map_colors, day, figure, frames) {
+            if (!figure) {
+                return window.dash_clientside.no_update;
+            }
+            var triggered = window.dash_clientside.callback_context.triggered.map(function(trigger) {
+                return trigger.prop_id;
+            });
+            var z, hovertemplate;
+            if (triggered.indexOf('map_day.value') >= 0 && frames && day !== null && day !== undefined) {
+                // colors of a day of the map timeline, shipped as integers
+                z = frames.colors[day].map(function(color) {
+                    return color === null ? null : color / frames.scale;
+                });
+                hovertemplate = frames.hovertemplate[0] + frames.dates[day] + frames.hovertemplate[1];
+            } else if (map_colors) {
+                z = map_colors.z;
+                hovertemplate = map_colors.hovertemplate;
+            } else {
+                return window.dash_clientside.no_update;
+            }
+            // swap the colors and hover label of the choropleth, the geography and layout stay
+            var trace = Object.assign({}, figure.data[0], {z: z, hovertemplate: hovertemplate});
+
+            return Object.assign({}, figure, {data: [trace].concat(figure.data.slice(1))});
+        },
+        play: function(n_clicks, n_intervals, paused, day, last_day, frames) {
+            var no_update = window.dash_clientside.no_update;
+            if (!frames) {
+                return [no_update, no_update, no_update];
+            }
+            var triggered = window.dash_clientside.callback_context.triggered.map(function(trigger) {
+                return trigger.prop_id;
+            });
+            if (triggered.indexOf('map_play.n_clicks') >= 0) {
+                if (!paused) {
+                    return [true, 'Play', no_update];
+                }
+                // start over once the last day was reached
+                return [false, 'Pause', day === null || day >= last_day ? 0 : no_update];
+            }
+            // a tick of the timer moves on to the next day, stopping on the last one
+            if (paused) {
+                return [no_update, no_update, no_update];
+            }
+            if (day >= last_day) {
+                return [true, 'Play', no_update];
+            }
+
+            return [no_update, no_update, day + 1];
+        },
+        update_timeline: function(radioitem_value, day, frames) {
+            if (!frames) {
+                return [window.dash_clientside.no_update, ''];
+            }
+            var last_day = (radioitem_value === 'Yes' ? frames.dates.length : frames.n_history) - 1;
+            var label = '';
+            if (day !== null && day !== undefined && day < frames.dates.length) {
+                label = frames.dates[day] + (day >= frames.n_history ? ' (forecast)' : '');
+            }
+
+            return [last_day, label];
+        }
+    }
+});
\ No newline at end of file
@@ -0,0 +1,272 @@
+import io
+import json
+import os
+import threading
+import time
+import traceback
+
+import pandas as pd
+
+from mobility_data import read_country_rows, read_report, clean_data, load_trends, append_segment
+from geo_index import GeoIndex
+from forecast import forecast_trends
+from metrics import stage_metrics
+
+#---------------------------------------------------------------------------------------------
+
+def read_forecast(forecast_file):
+    """read forecasted trends with two-level headers
+    Input:
+        forecast_file (string or file object): forecasted trends csv
+    Output:
+        forecast_countries (dataframe): hierarchical columns by 'country' and 'transportation type'
+                                        indexed are dates
+    """
+    return pd.read_csv(forecast_file,
+                       parse_dates = True,
+                       header = [0,1],
+                       index_col = 0)
+
+# S3 keys of the report partitions holding regions within countries, written by the ingest Lambda
+REGION_KEYS = ['applemobilitytrends-sub-regions.csv',
+               'applemobilitytrends-cities.csv',
+               'applemobilitytrends-counties.csv']
+
+def build_regions(region_data, dtype):
+    """
+    Input:
+        region_data (dataframe): sub-region, city and county rows of the report
+        dtype (string): dtype of the values, None for float64
+    Output:
+        regions (GeoIndex): regions within countries, None if the report has none
+    """
+    if len(region_data) == 0:
+        return None
+    with stage_metrics.timer('regions'):
+        return GeoIndex(region_data, dtype or 'float64')
+
+class LocalSource:
+    """historical and forecasted trends stored as local files
+    without a forecast file, trends are forecasted with the built-in forecaster on load.
+    the snapshot only holds countries, loading regions always parses the report
+    """
+    def __init__(self, historical_path = './data/applemobilitytrends.csv',
+                 forecast_path = './data/forecasted_trends.csv', dtype = None, regions = False):
+        """
+        Input:
+            historical_path (string): Apple Mobility Trends report
+            forecast_path (string): forecasted trends, None forecasts on load
+            dtype (string): dtype of the loaded trends, None for float64
+            regions (boolean): whether or not to load regions within countries
+        """
+        self.historical_path = historical_path
+        self.forecast_path = forecast_path
+        self.dtype = dtype
+        self.regions = regions
+
+    def stamp(self):
+        """
+        Output:
+            stamp (tuple): modification times of both files, changes when either file does
+        """
+        return tuple(os.path.getmtime(path) if path and os.path.exists(path) else None
+                     for path in [self.historical_path, self.forecast_path,
+                                  self.historical_path + '.snapshot'])
+
+    def load(self):
+        """
+        Output:
+            trends (dataframe): cleaned historical trends
+            country_names (list): a list of all country names in the Trends report
+            forecast (dataframe): forecasted trends
+            regions (GeoIndex): regions within countries, None if not loaded
+        """
+        regions = None
+        if self.regions:
+            # countries and regions are parsed in a single pass over the report
+            with stage_metrics.timer('parse'):
+                trend_data, region_data = read_report(self.historical_path, self.dtype)
+            with stage_metrics.timer('clean'):
+                trends, country_names = clean_data(trend_data)
+            regions = build_regions(region_data, self.dtype)
+            del trend_data, region_data
+        else:
+            trends, country_names = load_trends(self.historical_path, dtype = self.dtype)
+        if self.forecast_path is None:
+            with stage_metrics.timer('forecast'):
+                return trends, country_names, forecast_trends(trends), regions
+        with stage_metrics.timer('read_forecast'):
+            return trends, country_names, read_forecast(self.forecast_path), regions
+
+class S3Source:
+    """historical and forecasted trends stored as S3 objects
+    only the country partition of the report written by the ingest Lambda is read,
+    followed by the append segments listed in the ingest manifest. the partition is
+    only downloaded again when the Lambda compacts it, otherwise a reload downloads
+    just the segments that weren't applied yet. without a forecast key, trends are
+    forecasted with the built-in forecaster on load. region partitions have no append
+    segments, they are read again whenever the Lambda compacts them
+    """
+    def __init__(self, bucket, historical_key = 'applemobilitytrends-countries.csv',
+                 forecast_key = 'forecasted_trends.csv',
+                 manifest_key = 'ingest-manifest.json', dtype = None, region_keys = None):
+        """
+        Input:
+            bucket (string): S3 bucket
+            historical_key (string): key of the country partition of the report
+            forecast_key (string): key of the forecasted trends, None forecasts on load
+            manifest_key (string): key of the ingest manifest listing the append segments
+            dtype (string): dtype of the loaded trends, None for float64
+            region_keys (list): keys of the partitions holding regions within countries,
+                                e.g. REGION_KEYS, None doesn't load regions
+        """
+        import boto3
+
+        self.bucket = bucket
+        self.historical_key = historical_key
+        self.forecast_key = forecast_key
+        self.manifest_key = manifest_key
+        self.dtype = dtype
+        self.region_keys = list(region_keys or [])
+        self.s3 = boto3.client('s3')
+        # cleaned partition and the segments applied to it
+        self._base_etag = None
+        self._trends = None
+        self._country_names = None
+        self._segments = []
+        # regions and the ETags of the partitions they were read from
+        self._region_etags = None
+        self._regions = None
+
+    def _etag(self, key):
+        try:
+            return self.s3.head_object(Bucket = self.bucket, Key = key)['ETag']
+        except self.s3.exceptions.ClientError:
+            return None
+
+    def _read(self, key):
+        # download the whole object first so fetching and parsing are timed apart
+        with stage_metrics.timer('fetch'):
+            data_obj = self.s3.get_object(Bucket = self.bucket, Key = key)
+            body = io.BytesIO(data_obj['Body'].read())
+
+        return body, data_obj['ETag']
+
+    def _read_cleaned(self, key):
+        body, etag = self._read(key)
+        with stage_metrics.timer('parse'):
+            trend_data = read_country_rows(body, self.dtype)
+        with stage_metrics.timer('clean'):
+            trends, country_names = clean_data(trend_data)
+
+        return trends, country_names, etag
+
+    def stamp(self):
+        """
+        Output:
+            stamp (tuple): ETags of the manifest, partitions and forecast,
+                           changes when any of them does
+        """
+        return tuple(self._etag(key) if key else None
+                     for key in [self.manifest_key, self.historical_key, self.forecast_key] + self.region_keys)
+
+    def load(self):
+        """
+        Output:
+            trends (dataframe): cleaned historical trends, kept for applying the next
+                                segments, so it's shared and must not be modified
+            country_names (list): a list of all country names in the Trends report
+            forecast (dataframe): forecasted trends
+            regions (GeoIndex): regions within countries, kept until their partitions change,
+                                None if not loaded
+        """
+        manifest_etag = self._etag(self.manifest_key)
+        manifest = json.load(self._read(self.manifest_key)[0]) if manifest_etag else {}
+        # download the partition only if it was compacted since the last load
+        if self._trends is None or self._etag(self.historical_key) != self._base_etag:
+            self._trends, self._country_names, self._base_etag = self._read_cleaned(self.historical_key)
+            self._segments = []
+        # apply the segments that weren't applied yet
+        for key in manifest.get('segments', []):
+            if key in self._segments:
+                continue
+            segment, segment_country_names, _ = self._read_cleaned(key)
+            self._trends, self._country_names = append_segment(self._trends, self._country_names,
+                                                               segment, segment_country_names)
+            self._segments.append(key)
+            pass
+
+        if self.forecast_key is None:
+            with stage_metrics.timer('forecast'):
+                forecast = forecast_trends(self._trends)
+        else:
+            body, _ = self._read(self.forecast_key)
+            with stage_metrics.timer('read_forecast'):
+                forecast = read_forecast(body)
+
+        # read the region partitions only if any of them was compacted since the last load
+        region_etags = [self._etag(key) for key in self.region_keys]
+        if region_etags != self._region_etags:
+            region_data = []
+            # a report without regions of a geo_type has no partition for it
+            for key in [key for key, etag in zip(self.region_keys, region_etags) if etag is not None]:
+                body, _ = self._read(key)
+                with stage_metrics.timer('parse'):
+                    region_data.append(read_report(body, self.dtype)[1])
+                pass
+            self._regions = build_regions(pd.concat(region_data), self.dtype) if region_data else None
+            self._region_etags = region_etags
+            del region_data
+
+        return self._trends, list(self._country_names), forecast, self._regions
+
+#---------------------------------------------------------------------------------------------
+
+class DataRefresher(threading.Thread):
+    """background thread that polls a data source and reloads it when it changes
+    reloads run on this thread, so requests keep being served from the current data
+    """
+    def __init__(self, source, reload, interval = 600, stamp = None):
+        """
+        Input:
+            source (LocalSource or S3Source): data source to poll
+            reload (function): function without arguments that loads and publishes new data
+            interval (float): seconds between polls
+            stamp (tuple): stamp of the data that is currently loaded
+        """
+        super().__init__(name = 'data-refresher', daemon = True)
+        self.source = source
+        self.reload = reload
+        self.interval = interval
+        self.stamp = stamp
+        self.reloads = 0
+        self._stopped = threading.Event()
+
+    def poll(self):
+        """reload the data if the source changed since the last poll
+        Output:
+            changed (boolean): whether or not the data was reloaded
+        """
+        # read the stamp before loading, so changes made while loading trigger another reload
+        stamp = self.source.stamp()
+        if stamp == self.stamp:
+            return False
+        self.reload()
+        self.stamp = stamp
+        self.reloads += 1
+
+        return True
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                start = time.perf_counter()
+                if self.poll():
+                    print('Reloaded data in {:.1f}s.'.format(time.perf_counter() - start))
+            # keep serving the current data if the source is unavailable or malformed
+            except Exception:
+                traceback.print_exc()
+            pass
+
+    def stop(self):
+        self._stopped.set()
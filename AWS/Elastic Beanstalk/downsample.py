@@ -0,0 +1,78 @@
+import numpy as np
+
+#---------------------------------------------------------------------------------------------
+
+def lttb_indices(y, n_out):
+    """pick the points of a series that best keep its shape, Largest-Triangle-Three-Buckets
+    this vectorized variant anchors each bucket's triangles on the previous bucket's
+    average instead of its selected point, so every bucket is picked at once
+    Input:
+        y (numpy array): evenly spaced series, may contain NaN
+        n_out (int): number of points to keep, including the first and last point
+    Output:
+        indices (numpy array): sorted indices of the kept points
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype = float)
+    y = np.asarray(y, dtype = float)
+
+    # split the points between the first and last one into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    starts, sizes = edges[:-1], np.diff(edges)
+    bucket = np.repeat(np.arange(n_out - 2), sizes)
+    # average point of every bucket, ignoring missing values
+    valid = ~np.isnan(y)
+    counts = np.add.reduceat(valid[1:n - 1], starts - 1)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        avg_y = np.add.reduceat(np.where(valid, y, 0)[1:n - 1], starts - 1) / counts
+    avg_x = np.add.reduceat(x[1:n - 1], starts - 1) / sizes
+
+    # triangles span the previous bucket's average, a point and the next bucket's average
+    prev_x = np.concatenate([[x[0]], avg_x[:-1]])[bucket]
+    prev_y = np.concatenate([[y[0]], avg_y[:-1]])[bucket]
+    next_x = np.concatenate([avg_x[1:], [x[-1]]])[bucket]
+    next_y = np.concatenate([avg_y[1:], [y[-1]]])[bucket]
+    px, py = x[1:n - 1], y[1:n - 1]
+    area = np.abs((prev_x - next_x) * (py - prev_y) - (prev_x - px) * (next_y - prev_y))
+    area = np.where(np.isnan(area), -1, area)
+
+    # sort by bucket, then by descending area, and keep the first point of every bucket
+    order = np.lexsort((-area, bucket))
+    selected = order[starts - 1] + 1
+
+    return np.concatenate([[0], np.sort(selected), [n - 1]])
+
+def downsample_trace(x, y, max_points):
+    """downsample a trace with LTTB if it has more than max_points points
+    Input:
+        x (numpy array): x values of the trace
+        y (numpy array): y values of the trace
+        max_points (int): point budget of the trace, None or 0 keeps every point
+    Output:
+        x (numpy array): x values of the kept points
+        y (numpy array): y values of the kept points
+    """
+    if not max_points or len(y) <= max_points:
+        return x, y
+    indices = lttb_indices(y, max_points)
+
+    return x[indices], y[indices]
+
+def zoom_range(relayout_data):
+    """get the dates a user zoomed the x axis to
+    Input:
+        relayout_data (dict): relayoutData of a graph
+    Output:
+        start_date (string): first zoomed date in %Y-%m-%d, None if the axis isn't zoomed
+        end_date (string): last zoomed date in %Y-%m-%d, None if the axis isn't zoomed
+    """
+    if not relayout_data:
+        return None, None
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return str(relayout_data['xaxis.range[0]'])[:10], str(relayout_data['xaxis.range[1]'])[:10]
+    if 'xaxis.range' in relayout_data:
+        return str(relayout_data['xaxis.range'][0])[:10], str(relayout_data['xaxis.range'][1])[:10]
+
+    return None, None
@@ -0,0 +1,171 @@
+import argparse
+import itertools
+import os
+import time
+
+import pandas as pd
+import numpy as np
+
+from mobility_data import load_trends
+
+#---------------------------------------------------------------------------------------------
+
+# weekly seasonality of daily mobility
+SEASON_LENGTH = 7
+# days forecasted after the last historical day
+HORIZON = 30
+# smoothing parameters tried for every series: level, trend, season and trend damping
+ALPHAS = [0.1, 0.3, 0.5, 0.7, 0.9]
+BETAS = [0.0, 0.02, 0.1]
+GAMMAS = [0.05, 0.15, 0.3, 0.5]
+PHIS = [0.8, 0.9, 0.98]
+
+#---------------------------------------------------------------------------------------------
+
+def fill_gaps(values):
+    """fill missing values of every series with the previous value, or the next one
+    for leading gaps
+    Input:
+        values (numpy array): series shaped (series, day), may contain NaN
+    Output:
+        values (numpy array): filled series, all-NaN series stay NaN
+    """
+    n_days = values.shape[1]
+    valid = ~np.isnan(values)
+    # index of the last valid day up to each day, carried forward
+    previous = np.where(valid, np.arange(n_days), 0)
+    np.maximum.accumulate(previous, axis = 1, out = previous)
+    filled = np.take_along_axis(values, previous, axis = 1)
+    # leading gaps take the first valid value
+    first = np.argmax(valid, axis = 1)
+    first_value = values[np.arange(len(values)), first]
+    filled = np.where(np.isnan(filled), first_value[:, None], filled)
+
+    return filled
+
+def parameter_grid():
+    """
+    Output:
+        params (numpy array): every combination of smoothing parameters shaped (combination, 4)
+                              columns are alpha, beta, gamma and phi
+    """
+    return np.array(list(itertools.product(ALPHAS, BETAS, GAMMAS, PHIS)))
+
+def holt_winters(values, params, season_length = SEASON_LENGTH):
+    """run damped additive Holt-Winters smoothing over many series and parameters at once
+    every day is one array operation over all (parameter, series) pairs
+    Input:
+        values (numpy array): gap-free series shaped (series, day), at least two seasons long
+        params (numpy array): smoothing parameters shaped (series, 4) with one combination
+                              per series, or (combination, 1, 4) to try every combination
+                              on every series
+    Output:
+        sse (numpy array): one-step-ahead squared error shaped (series,) or (combination, series)
+        level (numpy array): final level, shaped like sse
+        trend (numpy array): final trend, shaped like sse
+        season (numpy array): final seasonal components shaped (season_length,) + sse shape
+    """
+    alpha, beta, gamma, phi = [params[..., idx] for idx in range(4)]
+    n_days = values.shape[1]
+    # initialize from the first two seasons
+    first_season = values[:, :season_length]
+    second_season = values[:, season_length:2 * season_length]
+    # np.broadcast_shapes needs numpy 1.20, the Elastic Beanstalk bundle pins 1.19
+    shape = np.broadcast(alpha, np.empty(len(values))).shape
+    level = np.broadcast_to(first_season.mean(axis = 1), shape).copy()
+    trend = np.broadcast_to((second_season.mean(axis = 1) - first_season.mean(axis = 1)) / season_length, shape).copy()
+    season = np.broadcast_to((first_season - first_season.mean(axis = 1, keepdims = True)).T.reshape(
+                             (season_length,) + (1,) * (len(shape) - 1) + (len(values),)),
+                             (season_length,) + shape).copy()
+    sse = np.zeros(shape)
+
+    for day in range(season_length, n_days):
+        observed = values[:, day]
+        slot = day % season_length
+        damped_trend = phi * trend
+        error = observed - (level + damped_trend + season[slot])
+        sse += error ** 2
+        new_level = alpha * (observed - season[slot]) + (1 - alpha) * (level + damped_trend)
+        trend = beta * (new_level - level) + (1 - beta) * damped_trend
+        season[slot] = gamma * (observed - new_level) + (1 - gamma) * season[slot]
+        level = new_level
+        pass
+
+    return sse, level, trend, season
+
+def fit_forecast(values, horizon = HORIZON, season_length = SEASON_LENGTH, params = None):
+    """fit every series and forecast it
+    Input:
+        values (numpy array): series shaped (series, day), may contain NaN
+        horizon (int): number of days to forecast
+        season_length (int): number of days in a season
+        params (numpy array): smoothing parameters shaped (series, 4) to use instead of
+                              searching the parameter grid, e.g. from a previous fit
+    Output:
+        forecast (numpy array): forecasted series shaped (series, horizon)
+        params (numpy array): selected smoothing parameters shaped (series, 4)
+    """
+    filled = fill_gaps(values)
+    missing = np.isnan(filled).all(axis = 1)
+    filled[missing] = 0
+
+    if params is None:
+        # try every parameter combination on every series, keep the best per series
+        grid = parameter_grid()
+        sse, _, _, _ = holt_winters(filled, grid[:, None, :], season_length)
+        params = grid[np.argmin(sse, axis = 0)]
+    # run the selected parameters once more to get the final states
+    _, level, trend, season = holt_winters(filled, params, season_length)
+
+    # project the damped trend and repeat the season
+    phi = params[:, 3, None]
+    steps = np.arange(1, horizon + 1)
+    damping = np.cumsum(phi ** steps, axis = 1)
+    slots = (values.shape[1] + steps - 1) % season_length
+    forecast = level[:, None] + damping * trend[:, None] + season[slots].T
+    forecast[missing] = np.nan
+
+    return forecast, params
+
+def forecast_trends(trends, horizon = HORIZON):
+    """forecast every country and transportation type
+    Input:
+        trends (dataframe): hierarchical columns by 'country' and 'transportation type'
+                            indexed are dates
+        horizon (int): number of days to forecast
+    Output:
+        forecast_countries (dataframe): forecasted trends in the same format as trends,
+                                        indexed by the days after the last historical day
+    """
+    forecast, _ = fit_forecast(trends.to_numpy(dtype = float).T, horizon)
+    last_date = pd.Timestamp(str(trends.index[-1])[:10])
+    dates = pd.date_range(last_date + pd.Timedelta(days = 1), periods = horizon)
+    forecast_countries = pd.DataFrame(np.round(forecast.T, 2), index = dates, columns = trends.columns)
+    forecast_countries.columns.names = ['country', 'transportation_type']
+
+    return forecast_countries
+
+def write_forecast(forecast_countries, path):
+    """write forecasted trends with two-level headers, the format read by the dashboard
+    Input:
+        forecast_countries (dataframe): forecasted trends
+        path (string): csv file path
+    """
+    # write to a temporary file first so readers never see a partial forecast
+    tmp_path = path + '.tmp'
+    forecast_countries.to_csv(tmp_path, date_format = '%Y-%m-%d')
+    os.replace(tmp_path, path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Forecast every country with Holt-Winters smoothing.')
+    parser.add_argument('csv_path', nargs = '?', default = './data/applemobilitytrends.csv')
+    parser.add_argument('forecast_path', nargs = '?', default = './data/forecasted_trends.csv')
+    parser.add_argument('--horizon', type = int, default = HORIZON)
+    args = parser.parse_args()
+
+    trends_countries, _ = load_trends(args.csv_path)
+    start = time.perf_counter()
+    forecast_countries = forecast_trends(trends_countries, args.horizon)
+    write_forecast(forecast_countries, args.forecast_path)
+    print('Forecasted {} series for {} days in {:.2f}s'.format(forecast_countries.shape[1], args.horizon,
+                                                               time.perf_counter() - start))
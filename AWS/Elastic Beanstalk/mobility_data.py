@@ -0,0 +1,247 @@
+import json
+import os
+
+import pandas as pd
+import numpy as np
+
+from metrics import stage_metrics
+
+#---------------------------------------------------------------------------------------------
+
+# every snapshot file starts with this tag followed by the header length
+SNAPSHOT_MAGIC = b'MTSNAP01'
+# the float array is aligned so it can be memory-mapped directly
+SNAPSHOT_ALIGN = 64
+# columns of the report that describe a series, every other column is a date
+REPORT_COLUMNS = ['geo_type', 'region', 'transportation_type', 'alternative_name', 'sub-region', 'country']
+# rows of the report parsed at once
+REPORT_CHUNK_ROWS = 2000
+
+#---------------------------------------------------------------------------------------------
+
+def to_day(date):
+    """convert a date to a numpy day
+    Input:
+        date (string or datetime): date in %Y-%m-%d, time of day is ignored
+    Output:
+        day (numpy datetime64): date with day precision
+    """
+    return np.datetime64(str(date)[:10], 'D')
+
+def read_report_chunks(csv_file, dtype = None, chunk_rows = REPORT_CHUNK_ROWS):
+    """read the report a chunk of rows at a time
+    Input:
+        csv_file (string or file object): Apple Mobility Trends report
+        dtype (string): dtype of the daily values, None for float64
+        chunk_rows (int): number of rows parsed at once
+    Output:
+        chunks (iterator): dataframes of chunk_rows rows with all of the report's columns
+    """
+    columns = pd.read_csv(csv_file, nrows = 0).columns
+    if hasattr(csv_file, 'seek'):
+        csv_file.seek(0)
+    value_dtypes = {column: dtype or 'float64' for column in columns if column not in REPORT_COLUMNS}
+
+    return pd.read_csv(csv_file, dtype = value_dtypes, chunksize = chunk_rows)
+
+def read_country_rows(csv_file, dtype = None, chunk_rows = REPORT_CHUNK_ROWS):
+    """read the country rows of the report, parsing a chunk of rows at a time
+    only one chunk of the full report is held at once, so parsing peaks at about the
+    size of the country rows instead of the whole report
+    Input:
+        csv_file (string or file object): Apple Mobility Trends report
+        dtype (string): dtype of the daily values, None for float64
+        chunk_rows (int): number of rows parsed at once
+    Output:
+        trend_data (dataframe): country rows of the report with all of its columns
+    """
+    chunks = [chunk[chunk['geo_type'] == 'country/region']
+              for chunk in read_report_chunks(csv_file, dtype, chunk_rows)]
+
+    return pd.concat(chunks)
+
+def read_report(csv_file, dtype = None, chunk_rows = REPORT_CHUNK_ROWS):
+    """read the country rows and the rows of regions within countries in a single pass
+    Input:
+        csv_file (string or file object): Apple Mobility Trends report or one of its partitions
+        dtype (string): dtype of the daily values, None for float64
+        chunk_rows (int): number of rows parsed at once
+    Output:
+        trend_data (dataframe): country rows of the report with all of its columns
+        region_data (dataframe): sub-region, city and county rows of the report with all of its columns
+    """
+    country_chunks, region_chunks = [], []
+    for chunk in read_report_chunks(csv_file, dtype, chunk_rows):
+        is_country = chunk['geo_type'] == 'country/region'
+        country_chunks.append(chunk[is_country])
+        region_chunks.append(chunk[~is_country])
+        pass
+
+    return pd.concat(country_chunks), pd.concat(region_chunks)
+
+def clean_data(trends):
+    """Clean data to desired format
+    the country rows are copied from the report once and keep the dtype of its values
+    Input:
+        trends (dataframe): original Apple Mobility Trends report as a dataframe
+    Output:
+        trends (dataframe): hierarchical columns by 'country' and 'transportation type'
+                            indexed are dates
+        country_names (list): a list of all country names in the Trends report
+    """
+    # filter by country level data
+    is_country = trends['geo_type'] == 'country/region'
+    regions = trends.loc[is_country, 'region']
+    # get country names
+    country_names = regions.unique()
+    # remove Untied Arab Emirates
+    country_names = [country for country in country_names if country != 'United Arab Emirates']
+    # hierarchical columns from the country and transportation type of every row
+    columns = pd.MultiIndex.from_arrays([regions, trends.loc[is_country, 'transportation_type']],
+                                        names = ['country', 'transportation_type'])
+    # get difference from baseline
+    dates = trends.columns.drop(REPORT_COLUMNS)
+    values = trends.loc[is_country, dates].to_numpy() - 100
+    # transpose so indices are dates, as a view instead of another copy
+    trends = pd.DataFrame(values.T, index = pd.to_datetime(dates), columns = columns)
+
+    return trends, country_names
+
+#---------------------------------------------------------------------------------------------
+
+def write_snapshot(trends, country_names, path):
+    """write cleaned trends to a binary snapshot file
+    the file holds a magic tag, the header length, a json header and then a dense
+    float64 array shaped (country, transportation type, date); missing series are NaN
+    Input:
+        trends (dataframe): hierarchical columns by 'country' and 'transportation type'
+                            indexed are dates
+        country_names (list): a list of all country names in the Trends report
+        path (string): snapshot file path
+    """
+    # get the axes of the dense cube
+    countries = list(trends.columns.get_level_values(0).unique())
+    transportation_types = sorted(trends.columns.get_level_values(1).unique())
+    dates = [str(date)[:10] for date in trends.index]
+    # scatter every series into its (country, transportation type) slot
+    country_rows = {country: idx for idx, country in enumerate(countries)}
+    transport_slots = {transportation: idx for idx, transportation in enumerate(transportation_types)}
+    cube = np.full((len(countries), len(transportation_types), len(dates)), np.nan, dtype = '<f8')
+    rows = [country_rows[country] for country, _ in trends.columns]
+    slots = [transport_slots[transportation] for _, transportation in trends.columns]
+    cube[rows, slots, :] = trends.to_numpy(dtype = '<f8').T
+
+    header = {'dtype': '<f8',
+              'shape': list(cube.shape),
+              'countries': countries,
+              'transportation_types': transportation_types,
+              'dates': dates,
+              'series': [[country, transportation] for country, transportation in trends.columns],
+              'country_names': list(country_names)}
+    header = json.dumps(header).encode('utf-8')
+    # pad the header so the array starts on an aligned offset
+    prefix_size = len(SNAPSHOT_MAGIC) + 8 + len(header)
+    padding = -prefix_size % SNAPSHOT_ALIGN
+    header = header + b' ' * padding
+
+    # write to a temporary file first so readers never see a partial snapshot
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        f.write(cube.tobytes())
+        pass
+    os.replace(tmp_path, path)
+
+def open_snapshot(path):
+    """memory-map a snapshot file without reading its values
+    Input:
+        path (string): snapshot file path
+    Output:
+        header (dict): snapshot header
+        cube (numpy memmap): read-only array shaped (country, transportation type, date)
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(SNAPSHOT_MAGIC))
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(path + ' is not a trends snapshot.')
+        header_size = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(header_size).decode('utf-8'))
+        pass
+    offset = len(SNAPSHOT_MAGIC) + 8 + header_size
+    cube = np.memmap(path, dtype = header['dtype'], mode = 'r',
+                     offset = offset, shape = tuple(header['shape']))
+
+    return header, cube
+
+def read_snapshot(path):
+    """load cleaned trends from a snapshot file
+    Input:
+        path (string): snapshot file path
+    Output:
+        trends (dataframe): hierarchical columns by 'country' and 'transportation type'
+                            indexed are dates
+        country_names (list): a list of all country names in the Trends report
+    """
+    header, cube = open_snapshot(path)
+    # gather the series that exist in the report, in their original order
+    country_rows = {country: idx for idx, country in enumerate(header['countries'])}
+    transport_slots = {transportation: idx for idx, transportation in enumerate(header['transportation_types'])}
+    rows = [country_rows[country] for country, _ in header['series']]
+    slots = [transport_slots[transportation] for _, transportation in header['series']]
+    values = cube[rows, slots, :].T
+
+    columns = pd.MultiIndex.from_tuples([tuple(series) for series in header['series']],
+                                        names = ['country', 'transportation_type'])
+    trends = pd.DataFrame(values,
+                          index = pd.to_datetime(header['dates']),
+                          columns = columns)
+
+    return trends, header['country_names']
+
+def load_trends(csv_path, snapshot_path = None, dtype = None):
+    """load cleaned trends, preferring a snapshot over parsing the report
+    the snapshot is ignored when it's missing or older than the report
+    Input:
+        csv_path (string): path to the Apple Mobility Trends report
+        snapshot_path (string): path to the snapshot file, defaults to csv_path + '.snapshot'
+        dtype (string): dtype of the trends, None for float64
+    Output:
+        trends (dataframe): hierarchical columns by 'country' and 'transportation type'
+                            indexed are dates
+        country_names (list): a list of all country names in the Trends report
+    """
+    if snapshot_path is None:
+        snapshot_path = csv_path + '.snapshot'
+    # use snapshot if it is at least as recent as the report
+    if os.path.exists(snapshot_path):
+        if not os.path.exists(csv_path) or os.path.getmtime(snapshot_path) >= os.path.getmtime(csv_path):
+            with stage_metrics.timer('read_snapshot'):
+                trends, country_names = read_snapshot(snapshot_path)
+                return trends.astype(dtype or 'float64', copy = False), country_names
+    # fall back to parsing the country rows of the report
+    with stage_metrics.timer('parse'):
+        trend_data = read_country_rows(csv_path, dtype)
+    with stage_metrics.timer('clean'):
+        return clean_data(trend_data)
+
+def append_segment(trends, country_names, segment, segment_country_names):
+    """append the days of a cleaned append segment to cleaned trends
+    days the trends already cover are ignored, series new in the segment get NaN history
+    Input:
+        trends (dataframe): hierarchical columns by 'country' and 'transportation type'
+                            indexed are dates
+        country_names (list): a list of all country names in trends
+        segment (dataframe): cleaned segment in the same format as trends
+        segment_country_names (list): a list of all country names in the segment
+    Output:
+        trends (dataframe): trends followed by the new days of the segment
+        country_names (list): a list of all country names in trends and the segment
+    """
+    segment = segment[segment.index > trends.index[-1]]
+    trends = pd.concat([trends, segment], axis = 0)
+    country_names = list(country_names) + [country for country in segment_country_names
+                                           if country not in country_names]
+
+    return trends, country_names
@@ -0,0 +1,66 @@
+import gzip
+import hashlib
+import json
+
+import flask
+from plotly.utils import PlotlyJSONEncoder
+
+#---------------------------------------------------------------------------------------------
+
+class PrecompressedJSON:
+    """a json response serialized and compressed once, then served to every request
+    the ETag is the digest of the body, so unchanged data is revalidated with a 304
+    brotli is only offered when the Brotli package is installed
+    """
+    def __init__(self, obj):
+        """
+        Input:
+            obj (object): json-serializable object, e.g. a dash layout or plotly figure
+        """
+        self.body = json.dumps(obj, cls = PlotlyJSONEncoder, separators = (',', ':')).encode('utf-8')
+        self.etag = hashlib.blake2b(self.body, digest_size = 16).hexdigest()
+        # encodings in order of preference
+        self.encodings = {}
+        try:
+            import brotli
+
+            self.encodings['br'] = brotli.compress(self.body, quality = 11)
+        except ImportError:
+            pass
+        self.encodings['gzip'] = gzip.compress(self.body, compresslevel = 9)
+
+    def sizes(self):
+        """
+        Output:
+            sizes (dict): body size in bytes, uncompressed and per encoding
+        """
+        sizes = {'identity': len(self.body)}
+        sizes.update({encoding: len(body) for encoding, body in self.encodings.items()})
+
+        return sizes
+
+    def response(self, request):
+        """build the response to a request, honouring Accept-Encoding and If-None-Match
+        Input:
+            request (flask request): request to answer
+        Output:
+            response (flask response): 304 if the client has this body in the chosen
+                                       encoding, the body otherwise
+        """
+        encoding = next((encoding for encoding in self.encodings
+                         if encoding in request.accept_encodings), 'identity')
+        # every encoding is a different representation, so it gets its own strong ETag
+        etag = self.etag if encoding == 'identity' else '{}:{}'.format(self.etag, encoding)
+        headers = {'Vary': 'Accept-Encoding',
+                   'Cache-Control': 'no-cache'}
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        if request.if_none_match.contains(etag):
+            response = flask.Response(status = 304, headers = headers)
+        else:
+            response = flask.Response(self.encodings.get(encoding, self.body),
+                                      mimetype = 'application/json',
+                                      headers = headers)
+        response.set_etag(etag)
+
+        return response
@@ -1,16 +1,12 @@
 import boto3
-import botocore
-from io import StringIO
-
-import pandas as pd
-import numpy as np
 
+import csv
+import io
 import os
-import urllib
+import tempfile
 import urllib3
 from urllib.request import urlopen
 import json
-import requests
 
 import logging
 
@@ -20,55 +16,271 @@ LOG.setLevel(logging.DEBUG)
 #S3 BUCKET
 REGION = "us-east-1"
 BUCKET = "applemobilitytrends"
+# point these at local stand-ins for testing
+APPLE_HOST = os.environ.get("APPLE_HOST", "https://covid19-static.cdn-apple.com")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+# records what the last run uploaded
+MANIFEST_KEY = "ingest-manifest.json"
+# new days are uploaded as append segments of the country partition, the full
+# report and its partitions are uploaded again after this many segments
+COMPACT_EVERY = int(os.environ.get("COMPACT_EVERY", 7))
+SEGMENT_PREFIX = "segments/"
+# report columns before the first date
+ID_COLUMNS = 6
+
+# report rows are split into one partition per geo_type
+PARTITIONS = {'country/region': 'countries',
+              'city': 'cities',
+              'sub-region': 'sub-regions',
+              'county': 'counties'}
 
-def get_apple_link():
+def get_apple_link(stats=None):
     """Get link of Apple Mobility Trends report file
+    Input:
+        stats (dict): run counters, bytes of index.json are added to 'index_bytes'
     Output:
         data_link (str): link of Apple Mobility Trends report file
         data_name (str): name of Apple Mobility Trends report file
     """
     # get link via API
-    link = "https://covid19-static.cdn-apple.com/covid19-mobility-data/current/v3/index.json"
+    link = APPLE_HOST + "/covid19-mobility-data/current/v3/index.json"
     with urlopen(link) as url:
-        json_data = json.loads(url.read().decode())
+        body = url.read()
+        json_data = json.loads(body.decode())
         pass
+    if stats is not None:
+        stats["index_bytes"] += len(body)
     # get link components from json dictionary
     basePath = json_data["basePath"]
     csvPath = json_data["regions"]["en-us"]["csvPath"]
     # aggregate to produce file link
-    file_link = ("https://covid19-static.cdn-apple.com" + basePath + csvPath)
+    file_link = (APPLE_HOST + basePath + csvPath)
     # get file name
     # file_name = file_link.rsplit('/', 1)[-1]
     file_name = 'applemobilitytrends.csv'
 
     return file_link, file_name
 
-def write_s3(file_link, bucket, file_name):
+def partition_key(file_name, partition):
+    """Get the S3 key of a report partition
+    Input:
+        file_name (string): file name of the full report, e.g. applemobilitytrends.csv
+        partition (string): partition name, e.g. countries
+    Output:
+        key (string): partition file name, e.g. applemobilitytrends-countries.csv
+    """
+    base, extension = os.path.splitext(file_name)
+
+    return base + '-' + partition + extension
+
+def partition_report(lines, out_dir, file_name):
+    """Split report lines by geo_type into partition files while they are read
+    Only one line is held in memory at a time
+    Input:
+        lines (iterable): lines of the report csv, starting with the header
+        out_dir (string): directory to write the full report and its partitions to
+        file_name (string): file name of the full report
+    Output:
+        paths (dict): file name of the full report and every partition -> local path
+        stats (dict): file name -> number of bytes written
+    """
+    lines = iter(lines)
+    header = next(lines)
+    files = {}
+    stats = {}
+
+    def write(name, line):
+        if name not in files:
+            files[name] = open(os.path.join(out_dir, name), 'w', encoding = 'utf-8', newline = '')
+            files[name].write(header)
+            stats[name] = len(header.encode('utf-8'))
+        files[name].write(line)
+        stats[name] += len(line.encode('utf-8'))
+
+    try:
+        for line in lines:
+            write(file_name, line)
+            # geo_type is the first column and never contains commas
+            geo_type = line.split(',', 1)[0].strip('"')
+            write(partition_key(file_name, PARTITIONS.get(geo_type, 'other')), line)
+            pass
+    finally:
+        for f in files.values():
+            f.close()
+            pass
+
+    return {name: f.name for name, f in files.items()}, stats
+
+def report_dates(path):
+    """Get the dates in a report
+    Input:
+        path (string): local path of a report or one of its partitions
+    Output:
+        dates (list): date columns of the report in %Y-%m-%d
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        header = next(csv.reader(f))
+
+    return header[ID_COLUMNS:]
+
+def write_segment(partition_path, segment_path, last_date):
+    """Write the days after last_date of a partition to an append segment
+    The segment has the same columns as the report, but only the new dates
+    Input:
+        partition_path (string): local path of a report partition
+        segment_path (string): local path to write the segment to
+        last_date (string): last date that was already uploaded, in %Y-%m-%d
+    Output:
+        new_dates (list): dates in the segment, empty if there are no new days
+    """
+    with open(partition_path, encoding='utf-8', newline='') as src, \
+         open(segment_path, 'w', encoding='utf-8', newline='') as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst, lineterminator='\n')
+        header = next(reader)
+        first_new = header.index(last_date, ID_COLUMNS) + 1
+        writer.writerow(header[:ID_COLUMNS] + header[first_new:])
+        for row in reader:
+            writer.writerow(row[:ID_COLUMNS] + row[first_new:])
+            pass
+
+    return header[first_new:]
+
+def read_manifest(s3, bucket):
+    """Read the manifest of the last upload
+    Input:
+        s3 (boto3 client): S3 client
+        bucket (string): S3 bucket name
+    Output:
+        manifest (dict): file_link and etag of the last uploaded report, its last date and
+                         the append segments uploaded since the last full upload,
+                         empty before the first upload
+    """
+    try:
+        data_obj = s3.get_object(Bucket=bucket, Key=MANIFEST_KEY)
+    except s3.exceptions.NoSuchKey:
+        return {}
+
+    return json.loads(data_obj["Body"].read().decode())
+
+def write_manifest(s3, bucket, manifest):
+    """Write the manifest of the last upload
+    Input:
+        s3 (boto3 client): S3 client
+        bucket (string): S3 bucket name
+        manifest (dict): file_link and etag of the uploaded report, its last date and
+                         the append segments uploaded since the last full upload
+    """
+    s3.put_object(Bucket=bucket, Key=MANIFEST_KEY,
+                  Body=json.dumps(manifest).encode(),
+                  ContentType="application/json")
+
+def write_s3(s3, file_link, bucket, file_name, manifest, stats=None):
     """Write S3 Bucket
+    The report is streamed from file_link once and split into partitions by geo_type.
+    If the last upload is in the report, only the new days of the country partition
+    are uploaded as an append segment, otherwise and after COMPACT_EVERY segments the
+    full report and every partition are uploaded
     Input:
+        s3 (boto3 client): S3 client
         file_link (string): url link to csv data
         bucket (string): S3 bucket name
         file_name (string): file name to be saved as in S3
+        manifest (dict): manifest of the last upload, nothing is downloaded if its etag still matches
+        stats (dict): run counters, adds to 'report_bytes' and 'uploaded_bytes'
+    Output:
+        manifest (dict): manifest of this upload, None if the report didn't change
     """
 
-    # instantiate s3 resource
-    s3=boto3.resource('s3')
     # instantiate poolmanager
     http=urllib3.PoolManager()
-    # Provide URL
-    urllib.request.urlopen(file_link)
-    # save file to s3 bucket
-    s3.meta.client.upload_fileobj(http.request('GET', file_link, preload_content=False), bucket, file_name)
+    # stream the report without loading it into memory, unless it is unchanged
+    headers = {"If-None-Match": manifest["etag"]} if manifest.get("etag") else {}
+    response = http.request('GET', file_link, headers=headers, preload_content=False)
+    if response.status == 304:
+        response.release_conn()
+        LOG.info(f"report unchanged since last upload: {file_link}")
+
+        return None
+    if response.status != 200:
+        response.release_conn()
+        raise RuntimeError(f"failed to download {file_link}: HTTP {response.status}")
+    with tempfile.TemporaryDirectory() as out_dir:
+        try:
+            # keep the response open until the text wrapper has read the last line
+            response.auto_close = False
+            lines = io.TextIOWrapper(response, encoding='utf-8', newline='')
+            paths, object_bytes = partition_report(lines, out_dir, file_name)
+        finally:
+            response.release_conn()
+        report_bytes = object_bytes[file_name]
+        dates = report_dates(paths[file_name])
+        countries_name = partition_key(file_name, 'countries')
+        segments = manifest.get("segments", [])
+
+        # append only the new days while the last upload is part of this report
+        if (manifest.get("last_date") in dates and countries_name in paths
+                and len(segments) < COMPACT_EVERY):
+            segment_path = os.path.join(out_dir, 'segment.csv')
+            new_dates = write_segment(paths[countries_name], segment_path, manifest["last_date"])
+            paths = {}
+            if new_dates:
+                base, extension = os.path.splitext(countries_name)
+                key = f"{SEGMENT_PREFIX}{base}-{new_dates[0]}-{new_dates[-1]}{extension}"
+                paths[key] = segment_path
+                segments = segments + [key]
+        # otherwise compact, the full upload replaces every segment
+        else:
+            segments = []
+        # save files to s3 bucket
+        object_bytes = {key: os.path.getsize(path) for key, path in paths.items()}
+        for key, path in paths.items():
+            s3.upload_file(path, bucket, key)
+            pass
+
+    LOG.info(f"result of write to bucket: {bucket}, bytes per object: {object_bytes}")
+    if stats is not None:
+        stats["report_bytes"] += report_bytes
+        stats["uploaded_bytes"] += sum(object_bytes.values())
 
-    LOG.info(f"result of write to bucket: {bucket}")
+    return dict(manifest,
+                etag=response.headers.get("ETag", ""),
+                last_date=dates[-1] if dates else None,
+                segments=segments)
 
 
 def lambda_handler(event, context):
-    """Entry Point for Lambda"""
+    """Entry Point for Lambda
+    Output:
+        stats (dict): bytes transferred in this run and whether the upload was skipped
+    """
+    stats = {"index_bytes": 0, "report_bytes": 0, "uploaded_bytes": 0, "skipped": True}
+    s3 = boto3.client('s3', endpoint_url=S3_ENDPOINT_URL)
 
-    data_link, data_name = get_apple_link()
+    data_link, data_name = get_apple_link(stats)
 
     LOG.info(f"SURVEYJOB LAMBDA, event {event}, context {context}")
 
+    # skip the transfer if Apple hasn't published a new report since the last upload
+    manifest = read_manifest(s3, BUCKET)
+    if manifest.get("file_link") == data_link:
+        LOG.info(f"report already uploaded: {data_link}")
+
+        return stats
+
     # Write result to S3
-    write_s3(file_link=data_link, bucket=BUCKET, file_name=data_name)
+    new_manifest = write_s3(s3, file_link=data_link, bucket=BUCKET, file_name=data_name,
+                            manifest=manifest, stats=stats)
+    if new_manifest is None:
+        new_manifest = dict(manifest)
+    else:
+        stats["skipped"] = False
+    new_manifest["file_link"] = data_link
+    write_manifest(s3, BUCKET, new_manifest)
+    # remove segments folded into a full upload once the new manifest is in place
+    compacted = [key for key in manifest.get("segments", []) if key not in new_manifest.get("segments", [])]
+    if compacted:
+        s3.delete_objects(Bucket=BUCKET, Delete={"Objects": [{"Key": key} for key in compacted]})
+    LOG.info(f"run stats: {stats}")
+
+    return stats
@@ -1,4 +1,6 @@
+import io
 import os
+import tempfile
 from google.cloud import storage
 
 import pandas as pd
@@ -12,7 +14,11 @@ import requests
 bucket_name = os.environ['BUCKET']
 trend_file_name = os.environ['TREND_FILE_NAME']
 
-trend_cf_path = '/tmp/{}'.format(trend_file_name)
+# report rows are split into one partition per geo_type
+PARTITIONS = {'country/region': 'countries',
+              'city': 'cities',
+              'sub-region': 'sub-regions',
+              'county': 'counties'}
 
 def get_apple_link():
     """Get link of Apple Mobility Trends report file
@@ -35,6 +41,56 @@ def get_apple_link():
 
     return file_link, file_name
 
+def partition_name(file_name, partition):
+    """Get the blob name of a report partition
+    Input:
+        file_name (string): blob name of the full report, e.g. applemobilitytrends.csv
+        partition (string): partition name, e.g. countries
+    Output:
+        name (string): partition blob name, e.g. applemobilitytrends-countries.csv
+    """
+    base, extension = os.path.splitext(file_name)
+
+    return base + '-' + partition + extension
+
+def partition_report(lines, out_dir, file_name):
+    """Split report lines by geo_type into partition files while they are read
+    Only one line is held in memory at a time
+    Input:
+        lines (iterable): lines of the report csv, starting with the header
+        out_dir (string): directory to write the full report and its partitions to
+        file_name (string): blob name of the full report
+    Output:
+        paths (dict): blob name of the full report and every partition -> local path
+        stats (dict): blob name -> number of bytes written
+    """
+    lines = iter(lines)
+    header = next(lines)
+    files = {}
+    stats = {}
+
+    def write(name, line):
+        if name not in files:
+            files[name] = open(os.path.join(out_dir, name), 'w', encoding = 'utf-8', newline = '')
+            files[name].write(header)
+            stats[name] = len(header.encode('utf-8'))
+        files[name].write(line)
+        stats[name] += len(line.encode('utf-8'))
+
+    try:
+        for line in lines:
+            write(file_name, line)
+            # geo_type is the first column and never contains commas
+            geo_type = line.split(',', 1)[0].strip('"')
+            write(partition_name(file_name, PARTITIONS.get(geo_type, 'other')), line)
+            pass
+    finally:
+        for f in files.values():
+            f.close()
+            pass
+
+    return {name: f.name for name, f in files.items()}, stats
+
 
 def save_file(event, context):
     """entry point to cloud function
@@ -42,11 +98,15 @@ def save_file(event, context):
     # instantiate storage objects
     client = storage.Client()
     bucket = client.get_bucket(bucket_name)
-    # save trends data to a temporary local path
+    # stream the trends data and split it into partitions in a temporary local directory
     data_link, _ = get_apple_link()
-    urllib.request.urlretrieve(data_link, trend_cf_path)
-    # save file to cloud storage
-    trend_blob = storage.Blob(trend_file_name, bucket)
-    trend_blob.upload_from_filename(trend_cf_path)
+    with urlopen(data_link) as response, tempfile.TemporaryDirectory() as out_dir:
+        lines = io.TextIOWrapper(response, encoding = 'utf-8', newline = '')
+        paths, stats = partition_report(lines, out_dir, trend_file_name)
+        # save the full report and every partition to cloud storage
+        for name, path in paths.items():
+            storage.Blob(name, bucket).upload_from_filename(path)
+            pass
 
+    print('uploaded {} bytes per blob'.format(stats))
     print('this was triggered by messageId {} published at {}'.format(context.event_id, context.timestamp))
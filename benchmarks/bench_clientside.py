@@ -0,0 +1,48 @@
+"""Compare the one-time clientside payload against per-hover server responses
+
+Run from the repository root so the app finds ./data:
+    python benchmarks/bench_clientside.py
+"""
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ['FIGURE_CACHE_WARM'] = '0'
+os.environ['WARM_UP'] = 'sync'
+
+import application
+
+#---------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    application.create_app()
+    store = application.dashboard_data.trend_store
+    payload = store.to_payload()
+    payload['layout'] = application.build_trend_layout()
+    payload_json = json.dumps(payload).encode('utf-8')
+
+    # a hover response is one figure with the default date range
+    hover_bytes = []
+    hover_gzip_bytes = []
+    hover_times = []
+    for country in store.country_names:
+        start = time.perf_counter()
+        fig = application.add_trend(country, store, False, None, None)
+        fig_json = to_json_plotly(fig).encode('utf-8')
+        hover_times.append(time.perf_counter() - start)
+        hover_bytes.append(len(fig_json))
+        hover_gzip_bytes.append(len(gzip.compress(fig_json)))
+        pass
+
+    payload_gzip = len(gzip.compress(payload_json))
+    print('one-time payload:  {:>10,} bytes ({:,} gzipped)'.format(len(payload_json), payload_gzip))
+    print('per hover:         {:>10,.0f} bytes ({:,.0f} gzipped), {:.1f} ms server time'.format(
+          np.mean(hover_bytes), np.mean(hover_gzip_bytes), np.mean(hover_times) * 1e3))
+    print('break-even after {:.1f} hovers ({:.1f} gzipped)'.format(len(payload_json) / np.mean(hover_bytes),
+                                                                   payload_gzip / np.mean(hover_gzip_bytes)))
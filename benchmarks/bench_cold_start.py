@@ -0,0 +1,136 @@
+"""Time a cold start of the app: importing it, creating it, its first response and readiness
+
+Starts the app in a new process like a WSGI server does, importing the module and getting
+its `application`, serves it on a free port and polls it from this process:
+    import       importing application.py
+    app          `application` available to the WSGI server
+    first        first response to /
+    usable       /_dash-layout returns the dashboard with its data
+    ready        /ready returns 200, trees without a readiness endpoint count as ready once usable
+
+Runs against a synthetic report, --repo times another checkout, e.g. a git worktree of an
+earlier commit:
+    python benchmarks/bench_cold_start.py [--regions 300] [--days 400] [--runs 3] [--repo PATH]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, REPO)
+
+# a server imports the app, gets its WSGI application and serves it, printing when each is done
+SERVER = '''
+import sys
+import time
+from werkzeug.serving import run_simple
+sys.path.insert(0, {repo!r})
+import application
+print('import', time.time(), flush = True)
+wsgi = application.application
+print('app', time.time(), flush = True)
+run_simple('127.0.0.1', {port}, wsgi, threaded = True)
+'''
+
+#---------------------------------------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def get(url):
+    """
+    Input:
+        url (string): url to request
+    Output:
+        status (int): response status, None if the server isn't listening yet
+        body (bytes): response body
+    """
+    try:
+        with urllib.request.urlopen(url, timeout = 30) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+    except (urllib.error.URLError, ConnectionError):
+        return None, b''
+
+def cold_start(repo, data_dir, timeout = 300):
+    """start the app in a new process and time its startup
+    Input:
+        repo (string): checkout of the app to start
+        data_dir (string): directory holding data/applemobilitytrends.csv and data/forecasted_trends.csv
+        timeout (float): seconds to wait for the app to get ready
+    Output:
+        timings (dict): stage -> seconds since the process was started
+    """
+    port = free_port()
+    url = 'http://127.0.0.1:{}'.format(port)
+    env = dict(os.environ, DATA_REFRESH_SECONDS = '0')
+    start = time.time()
+    server = subprocess.Popen([sys.executable, '-W', 'ignore', '-c', SERVER.format(repo = repo, port = port)],
+                              cwd = data_dir, env = env, stdout = subprocess.PIPE,
+                              stderr = subprocess.DEVNULL, universal_newlines = True)
+    timings = {}
+    try:
+        for _ in range(2):
+            stage, stamp = server.stdout.readline().split()
+            timings[stage] = float(stamp) - start
+            pass
+        while 'ready' not in timings:
+            if time.time() - start > timeout:
+                raise RuntimeError('the app did not get ready in {}s'.format(timeout))
+            if 'first' not in timings and get(url + '/')[0] == 200:
+                timings['first'] = time.time() - start
+            if 'first' in timings and 'usable' not in timings:
+                status, body = get(url + '/_dash-layout')
+                if status == 200 and b'world_map' in body:
+                    timings['usable'] = time.time() - start
+            if 'usable' in timings:
+                status, body = get(url + '/ready')
+                if status in (200, 404):
+                    timings['ready'] = time.time() - start
+            # poll like a health check would, often enough for the timings to be within 0.1s
+            time.sleep(0.1)
+            pass
+    finally:
+        server.kill()
+        server.wait()
+
+    return timings
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--regions', type = int, default = 300)
+    parser.add_argument('--days', type = int, default = 400)
+    parser.add_argument('--runs', type = int, default = 3)
+    parser.add_argument('--repo', default = REPO, help = 'checkout of the app to start')
+    args = parser.parse_args()
+
+    from synthetic_report import generate_report
+    from mobility_data import load_trends
+    from forecast import forecast_trends, write_forecast
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.makedirs(os.path.join(data_dir, 'data'))
+        csv_path = os.path.join(data_dir, 'data', 'applemobilitytrends.csv')
+        generate_report(csv_path, args.regions, args.days)
+        write_forecast(forecast_trends(load_trends(csv_path)[0]),
+                       os.path.join(data_dir, 'data', 'forecasted_trends.csv'))
+
+        runs = [cold_start(os.path.abspath(args.repo), data_dir) for _ in range(args.runs)]
+        pass
+
+    print('{} regions x {} days, median of {} runs, seconds since the process started'.format(
+          args.regions, args.days, args.runs))
+    for stage in ['import', 'app', 'first', 'usable', 'ready']:
+        print('{:>8}: {:7.2f}s'.format(stage, np.median([timings[stage] for timings in runs])))
+        pass
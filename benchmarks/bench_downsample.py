@@ -0,0 +1,69 @@
+"""Compare trend figures with and without LTTB downsampling over a long synthetic timeline
+
+Usage:
+    python benchmarks/bench_downsample.py [--years 5] [--max-points 800]
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ['FIGURE_CACHE_WARM'] = '0'
+os.environ['DATA_REFRESH_SECONDS'] = '0'
+
+import application
+from trend_store import TrendStore
+
+#---------------------------------------------------------------------------------------------
+
+def synthetic_store(n_countries, n_days, horizon = 30):
+    """build a store of noisy weekly-seasonal trends for n_countries over n_days"""
+    rng = np.random.default_rng(0)
+    transports = ['driving', 'transit', 'walking']
+    dates = pd.date_range('2020-01-13', periods = n_days + horizon)
+    countries = ['Country {}'.format(idx) for idx in range(n_countries)]
+    columns = pd.MultiIndex.from_product([countries, transports], names = ['country', 'transportation_type'])
+    days = np.arange(n_days + horizon)
+    values = (20 * np.sin(2 * np.pi * days / 7)[:, None]
+              + np.cumsum(rng.normal(0, 2, (len(days), len(columns))), axis = 0)).round(2)
+    trends = pd.DataFrame(values[:n_days], index = [str(date)[:10] for date in dates[:n_days]],
+                          columns = columns)
+    forecast = pd.DataFrame(values[n_days:], index = [str(date)[:10] for date in dates[n_days:]],
+                            columns = columns)
+
+    return TrendStore(trends, forecast, countries, default_country = countries[0])
+
+def measure(store, max_points):
+    """build the full-range figure of every country and return median seconds and mean payload bytes"""
+    # the first figure builds the cached trend layout, keep it out of the timings
+    to_json_plotly(application.add_trend(store.country_names[0], store, True, None, None, max_points))
+    times = []
+    sizes = []
+    for country in store.country_names:
+        start = time.perf_counter()
+        fig = application.add_trend(country, store, True, None, None, max_points)
+        fig_json = to_json_plotly(fig)
+        times.append(time.perf_counter() - start)
+        sizes.append(len(fig_json.encode('utf-8')))
+        pass
+
+    return np.median(times), np.mean(sizes)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--years', type = int, default = 5)
+    parser.add_argument('--countries', type = int, default = 20)
+    parser.add_argument('--max-points', type = int, default = 800)
+    args = parser.parse_args()
+
+    store = synthetic_store(args.countries, args.years * 365)
+    print('{} countries, {} days per trace'.format(args.countries, len(store.days)))
+    for label, max_points in [('full', None), ('lttb {}'.format(args.max_points), args.max_points)]:
+        seconds, size = measure(store, max_points)
+        print('{:>10}: {:7.1f} ms per figure, {:8.1f} KB per response'.format(label, seconds * 1e3, size / 1024))
+        pass
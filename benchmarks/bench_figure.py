@@ -0,0 +1,105 @@
+"""Compare the plain-dict trend figure builder against building it with Plotly Express
+
+Run from the repository root so the app finds ./data:
+    python benchmarks/bench_figure.py
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import plotly.express as px
+from plotly.io.json import to_json_plotly
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ['FIGURE_CACHE_WARM'] = '0'
+os.environ['DATA_REFRESH_SECONDS'] = '0'
+os.environ['WARM_UP'] = 'sync'
+
+import application
+
+#---------------------------------------------------------------------------------------------
+
+def express_trend(country, store, include_forecast, start_date, end_date):
+    """build the trend figure the way add_trend used to, validating every call"""
+    line_color = np.array(['#636EFA', '#EF553B', '#00CC96'])
+    country = store.resolve_country(country)
+    first_day, last_day = store.day_range(start_date, end_date, include_forecast)
+    history_end = max(first_day, min(last_day, store.n_history))
+    forecast_start = max(first_day, store.n_history)
+    has_forecast = last_day > forecast_start
+    has_history = history_end > first_day or not has_forecast
+
+    fig = px.line(template = 'plotly_dark')
+    fig.update_xaxes(title='Date')
+    fig.update_yaxes(title='Mobilitys % Change From Baseline')
+    for idx, transportation in enumerate(store.country_transports[country]):
+        if has_history:
+            x, y = store.series(country, transportation, first_day, history_end)
+            fig.add_scatter(x = x, y = y, line = dict(color = line_color[idx]), name = transportation)
+        if has_forecast:
+            x, y = store.series(country, transportation, forecast_start, last_day)
+            fig.add_scatter(x = x, y = y,
+                            line = dict(color = line_color[idx], dash = 'dash' if has_history else None),
+                            name = transportation, showlegend = not has_history)
+        pass
+    fig.update_layout(margin = dict(l = 50, r = 30, t = 20, b = 30, pad = 20),
+                      legend = dict(x = 0.8, y = 1.1, itemclick = False,
+                                    title = dict(text = 'Transportation Types:', side = 'top',
+                                                 font = dict(family = 'Arial', size = 18)),
+                                    orientation="h", font = dict(family = 'Arial', size = 15)),
+                      font = dict(family = 'Arial', size = 15),
+                      hoverlabel = dict(bordercolor = 'white', font = dict(family = 'Arial', size = 15)))
+
+    return fig
+
+def rendered(fig):
+    """the figure as the browser receives it, without px's empty placeholder trace"""
+    fig = json.loads(to_json_plotly(fig))
+    fig['data'] = [trace for trace in fig['data'] if 'x' in trace]
+    for trace in fig['data']:
+        trace.pop('xaxis', None)
+        trace.pop('yaxis', None)
+        # newer plotly validation sends arrays base64 encoded
+        if isinstance(trace['y'], dict):
+            trace['y'] = np.frombuffer(base64.b64decode(trace['y']['bdata']), dtype = trace['y']['dtype'])
+        trace['y'] = [None if np.isnan(value) else value for value in np.asarray(trace['y'], dtype = float)]
+        pass
+
+    return fig
+
+def time_builder(build, store, selections, repeat):
+    """mean seconds to build and serialize one figure"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for country, include_forecast in selections:
+            to_json_plotly(build(country, store, include_forecast, None, None))
+            pass
+        pass
+
+    return (time.perf_counter() - start) / (repeat * len(selections))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+
+    application.create_app()
+    store = application.dashboard_data.trend_store
+    selections = [(country, include_forecast) for country in store.country_names
+                  for include_forecast in [False, True]]
+
+    # both builders must send the same figure
+    mismatched = [selection for selection in selections
+                  if rendered(express_trend(selection[0], store, selection[1], None, None))
+                  != rendered(application.add_trend(selection[0], store, selection[1], None, None))]
+    print('{} of {} figures identical'.format(len(selections) - len(mismatched), len(selections)))
+
+    express_seconds = time_builder(express_trend, store, selections, args.repeat)
+    plain_seconds = time_builder(application.add_trend, store, selections, args.repeat)
+    print('plotly express: {:6.2f} ms per figure'.format(express_seconds * 1e3))
+    print('plain dicts:    {:6.2f} ms per figure ({:.1f}x faster)'.format(plain_seconds * 1e3,
+                                                                          express_seconds / plain_seconds))
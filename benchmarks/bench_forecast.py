@@ -0,0 +1,67 @@
+"""Time the Holt-Winters forecaster on every series and check its accuracy
+
+The forecaster is refit on the history before the existing forecast file starts and
+compared with it, and backtested on the last days of the report against a
+seasonal naive forecast (repeating the last week).
+
+Usage:
+    python benchmarks/bench_forecast.py [csv_path] [forecast_path]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mobility_data import load_trends
+from data_refresh import read_forecast
+from forecast import forecast_trends, fit_forecast, HORIZON, SEASON_LENGTH
+
+#---------------------------------------------------------------------------------------------
+
+def mae(predicted, actual):
+    return np.nanmean(np.abs(np.asarray(predicted, dtype = float) - np.asarray(actual, dtype = float)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('csv_path', nargs = '?', default = './data/applemobilitytrends.csv')
+    parser.add_argument('forecast_path', nargs = '?', default = './data/forecasted_trends.csv')
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    trends, _ = load_trends(args.csv_path)
+    existing = read_forecast(args.forecast_path)
+
+    # fit time for every series at once
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        forecast_trends(trends)
+        timings.append(time.perf_counter() - start)
+        pass
+    print('fit and forecast {} series x {} days: {:.1f} ms (median of {})'.format(
+          trends.shape[1], trends.shape[0], np.median(timings) * 1e3, args.repeat))
+
+    # parity with the existing forecast file, fit on the history it was made from
+    history = trends[trends.index < existing.index[0]]
+    series = [column for column in existing.columns if column in history.columns]
+    refit = forecast_trends(history[series], len(existing))
+    print('existing file: {} series from {}'.format(len(series), str(existing.index[0])[:10]))
+    print('  MAE between refit and existing forecast: {:.2f}'.format(mae(refit.to_numpy(), existing[series].to_numpy())))
+    actual = trends.reindex(existing.index)[series]
+    if actual.notna().any().any():
+        print('  MAE against actuals, existing: {:.2f}  refit: {:.2f}'.format(
+              mae(existing[series].to_numpy(), actual.to_numpy()), mae(refit.to_numpy(), actual.to_numpy())))
+    else:
+        print('  no actuals yet for the forecasted days')
+
+    # backtest on the last days of the report
+    values = trends.to_numpy(dtype = float).T
+    train, test = values[:, :-HORIZON], values[:, -HORIZON:]
+    forecast, _ = fit_forecast(train, HORIZON)
+    naive = np.tile(train[:, -SEASON_LENGTH:], int(np.ceil(HORIZON / SEASON_LENGTH)))[:, :HORIZON]
+    print('backtest on the last {} days, MAE  holt-winters: {:.2f}  seasonal naive: {:.2f}'.format(
+          HORIZON, mae(forecast, test), mae(naive, test)))
@@ -0,0 +1,54 @@
+"""Measure forecast pipeline wall-clock time by number of worker processes
+
+Every run fits every series from scratch. Use --copies to repeat the series
+and simulate more geographies.
+
+Usage:
+    python benchmarks/bench_forecast_pipeline.py [csv_path] [--model prophet] [--workers 1 2 4 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mobility_data import load_trends
+from forecast_pipeline import run_pipeline, MODELS, CHUNK_SIZE
+
+#---------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('csv_path', nargs = '?', default = './data/applemobilitytrends.csv')
+    parser.add_argument('--model', choices = sorted(MODELS), default = 'holt-winters')
+    parser.add_argument('--workers', type = int, nargs = '+',
+                        default = sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--chunk-size', type = int, default = CHUNK_SIZE)
+    parser.add_argument('--copies', type = int, default = 1)
+    args = parser.parse_args()
+
+    trends, _ = load_trends(args.csv_path)
+    if args.copies > 1:
+        trends = pd.concat({'copy {}'.format(copy): trends for copy in range(args.copies)}, axis = 1)
+        # fold the copy level into the country name
+        trends.columns = pd.MultiIndex.from_tuples([(copy + ' ' + country, transportation)
+                                                    for copy, country, transportation in trends.columns])
+
+    print('{} series, model {}, chunk size {}'.format(trends.shape[1], args.model, args.chunk_size))
+    print('{:>8}{:>12}{:>10}{:>20}'.format('workers', 'seconds', 'speedup', 'median chunk ms'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        baseline = None
+        for workers in args.workers:
+            _, report = run_pipeline(trends, os.path.join(tmp_dir, 'forecast.csv'),
+                                     model = args.model, workers = workers,
+                                     chunk_size = args.chunk_size)
+            baseline = baseline or report['seconds']
+            print('{:>8}{:>12.2f}{:>10.2f}{:>20.2f}'.format(workers, report['seconds'],
+                                                            baseline / report['seconds'],
+                                                            np.median([chunk['seconds'] for chunk in
+                                                                       report['chunk_seconds']]) * 1e3))
+            pass
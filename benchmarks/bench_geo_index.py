@@ -0,0 +1,103 @@
+"""Compare filtering report rows with GeoIndex lookups for every region of a synthetic report
+
+Times resolving a region and slicing its series over a date range, per region, by
+filtering the report's rows like a per-request DataFrame lookup would, and through the
+geo index by key, by name and by listing a country's regions:
+    python benchmarks/bench_geo_index.py [--regions 5000] [--days 1826] [--sample 300]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mobility_data import REPORT_COLUMNS, read_report
+from geo_index import GeoIndex
+from synthetic_report import generate_report
+
+#---------------------------------------------------------------------------------------------
+
+def time_each(func, items):
+    """
+    Input:
+        func (function): function of one item
+        items (list): items to call it with
+    Output:
+        timings (numpy array): seconds of every call
+    """
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        timings.append(time.perf_counter() - start)
+        pass
+
+    return np.array(timings)
+
+def filter_rows(region_data, dates, geo_type, country, sub_region, name):
+    """slice a region's series by filtering the report rows with boolean masks"""
+    rows = region_data[(region_data['geo_type'] == geo_type) & (region_data['country'] == country) &
+                       (region_data['sub-region'].fillna('') == sub_region) & (region_data['region'] == name)]
+
+    return {transportation: values for transportation, values in
+            zip(rows['transportation_type'], rows[dates].to_numpy() - 100)}
+
+def slice_index(regions, key, first_day, last_day):
+    """slice a region's series through the geo index"""
+    geo = regions.lookup(key)
+
+    return {transportation: regions.series(geo, transportation, first_day, last_day)
+            for transportation in regions.series_rows[geo]}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--regions', type = int, default = 5000)
+    parser.add_argument('--days', type = int, default = 1826)
+    parser.add_argument('--sample', type = int, default = 300, help = 'regions timed with dataframe filtering')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        csv_path = os.path.join(data_dir, 'applemobilitytrends.csv')
+        generate_report(csv_path, args.regions, args.days)
+        _, region_data = read_report(csv_path)
+        pass
+
+    start = time.perf_counter()
+    regions = GeoIndex(region_data)
+    build_time = time.perf_counter() - start
+    # every geography with series, the date range is the middle half of the report
+    geos = [geo for geo in range(len(regions.keys)) if regions.series_rows[geo]]
+    start_date, end_date = str(regions.days[len(regions.days) // 4]), str(regions.days[-len(regions.days) // 4])
+    first_day, last_day = regions.day_range(start_date, end_date)
+    dates = region_data.columns.drop(REPORT_COLUMNS)[first_day:last_day]
+    sample = geos[::max(1, len(geos) // args.sample)]
+
+    def split_key(geo):
+        geo_type, country, sub_region, name = regions.keys[geo].split('|')
+        # a sub-region row naming itself as its sub-region has none in its key
+        if geo_type == 'sub-region' and not sub_region:
+            sub_region = region_data.loc[region_data['region'] == name, 'sub-region'].fillna('').iloc[0]
+
+        return geo_type, country, sub_region, name
+
+    sample_keys = [split_key(geo) for geo in sample]
+    runs = [('dataframe filter + slice', len(sample),
+             time_each(lambda key: filter_rows(region_data, dates, *key), sample_keys)),
+            ('index lookup + slice', len(geos),
+             time_each(lambda geo: slice_index(regions, regions.keys[geo], first_day, last_day), geos)),
+            ('index find by name', len(geos),
+             time_each(lambda geo: regions.find(regions.names[geo]), geos)),
+            ('index regions of a country', len(regions.country_regions),
+             time_each(regions.regions_of, list(regions.country_regions)))]
+
+    print('{} regions x {} days: {} geographies, {} series, index built in {:.2f}s, {:.0f} MB of values'.format(
+          args.regions, args.days, len(regions.keys), len(regions.values), build_time, regions.values.nbytes / 2**20))
+    print('{:<28} {:>8} {:>12} {:>12}'.format('', 'calls', 'median us', 'p99 us'))
+    for name, n_calls, timings in runs:
+        print('{:<28} {:>8} {:>12.1f} {:>12.1f}'.format(name, n_calls, np.median(timings) * 1e6,
+                                                       np.percentile(timings, 99) * 1e6))
+        pass
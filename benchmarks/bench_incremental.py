@@ -0,0 +1,81 @@
+"""Compare a full reload against applying a one-day append segment as history grows
+
+Usage:
+    python benchmarks/bench_incremental.py [--years 1 2 3 5] [--series 450]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mobility_data import clean_data, append_segment
+
+#---------------------------------------------------------------------------------------------
+
+ID_COLUMNS = ['geo_type', 'region', 'transportation_type', 'alternative_name', 'sub-region', 'country']
+
+def country_partition(n_series, dates, seed = 0):
+    """generate a country partition of the report as csv text
+    Input:
+        n_series (int): number of country x transportation type rows
+        dates (list): date columns in %Y-%m-%d
+        seed (int): random seed
+    Output:
+        csv (string): partition in the report format
+    """
+    rng = np.random.default_rng(seed)
+    transportation_types = ['driving', 'transit', 'walking']
+    ids = pd.DataFrame({'geo_type': 'country/region',
+                        'region': ['Country {}'.format(idx // 3) for idx in range(n_series)],
+                        'transportation_type': [transportation_types[idx % 3] for idx in range(n_series)],
+                        'alternative_name': '',
+                        'sub-region': '',
+                        'country': ''})
+    values = pd.DataFrame(np.round(100 + rng.normal(0, 20, (n_series, len(dates))), 2), columns = dates)
+
+    return pd.concat([ids, values], axis = 1).to_csv(index = False)
+
+def median_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+        pass
+
+    return np.median(timings)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--years', type = float, nargs = '+', default = [1, 2, 3, 5])
+    parser.add_argument('--series', type = int, default = 450)
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    print('{:>6}{:>8}{:>14}{:>12}{:>14}{:>12}'.format('years', 'days', 'full bytes', 'full ms',
+                                                       'segment bytes', 'segment ms'))
+    for years in args.years:
+        dates = pd.date_range('2020-01-13', periods = int(years * 365) + 1).strftime('%Y-%m-%d')
+        full_csv = country_partition(args.series, list(dates))
+        segment_csv = country_partition(args.series, list(dates[-1:]), seed = 1)
+        # the in-memory cube before the new day arrived
+        trends, country_names = clean_data(pd.read_csv(io.StringIO(country_partition(args.series, list(dates[:-1]))),
+                                                      low_memory = False))
+
+        def full_reload():
+            clean_data(pd.read_csv(io.StringIO(full_csv), low_memory = False))
+
+        def apply_segment():
+            segment, segment_country_names = clean_data(pd.read_csv(io.StringIO(segment_csv), low_memory = False))
+            append_segment(trends, country_names, segment, segment_country_names)
+
+        print('{:>6g}{:>8}{:>14,}{:>12.1f}{:>14,}{:>12.1f}'.format(years, len(dates),
+                                                                   len(full_csv), median_time(full_reload, args.repeat) * 1e3,
+                                                                   len(segment_csv), median_time(apply_segment, args.repeat) * 1e3))
+        pass
@@ -0,0 +1,58 @@
+"""Compare serving the layout per request against the precompressed, ETagged layout
+
+Run from the repository root so the app finds ./data:
+    python benchmarks/bench_layout.py [--clientside]
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ['FIGURE_CACHE_WARM'] = '0'
+os.environ['DATA_REFRESH_SECONDS'] = '0'
+os.environ['WARM_UP'] = 'sync'
+
+#---------------------------------------------------------------------------------------------
+
+def time_request(request, repeat):
+    """mean seconds per call and the bytes of the last response"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = request()
+        pass
+
+    return (time.perf_counter() - start) / repeat, len(body)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--clientside', action = 'store_true', help = 'include the clientside trend payload')
+    parser.add_argument('--repeat', type = int, default = 20)
+    args = parser.parse_args()
+    if args.clientside:
+        os.environ['CLIENTSIDE_TRENDS'] = '1'
+
+    import application
+
+    app = application.create_app()
+    client = app.server.test_client()
+    path = app.config.routes_pathname_prefix + '_dash-layout'
+    etag = client.get(path, headers = {'Accept-Encoding': 'br, gzip'}).headers['ETag']
+
+    rows = [
+        # what dash does on every page load: build the layout and serialize it
+        ('per request, identity', lambda: app.serve_layout().get_data()),
+        # the same with the response compressed on the fly
+        ('per request, gzip', lambda: gzip.compress(app.serve_layout().get_data(), 6)),
+        ('precompressed, identity', lambda: client.get(path).data),
+        ('precompressed, gzip', lambda: client.get(path, headers = {'Accept-Encoding': 'gzip'}).data),
+        ('precompressed, br', lambda: client.get(path, headers = {'Accept-Encoding': 'br, gzip'}).data),
+        ('repeat visit, 304', lambda: client.get(path, headers = {'Accept-Encoding': 'br, gzip',
+                                                                  'If-None-Match': etag}).data),
+    ]
+    print('server time to the layout body and bytes on the wire, per page load')
+    for label, request in rows:
+        seconds, size = time_request(request, args.repeat)
+        print('{:>24}: {:8.2f} ms {:>12,} bytes'.format(label, seconds * 1e3, size))
+        pass
@@ -0,0 +1,80 @@
+"""Report peak and steady-state resident memory of loading the app, with and without LOW_MEMORY
+
+Every mode loads the app in a new process against a synthetic report, like a worker
+does on startup, and reads its peak (VmHWM) and current (VmRSS) resident memory from
+/proc once the data is loaded. --repo measures another checkout too, e.g. a git worktree
+of an earlier commit, in its default mode (Linux only):
+    python benchmarks/bench_memory.py [--regions 5000] [--days 1826] [--repo PATH]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, REPO)
+
+# a worker loads the app like gunicorn does for application:application and reports its memory
+WORKER = '''
+import gc
+import sys
+sys.path.insert(0, {repo!r})
+import application
+application.application
+gc.collect()
+with open('/proc/self/status') as f:
+    status = dict(line.split(':', 1) for line in f)
+    pass
+print(int(status['VmHWM'].split()[0]) / 1024, int(status['VmRSS'].split()[0]) / 1024)
+'''
+
+#---------------------------------------------------------------------------------------------
+
+def measure(repo, data_dir, low_memory):
+    """
+    Input:
+        repo (string): checkout of the app to load
+        data_dir (string): directory holding data/applemobilitytrends.csv and data/forecasted_trends.csv
+        low_memory (boolean): whether or not to load with LOW_MEMORY=1
+    Output:
+        peak (float): peak resident memory in MB
+        steady (float): resident memory once the data is loaded in MB
+    """
+    env = dict(os.environ, DATA_REFRESH_SECONDS = '0', WARM_UP = 'sync', LOW_MEMORY = '1' if low_memory else '0')
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', WORKER.format(repo = repo)],
+                            cwd = data_dir, env = env, check = True, stdout = subprocess.PIPE,
+                            universal_newlines = True).stdout
+    peak, steady = output.split()[-2:]
+
+    return float(peak), float(steady)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--regions', type = int, default = 5000)
+    parser.add_argument('--days', type = int, default = 1826)
+    parser.add_argument('--repo', default = None, help = 'another checkout to measure')
+    args = parser.parse_args()
+
+    from synthetic_report import generate_report
+    from mobility_data import load_trends
+    from forecast import forecast_trends, write_forecast
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.makedirs(os.path.join(data_dir, 'data'))
+        csv_path = os.path.join(data_dir, 'data', 'applemobilitytrends.csv')
+        generate_report(csv_path, args.regions, args.days)
+        write_forecast(forecast_trends(load_trends(csv_path)[0]),
+                       os.path.join(data_dir, 'data', 'forecasted_trends.csv'))
+
+        runs = [('this tree', REPO, False), ('LOW_MEMORY=1', REPO, True)]
+        if args.repo:
+            runs.insert(0, (os.path.basename(os.path.abspath(args.repo)), os.path.abspath(args.repo), False))
+        print('{} regions x {} days, report {:.0f} MB'.format(args.regions, args.days,
+                                                             os.path.getsize(csv_path) / 2**20))
+        print('{:>16} {:>10} {:>10}'.format('mode', 'peak MB', 'steady MB'))
+        for label, repo, low_memory in runs:
+            peak, steady = measure(repo, data_dir, low_memory)
+            print('{:>16} {:>10.1f} {:>10.1f}'.format(label, peak, steady))
+            pass
+        pass
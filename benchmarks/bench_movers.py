@@ -0,0 +1,72 @@
+"""Time ranking the top movers of a synthetic report's regions over date ranges of every length
+
+Ranks the regions reporting a transportation type by their change over a date range, with
+range_deltas and top_movers from analytics.py against a Python loop averaging every region's
+first and last week and sorting them all. Ranges grow from two weeks to the whole report, so
+the vectorized ranking should take about as long for every range:
+    python benchmarks/bench_movers.py [--regions 5000] [--days 1826] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mobility_data import read_report
+from geo_index import GeoIndex
+from analytics import WEEK, range_deltas, top_movers
+from synthetic_report import generate_report
+
+#---------------------------------------------------------------------------------------------
+
+def loop_movers(values, rows, first_day, last_day, n):
+    """rank every series with a loop over the series and a full sort"""
+    deltas = []
+    for row in rows:
+        series = values[row, first_day:last_day]
+        start, end = series[:WEEK], series[-WEEK:]
+        if np.isnan(start).all() or np.isnan(end).all():
+            continue
+        deltas.append((np.nanmean(end) - np.nanmean(start), row))
+        pass
+    deltas.sort()
+
+    return [row for delta, row in deltas[::-1][:n] if delta > 0], [row for delta, row in deltas[:n] if delta < 0]
+
+def vectorized_movers(values, rows, first_day, last_day, n):
+    """rank every series from two windows of days and a partial sort"""
+    return top_movers(range_deltas(values, first_day, last_day, rows), n)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--regions', type = int, default = 5000)
+    parser.add_argument('--days', type = int, default = 1826)
+    parser.add_argument('--repeat', type = int, default = 20)
+    parser.add_argument('--top', type = int, default = 5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        csv_path = os.path.join(data_dir, 'applemobilitytrends.csv')
+        generate_report(csv_path, args.regions, args.days)
+        _, region_data = read_report(csv_path)
+        pass
+
+    regions = GeoIndex(region_data)
+    transportation = sorted(regions.transport_series)[0]
+    _, rows = regions.transport_series[transportation]
+    n_days = len(regions.days)
+    print('{} regions x {} days, ranking {} {} series'.format(args.regions, args.days, len(rows), transportation))
+    print('{:>10} {:>16} {:>16}'.format('range days', 'loop ms', 'vectorized ms'))
+    for n_range in sorted({2 * WEEK, 90, 365, n_days}):
+        first_day, last_day = n_days - min(n_range, n_days), n_days
+        timings = []
+        for func in [loop_movers, vectorized_movers]:
+            timer = timeit.Timer(lambda: func(regions.values, rows, first_day, last_day, args.top))
+            timings.append(min(timer.repeat(args.repeat, 1)) * 1e3)
+            pass
+        print('{:>10} {:>16.2f} {:>16.3f}'.format(last_day - first_day, *timings))
+        pass
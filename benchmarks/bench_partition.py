@@ -0,0 +1,62 @@
+"""Compare reading the full report against reading only its country partition
+
+Usage:
+    python benchmarks/bench_partition.py [csv_path] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import numpy as np
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'AWS', 'Lambda'))
+
+from mobility_data import clean_data
+from lambda_function import partition_report, partition_key
+
+#---------------------------------------------------------------------------------------------
+
+def load(csv_path, repeat):
+    """time parsing and cleaning a report
+    Input:
+        csv_path (string): path to a report or a partition of it
+        repeat (int): number of runs
+    Output:
+        timing (float): median wall-clock seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        clean_data(pd.read_csv(csv_path, low_memory = False))
+        timings.append(time.perf_counter() - start)
+        pass
+
+    return np.median(timings)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('csv_path', nargs = '?', default = './data/applemobilitytrends.csv')
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    file_name = os.path.basename(args.csv_path)
+    with tempfile.TemporaryDirectory() as out_dir:
+        start = time.perf_counter()
+        with open(args.csv_path, encoding = 'utf-8', newline = '') as lines:
+            paths, stats = partition_report(lines, out_dir, file_name)
+            pass
+        print('partitioned in {:.1f} ms'.format((time.perf_counter() - start) * 1e3))
+        for name in sorted(stats):
+            print('  {:<45}{:>14,} bytes'.format(name, stats[name]))
+            pass
+
+        print('{:<12}{:>14}{:>12}'.format('read', 'bytes', 'median ms'))
+        for label, path in [('full', paths[file_name]),
+                            ('countries', paths[partition_key(file_name, 'countries')])]:
+            print('{:<12}{:>14,}{:>12.1f}'.format(label, os.path.getsize(path), load(path, args.repeat) * 1e3))
+            pass
@@ -0,0 +1,68 @@
+"""Compare startup cost of parsing the full report against loading a snapshot
+
+Usage:
+    python benchmarks/bench_startup.py [csv_path] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mobility_data import clean_data, write_snapshot, read_snapshot
+
+#---------------------------------------------------------------------------------------------
+
+def time_call(func, repeat):
+    """time a function call
+    Input:
+        func (function): function without arguments
+        repeat (int): number of runs
+    Output:
+        timings (numpy array): wall-clock seconds of every run
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+        pass
+
+    return np.array(timings)
+
+def load_csv(csv_path):
+    trend_data = pd.read_csv(csv_path, low_memory = False)
+
+    return clean_data(trend_data)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('csv_path', nargs = '?', default = './data/applemobilitytrends.csv')
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    trends, country_names = load_csv(args.csv_path)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot_path = os.path.join(tmp_dir, 'trends.snapshot')
+        write_snapshot(trends, country_names, snapshot_path)
+        # make sure both paths produce the same data
+        snapshot_trends, _ = read_snapshot(snapshot_path)
+        pd.testing.assert_frame_equal(trends, snapshot_trends, check_freq = False)
+
+        csv_timings = time_call(lambda: load_csv(args.csv_path), args.repeat)
+        snapshot_timings = time_call(lambda: read_snapshot(snapshot_path), args.repeat)
+        csv_size = os.path.getsize(args.csv_path)
+        snapshot_size = os.path.getsize(snapshot_path)
+        pass
+
+    print('{:<10}{:>12}{:>12}{:>14}'.format('path', 'median ms', 'min ms', 'file bytes'))
+    print('{:<10}{:>12.1f}{:>12.1f}{:>14,}'.format('csv', np.median(csv_timings) * 1e3,
+                                                  csv_timings.min() * 1e3, csv_size))
+    print('{:<10}{:>12.1f}{:>12.1f}{:>14,}'.format('snapshot', np.median(snapshot_timings) * 1e3,
+                                                  snapshot_timings.min() * 1e3, snapshot_size))
+    print('speedup: {:.1f}x'.format(np.median(csv_timings) / np.median(snapshot_timings)))
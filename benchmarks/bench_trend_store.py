@@ -0,0 +1,74 @@
+"""Compare DataFrame lookups against TrendStore views for every country
+
+Usage:
+    python benchmarks/bench_trend_store.py [csv_path] [forecast_path]
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mobility_data import load_trends
+from trend_store import TrendStore
+
+#---------------------------------------------------------------------------------------------
+
+def slice_frames(trends, forecast, country_names, start_date, end_date):
+    """slice every country the way add_trend used to, via MultiIndex columns and date labels"""
+    for country in country_names:
+        country_trend = trends[country]
+        country_forecast = forecast[country]
+        filtered_trend = country_trend.loc[start_date:, :]
+        filtered_forecast = country_forecast.loc[:end_date, :]
+        for transportation in filtered_trend.columns:
+            filtered_trend[transportation].to_numpy()
+            filtered_forecast[transportation].to_numpy()
+            pass
+        pass
+
+def slice_store(store, country_names, start_date, end_date):
+    """slice every country through TrendStore offsets"""
+    for country in country_names:
+        first_day, last_day = store.day_range(start_date, end_date, True)
+        for transportation in store.country_transports[country]:
+            store.series(country, transportation, first_day, min(last_day, store.n_history))
+            store.series(country, transportation, store.n_history, last_day)
+            pass
+        pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('csv_path', nargs = '?', default = './data/applemobilitytrends.csv')
+    parser.add_argument('forecast_path', nargs = '?', default = './data/forecasted_trends.csv')
+    parser.add_argument('--repeat', type = int, default = 20)
+    args = parser.parse_args()
+
+    trends, country_names = load_trends(args.csv_path)
+    forecast = pd.read_csv(args.forecast_path, parse_dates = True, header = [0,1], index_col = 0)
+    trends.index = [str(date)[:10] for date in trends.index]
+    forecast.index = [str(date)[:10] for date in forecast.index]
+    country_names = [country for country in country_names if country in forecast.columns]
+
+    start = time.perf_counter()
+    store = TrendStore(trends, forecast, country_names)
+    build_time = time.perf_counter() - start
+    # dates spanning both historical and forecasted timelines
+    start_date = trends.index[len(trends) // 2]
+    end_date = forecast.index[-1]
+
+    for name, func in [('dataframe', lambda: slice_frames(trends, forecast, country_names, start_date, end_date)),
+                       ('store', lambda: slice_store(store, country_names, start_date, end_date))]:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+            pass
+        print('{:<10} {:>8.3f} ms per country'.format(name, np.median(timings) / len(country_names) * 1e3))
+        pass
+    print('store built in {:.1f} ms'.format(build_time * 1e3))
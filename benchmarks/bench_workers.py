@@ -0,0 +1,105 @@
+"""Compare resident memory per worker with private data against a shared data directory
+
+Starts N processes that load the app like gunicorn workers do, waits until every one
+has loaded its data and reads their memory from /proc. PSS splits shared pages between
+the processes sharing them, so its sum is the real footprint of all workers.
+
+Run from the repository root so the app finds ./data (Linux only):
+    python benchmarks/bench_workers.py [--workers 1 4 16]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# a worker loads the app like gunicorn does for application:application, the data is loaded
+# before it's returned with WARM_UP=sync, then reports that it's ready and waits to be measured
+WORKER = '''
+import sys
+sys.path.insert(0, {repo!r})
+import application
+application.application
+print('ready', flush = True)
+sys.stdin.read()
+'''
+
+#---------------------------------------------------------------------------------------------
+
+def memory(pid):
+    """
+    Input:
+        pid (int): process id
+    Output:
+        memory (dict): Rss, Pss and Private_Dirty of the process in MB
+    """
+    fields = {}
+    with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+            pass
+        pass
+
+    return {name: fields[name] for name in ['Rss', 'Pss', 'Private_Dirty']}
+
+def measure(n_workers, shared_dir):
+    """start n_workers workers and measure them once all are ready
+    Input:
+        n_workers (int): number of worker processes
+        shared_dir (string): shared data directory, None for private data in every worker
+    Output:
+        memories (list): memory of every worker
+    """
+    env = dict(os.environ, FIGURE_CACHE_WARM = '0', DATA_REFRESH_SECONDS = '0', WARM_UP = 'sync')
+    env.pop('SHARED_DATA_DIR', None)
+    if shared_dir is not None:
+        env['SHARED_DATA_DIR'] = shared_dir
+    workers = [subprocess.Popen([sys.executable, '-W', 'ignore', '-c', WORKER.format(repo = REPO)],
+                                stdin = subprocess.PIPE, stdout = subprocess.PIPE, env = env,
+                                universal_newlines = True)
+               for _ in range(n_workers)]
+    try:
+        for worker in workers:
+            # skip anything the app prints while loading, an empty line means the worker exited
+            line = worker.stdout.readline()
+            while line and line.strip() != 'ready':
+                line = worker.stdout.readline()
+            if not line:
+                raise RuntimeError('worker {} failed to start'.format(worker.pid))
+            pass
+        memories = [memory(worker.pid) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.kill()
+            worker.wait()
+            pass
+
+    return memories
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, 4, 16])
+    args = parser.parse_args()
+
+    print('{:>8} {:>8} {:>14} {:>14} {:>18} {:>14}'.format('mode', 'workers', 'RSS/worker MB',
+                                                           'PSS/worker MB', 'private/worker MB',
+                                                           'total PSS MB'))
+    for n_workers in args.workers:
+        for mode in ['private', 'shared']:
+            shared_dir = tempfile.mkdtemp(prefix = 'mobility-', dir = '/dev/shm') if mode == 'shared' else None
+            try:
+                memories = measure(n_workers, shared_dir)
+            finally:
+                if shared_dir is not None:
+                    shutil.rmtree(shared_dir)
+            mean = {name: sum(m[name] for m in memories) / n_workers for name in memories[0]}
+            print('{:>8} {:>8} {:>14.1f} {:>14.1f} {:>18.1f} {:>14.1f}'.format(
+                  mode, n_workers, mean['Rss'], mean['Pss'], mean['Private_Dirty'],
+                  sum(m['Pss'] for m in memories)))
+            pass
+        pass
@@ -0,0 +1,192 @@
+"""Check the ingest Lambda against a local stand-in for Apple's CDN and a moto S3 stub
+
+Serves a synthetic report over HTTP with ETags, runs lambda_handler against a mocked bucket
+and checks the first upload, skipping a report whose ETag didn't change, appending a new
+day as a segment of the country partition and compacting the segments into a full upload:
+    python benchmarks/check_ingest.py [--regions 100] [--days 60]
+Exits with 1 if a check fails. Needs moto.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(root, 'AWS', 'Lambda'))
+
+from synthetic_report import generate_report
+
+#---------------------------------------------------------------------------------------------
+
+INDEX_PATH = '/covid19-mobility-data/current/v3/index.json'
+BASE_PATH = '/covid19-mobility-data/check/v3'
+
+class AppleStandIn(BaseHTTPRequestHandler):
+    """serves index.json pointing at the current report and the report with its ETag"""
+    # csv path -> report bytes, the last one put is current
+    reports = {}
+
+    def do_GET(self):
+        if self.path == INDEX_PATH:
+            csv_path = list(self.reports)[-1]
+            self.send_body(json.dumps({'basePath': BASE_PATH,
+                                       'regions': {'en-us': {'csvPath': csv_path}}}).encode())
+            return
+        body = self.reports.get(self.path[len(BASE_PATH):]) if self.path.startswith(BASE_PATH) else None
+        if body is None:
+            self.send_error(404)
+            return
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_body(body, etag)
+
+    def send_body(self, body, etag = None):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def drop_last_days(text, n_days):
+    """
+    Input:
+        text (string): report csv
+        n_days (int): number of days to drop
+    Output:
+        text (string): the report without its last n_days date columns
+    """
+    return ''.join(line.rsplit(',', n_days)[0] + '\n' for line in text.splitlines())
+
+def last_date(text):
+    return text.split('\n', 1)[0].rsplit(',', 1)[1]
+
+def check(failures, label, condition):
+    print('{:<60}{}'.format(label, 'ok' if condition else 'FAILED'))
+    if not condition:
+        failures.append(label)
+
+def run_checks(lambda_function, s3, report, reports):
+    """run the ingest through every case
+    Input:
+        lambda_function (module): the Lambda, pointed at the stand-in and the stub
+        s3 (boto3 client): client of the mocked S3
+        report (string): synthetic report csv with two more days than the first upload
+        reports (dict): reports served by the stand-in, csv path -> report bytes
+    Output:
+        failures (list): labels of the failed checks
+    """
+    bucket = lambda_function.BUCKET
+    countries_key = lambda_function.partition_key('applemobilitytrends.csv', 'countries')
+    failures = []
+
+    def keys():
+        return sorted(obj['Key'] for obj in s3.list_objects_v2(Bucket = bucket).get('Contents', []))
+
+    def read(key):
+        return s3.get_object(Bucket = bucket, Key = key)['Body'].read().decode()
+
+    # first upload: the full report and every partition
+    first = drop_last_days(report, 2)
+    reports['/en-us/applemobilitytrends-1.csv'] = first.encode()
+    stats = lambda_function.lambda_handler({}, None)
+    manifest = lambda_function.read_manifest(s3, bucket)
+    check(failures, 'first upload is not skipped', not stats['skipped'])
+    check(failures, 'first upload writes the full report', read('applemobilitytrends.csv') == first)
+    check(failures, 'first upload writes the country partition', countries_key in keys())
+    check(failures, 'first upload records the last date',
+          manifest.get('last_date') == last_date(first))
+    check(failures, 'first upload has no segments', manifest.get('segments') == [])
+
+    # the same report under a new link: the ETag matches, nothing is downloaded or uploaded
+    reports['/en-us/applemobilitytrends-2.csv'] = reports['/en-us/applemobilitytrends-1.csv']
+    before = keys()
+    stats = lambda_function.lambda_handler({}, None)
+    check(failures, 'unchanged ETag is skipped', stats['skipped'])
+    check(failures, 'unchanged ETag downloads no report', stats['report_bytes'] == 0)
+    check(failures, 'unchanged ETag uploads nothing', stats['uploaded_bytes'] == 0 and keys() == before)
+    check(failures, 'unchanged ETag records the new link',
+          lambda_function.read_manifest(s3, bucket).get('file_link', '').endswith('applemobilitytrends-2.csv'))
+
+    # a new day: only a segment of the country partition is uploaded
+    second = drop_last_days(report, 1)
+    reports['/en-us/applemobilitytrends-3.csv'] = second.encode()
+    stats = lambda_function.lambda_handler({}, None)
+    manifest = lambda_function.read_manifest(s3, bucket)
+    segments = manifest.get('segments', [])
+    new_date = last_date(second)
+    check(failures, 'new day is not skipped', not stats['skipped'])
+    check(failures, 'new day appends one segment', len(segments) == 1 and segments[0] in keys())
+    check(failures, 'new day leaves the full report alone', read('applemobilitytrends.csv') == first)
+    if segments:
+        header = read(segments[0]).split('\n', 1)[0].split(',')
+        check(failures, 'segment holds only the new day',
+              header[lambda_function.ID_COLUMNS:] == [new_date])
+    check(failures, 'segment is smaller than the report', stats['uploaded_bytes'] < stats['report_bytes'])
+    check(failures, 'new day records the new last date', manifest.get('last_date') == new_date)
+
+    # compact once a run would exceed COMPACT_EVERY segments
+    compact_every = lambda_function.COMPACT_EVERY
+    lambda_function.COMPACT_EVERY = len(segments)
+    reports['/en-us/applemobilitytrends-4.csv'] = report.encode()
+    try:
+        stats = lambda_function.lambda_handler({}, None)
+    finally:
+        lambda_function.COMPACT_EVERY = compact_every
+    manifest = lambda_function.read_manifest(s3, bucket)
+    check(failures, 'compaction uploads the full report', read('applemobilitytrends.csv') == report)
+    check(failures, 'compaction clears the segments',
+          manifest.get('segments') == [] and not [key for key in keys() if key.startswith('segments/')])
+
+    return failures
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--regions', type = int, default = 100)
+    parser.add_argument('--days', type = int, default = 60)
+    args = parser.parse_args()
+
+    from moto import mock_aws
+    import boto3
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), AppleStandIn)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    # the Lambda reads its endpoints when it is imported
+    os.environ['APPLE_HOST'] = 'http://127.0.0.1:{}'.format(server.server_port)
+    for name in ['AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY']:
+        os.environ[name] = 'testing'
+        pass
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+    os.environ.pop('S3_ENDPOINT_URL', None)
+    import lambda_function
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        csv_path = os.path.join(data_dir, 'applemobilitytrends.csv')
+        generate_report(csv_path, args.regions, args.days + 2)
+        with open(csv_path) as f:
+            report = f.read()
+            pass
+        pass
+
+    with mock_aws():
+        s3 = boto3.client('s3', region_name = 'us-east-1')
+        s3.create_bucket(Bucket = lambda_function.BUCKET)
+        failures = run_checks(lambda_function, s3, report, AppleStandIn.reports)
+        pass
+    server.shutdown()
+
+    if failures:
+        print('{} checks failed'.format(len(failures)))
+        sys.exit(1)
+    print('all checks passed')
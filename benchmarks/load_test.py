@@ -0,0 +1,258 @@
+"""Replay hover traffic against the dash callbacks and report latency and throughput
+
+Every virtual user hovers over the map in bursts, sometimes picks a new date range, which
+fires the map color, trend and movers callbacks, and sometimes toggles the forecast, which
+fires the datepicker callback followed by those three, the same requests a browser sends
+to _dash-update-component.
+
+Runs the app in-process against ./data, or a synthetic report, or against a running server:
+    python benchmarks/load_test.py [--concurrency 1 4 16] [--duration 10]
+    python benchmarks/load_test.py --synthetic 5000 1826
+    python benchmarks/load_test.py --url http://127.0.0.1:8050
+"""
+import argparse
+import atexit
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import date, timedelta
+
+import numpy as np
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, REPO)
+
+#---------------------------------------------------------------------------------------------
+
+class LocalClient:
+    """sends requests to the app in this process through the flask test client"""
+    def __init__(self, server):
+        self.client = server.test_client()
+
+    def get_json(self, path):
+        return self.client.get(path).get_json()
+
+    def post_json(self, path, payload):
+        response = self.client.post(path, json = payload)
+        if response.status_code != 200:
+            raise RuntimeError('{} returned {}'.format(path, response.status_code))
+        response.get_data()
+
+class HttpClient:
+    """sends requests to a running server"""
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def get_json(self, path):
+        with urllib.request.urlopen(self.url + path) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def post_json(self, path, payload):
+        request = urllib.request.Request(self.url + path, data = json.dumps(payload).encode('utf-8'),
+                                         headers = {'Content-Type': 'application/json',
+                                                    'Accept-Encoding': 'gzip, br'})
+        with urllib.request.urlopen(request) as response:
+            response.read()
+
+def find_component(node, component_id):
+    """depth-first search of a serialized dash layout for a component by id"""
+    if isinstance(node, dict):
+        if node.get('props', {}).get('id') == component_id:
+            return node
+        children = node.get('props', {}).get('children')
+        return find_component(children, component_id)
+    if isinstance(node, list):
+        for child in node:
+            found = find_component(child, component_id)
+            if found is not None:
+                return found
+            pass
+
+    return None
+
+class Dashboard:
+    """what a browser knows about the app: its callbacks, countries and dates"""
+    def __init__(self, client):
+        layout = client.get_json('/_dash-layout')
+        self.callbacks = {callback['output']: callback for callback in client.get_json('/_dash-dependencies')}
+        self.countries = list(find_component(layout, 'world_map')['props']['figure']['data'][0]['locations'])
+        picker = find_component(layout, 'select_date')['props']
+        self.first_date = date.fromisoformat(picker['min_date_allowed'][:10])
+        self.last_date = date.fromisoformat(picker['end_date'][:10])
+        self.trend_output = 'trend.figure'
+        self.datepicker_output = next(output for output in self.callbacks if 'select_date' in output)
+        self.map_colors_output = 'map_colors.data'
+        self.movers_output = 'movers.figure'
+        # initial value of every callback input and state, e.g. the picked transportation type
+        self.defaults = {}
+        for callback in self.callbacks.values():
+            for item in callback['inputs'] + callback['state']:
+                component = find_component(layout, item['id'])
+                if component is not None:
+                    self.defaults['{}.{}'.format(item['id'], item['property'])] = \
+                        component['props'].get(item['property'])
+                pass
+            pass
+        if self.callbacks[self.trend_output].get('clientside_function'):
+            raise RuntimeError('the trend graph is drawn in the browser (CLIENTSIDE_TRENDS=1), '
+                               'there are no trend callbacks to load')
+
+    def payload(self, output, values, changed):
+        """build a _dash-update-component request
+        Input:
+            output (string): callback output as listed in _dash-dependencies
+            values (dict): 'id.property' -> current value of every input
+            changed (list): 'id.property' of the inputs that fired the callback
+        Output:
+            payload (dict): request body
+        """
+        callback = self.callbacks[output]
+        outputs = [{'id': part.split('.')[0], 'property': part.split('.')[1]}
+                   for part in output.strip('.').split('...')]
+
+        return {'output': output,
+                'outputs': outputs if output.startswith('..') else outputs[0],
+                'inputs': [dict(item, value = values.get('{}.{}'.format(item['id'], item['property'])))
+                           for item in callback['inputs']],
+                'state': [dict(item, value = values.get('{}.{}'.format(item['id'], item['property'])))
+                          for item in callback['state']],
+                'changedPropIds': changed}
+
+#---------------------------------------------------------------------------------------------
+
+def run_user(client, dashboard, stop, latencies, errors, burst, think, seed):
+    """hover, pick dates and toggle the forecast like one user until stop is set"""
+    rng = random.Random(seed)
+    values = dict(dashboard.defaults)
+    values.update({'world_map.hoverData': {'points': [{'hovertext': rng.choice(dashboard.countries)}]},
+                   'include_forecast.value': 'No',
+                   'select_date.start_date': str(dashboard.first_date),
+                   'select_date.end_date': str(dashboard.last_date),
+                   'trend.relayoutData': None})
+    n_days = (dashboard.last_date - dashboard.first_date).days
+
+    def send(name, output, changed):
+        start = time.perf_counter()
+        try:
+            client.post_json('/_dash-update-component', dashboard.payload(output, values, changed))
+            latencies[name].append(time.perf_counter() - start)
+        except Exception:
+            errors.append(name)
+
+    def send_dates(changed):
+        # a date change recolors the map and redraws the trend and the movers
+        send('update_map_colors', dashboard.map_colors_output, ['select_date.start_date', 'select_date.end_date'])
+        send('update_trend', dashboard.trend_output, changed)
+        send('update_movers', dashboard.movers_output, ['select_date.start_date', 'select_date.end_date'])
+
+    while not stop.is_set():
+        action = rng.random()
+        if action < 0.1:
+            # toggle the forecast, the datepicker follows and then everything reading the dates
+            values['include_forecast.value'] = 'Yes' if values['include_forecast.value'] == 'No' else 'No'
+            send('update_datepicker_range', dashboard.datepicker_output, ['include_forecast.value'])
+            send_dates(['include_forecast.value', 'select_date.start_date', 'select_date.end_date'])
+        elif action < 0.2:
+            # pick a new date range
+            first = rng.randrange(0, n_days - 1)
+            last = rng.randrange(first + 1, n_days + 1)
+            values['select_date.start_date'] = str(dashboard.first_date + timedelta(days = first))
+            values['select_date.end_date'] = str(dashboard.first_date + timedelta(days = last))
+            send_dates(['select_date.start_date', 'select_date.end_date'])
+        else:
+            # sweep the mouse across a few countries
+            for _ in range(burst):
+                values['world_map.hoverData'] = {'points': [{'hovertext': rng.choice(dashboard.countries)}]}
+                send('update_trend', dashboard.trend_output, ['world_map.hoverData'])
+                pass
+        if think > 0:
+            stop.wait(think)
+        pass
+
+def load_test(make_client, dashboard, concurrency, duration, burst, think):
+    """run concurrent users for duration seconds
+    Input:
+        make_client (function): creates a client for one user
+        dashboard (Dashboard): callbacks, countries and dates of the app
+        concurrency (int): number of simultaneous users
+        duration (float): seconds to run
+        burst (int): number of hovers in a row
+        think (float): seconds a user waits between actions
+    Output:
+        latencies (dict): callback name -> seconds of every request
+        errors (list): callback names of failed requests
+        seconds (float): wall-clock duration
+    """
+    latencies = {'update_trend': [], 'update_map_colors': [], 'update_movers': [], 'update_datepicker_range': []}
+    errors = []
+    stop = threading.Event()
+    users = [threading.Thread(target = run_user,
+                              args = (make_client(), dashboard, stop, latencies, errors, burst, think, seed))
+             for seed in range(concurrency)]
+    start = time.perf_counter()
+    for user in users:
+        user.start()
+        pass
+    time.sleep(duration)
+    stop.set()
+    for user in users:
+        user.join()
+        pass
+
+    return latencies, errors, time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--url', default = None, help = 'server to load, the app runs in-process if not set')
+    parser.add_argument('--synthetic', type = int, nargs = 2, metavar = ('REGIONS', 'DAYS'), default = None,
+                        help = 'run the in-process app against a synthetic report')
+    parser.add_argument('--concurrency', type = int, nargs = '+', default = [1, 4, 16])
+    parser.add_argument('--duration', type = float, default = 10)
+    parser.add_argument('--burst', type = int, default = 5, help = 'hovers in a row')
+    parser.add_argument('--think', type = float, default = 0, help = 'seconds between actions')
+    args = parser.parse_args()
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        os.environ.setdefault('DATA_REFRESH_SECONDS', '0')
+        os.environ['WARM_UP'] = 'sync'
+        if args.synthetic:
+            from synthetic_report import generate_report
+            from mobility_data import load_trends
+            from forecast import forecast_trends, write_forecast
+
+            data_dir = tempfile.mkdtemp(prefix = 'mobility-load-')
+            atexit.register(shutil.rmtree, data_dir, True)
+            os.makedirs(os.path.join(data_dir, 'data'))
+            csv_path = os.path.join(data_dir, 'data', 'applemobilitytrends.csv')
+            generate_report(csv_path, *args.synthetic)
+            write_forecast(forecast_trends(load_trends(csv_path)[0]),
+                           os.path.join(data_dir, 'data', 'forecasted_trends.csv'))
+            os.chdir(data_dir)
+        import application
+
+        server = application.create_app().server
+        make_client = lambda: LocalClient(server)
+    dashboard = Dashboard(make_client())
+
+    print('{} countries, {} to {}'.format(len(dashboard.countries), dashboard.first_date, dashboard.last_date))
+    print('{:>6} {:>24} {:>9} {:>9} {:>9} {:>9} {:>10} {:>7}'.format(
+          'users', 'callback', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'errors'))
+    for concurrency in args.concurrency:
+        latencies, errors, seconds = load_test(make_client, dashboard, concurrency,
+                                               args.duration, args.burst, args.think)
+        for name, timings in latencies.items():
+            if not timings:
+                continue
+            p50, p95, p99 = np.percentile(np.array(timings) * 1e3, [50, 95, 99])
+            print('{:>6} {:>24} {:>9} {:>9.1f} {:>9.1f} {:>9.1f} {:>10.1f} {:>7}'.format(
+                  concurrency, name, len(timings), p50, p95, p99, len(timings) / seconds, errors.count(name)))
+            pass
+        pass
@@ -0,0 +1,321 @@
+"""Run the benchmark suite on a synthetic report and store the results for comparison
+
+Times clean_data, looking up a country's trends in the dataframe against the trend store,
+add_trend in all four forecast/date-range scenarios and every derived trend mode, deriving
+the trend modes of every country against deriving them for one country with pandas,
+recoloring the map for a date range against rebuilding it, encoding the map's colors on
+every day, the update_trend callback for one country and for 5 compared countries, the
+update_movers and update_datepicker_range callbacks, importing the app and creating it with
+its data loaded.
+Results are written as json to benchmarks/results/, --compare flags benchmarks whose
+median got slower than a previous result by more than --threshold and exits with 1.
+
+Usage:
+    python benchmarks/run_suite.py [--regions 300] [--days 400] [--repeat 5]
+    python benchmarks/run_suite.py --regions 5000 --days 1826 --compare benchmarks/results/<baseline>.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import pandas as pd
+import numpy as np
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, REPO)
+
+from synthetic_report import generate_report, parse_mix, GEO_MIX, TRANSPORTS
+from mobility_data import clean_data
+from analytics import build_analytics, day_means, MODES
+from forecast import forecast_trends, write_forecast
+
+#---------------------------------------------------------------------------------------------
+
+def time_call(func, repeat, number = None):
+    """time a function call
+    Input:
+        func (function): function without arguments
+        repeat (int): number of runs
+        number (int): calls per run, None calls fast functions often enough
+                      for a run to take at least 0.2s
+    Output:
+        timings (numpy array): wall-clock seconds per call of every run
+    """
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+
+    return np.array(timer.repeat(repeat, number)) / number
+
+def summarize(timings):
+    """
+    Input:
+        timings (numpy array): wall-clock seconds of every run
+    Output:
+        summary (dict): median, mean and min in milliseconds and the number of runs
+    """
+    return {'median_ms': float(np.median(timings) * 1e3),
+            'mean_ms': float(timings.mean() * 1e3),
+            'min_ms': float(timings.min() * 1e3),
+            'runs': len(timings)}
+
+def get_country_trend(trends_countries, country_names, country_name = 'United States'):
+    """filter trends by user-defined country, how the app looked up a country before the trend store
+    Input:
+        trends_countries (dataframe): hierarchical columns by 'country' and 'transportation type'
+                                      indexed are dates
+        country_names (list): a list of all country names in the Trends report
+        country_name (string): user defined country name
+    Output:
+        trends_country (dataframe): trends for user-specified country
+                                    indexed by date
+                                    columns are transportation type
+    """
+    if country_name not in country_names:
+        print('No Data available for ' + country_name + '.')
+        country_name = 'United States'
+
+    return trends_countries[country_name]
+
+def store_country_trend(store, country_name):
+    """get every series of a country from the trend store, how the app looks up a country now
+    Input:
+        store (TrendStore): the app's trend store
+        country_name (string): user defined country name
+    Output:
+        series (dict): transportation type -> date labels and values
+    """
+    country_name = store.resolve_country(country_name)
+
+    return {transportation: store.series(country_name, transportation, 0, store.n_history)
+            for transportation in store.country_transports[country_name]}
+
+def start_app(data_dir, code):
+    """run code in a new process that has the repository on its path, as a worker on startup
+    Input:
+        data_dir (string): directory the app finds ./data in
+        code (string): python statements, e.g. 'import application'
+    """
+    env = dict(os.environ, FIGURE_CACHE_WARM = '0', DATA_REFRESH_SECONDS = '0', WARM_UP = 'sync')
+    subprocess.run([sys.executable, '-W', 'ignore', '-c',
+                    'import sys; sys.path.insert(0, {!r}); {}'.format(REPO, code)],
+                   cwd = data_dir, env = env, check = True)
+
+def run_suite(data_dir, repeat):
+    """time every benchmark against the report in data_dir/data
+    Input:
+        data_dir (string): directory holding data/applemobilitytrends.csv and data/forecasted_trends.csv
+        repeat (int): number of runs of every benchmark
+    Output:
+        results (dict): benchmark name -> summary
+    """
+    results = {}
+    results['startup/import application'] = summarize(time_call(
+        lambda: start_app(data_dir, 'import application'), max(1, min(repeat, 3)), number = 1))
+    # what a worker does before it serves the dashboard: create the app and load the data
+    results['startup/create app and load data'] = summarize(time_call(
+        lambda: start_app(data_dir, 'import application; application.create_app()'),
+        max(1, min(repeat, 3)), number = 1))
+
+    trend_data = pd.read_csv(os.path.join(data_dir, 'data', 'applemobilitytrends.csv'), low_memory = False)
+    results['clean_data'] = summarize(time_call(lambda: clean_data(trend_data), repeat))
+
+    # import the app against the synthetic data
+    os.environ['FIGURE_CACHE_WARM'] = '0'
+    os.environ['DATA_REFRESH_SECONDS'] = '0'
+    os.environ['WARM_UP'] = 'sync'
+    os.chdir(data_dir)
+    import application
+
+    application.create_app()
+
+    trends_countries, country_names = clean_data(trend_data)
+    country = country_names[0]
+    store = application.dashboard_data.trend_store
+    results['get_country_trend'] = summarize(time_call(
+        lambda: get_country_trend(trends_countries, country_names, country), repeat))
+    results['get_country_trend/trend store'] = summarize(time_call(
+        lambda: store_country_trend(store, country), repeat))
+
+    labels = store.labels
+    history_range = (labels[min(10, store.n_history - 1)], labels[max(0, store.n_history - 10)])
+    forecast_range = (labels[max(0, store.n_history - 20)], labels[-5])
+    scenarios = {'history, full range': (False, None, None),
+                 'history, picked range': (False,) + history_range,
+                 'forecast, full range': (True, None, None),
+                 'forecast, picked range': (True,) + forecast_range}
+    for label, (include_forecast, start_date, end_date) in scenarios.items():
+        results['add_trend/' + label] = summarize(time_call(
+            lambda: application.add_trend(country, store, include_forecast, start_date, end_date), repeat))
+        pass
+
+    analytics = application.dashboard_data.analytics
+    for mode in MODES:
+        results['add_trend/' + mode] = summarize(time_call(
+            lambda: application.add_trend(country, store, True, None, None, None, mode, analytics), repeat))
+        pass
+    results['analytics/all countries'] = summarize(time_call(
+        lambda: build_analytics(store.values, store.n_history), repeat))
+
+    # what deriving the modes with pandas would cost for every request
+    def pandas_analytics():
+        country_trend = trends_countries[country]
+        average = country_trend.rolling(7, min_periods = 1).mean()
+        average - average.shift(7)
+        (country_trend - country_trend.mean()) / country_trend.std(ddof = 0)
+
+    results['analytics/pandas, one country'] = summarize(time_call(pandas_analytics, repeat))
+
+    # recoloring the map for a picked range: two prefix-sum columns per country against
+    # averaging every country's slice and rebuilding the choropleth
+    data = application.dashboard_data
+    first_day, last_day = store.day_range(history_range[0], history_range[1], False)
+    results['map colors/range means'] = summarize(time_call(
+        lambda: application.update_map_colors(history_range[0], history_range[1], 'No'), repeat))
+
+    def rebuild_map():
+        for c in store.country_names:
+            values = store.values[store.country_rows[c], :, first_day:last_day]
+            np.nanmean(values)
+            pass
+        application.build_map(store, data.map_means)
+
+    results['map colors/rebuild choropleth'] = summarize(time_call(rebuild_map, repeat))
+    # the colors of every day for the map timeline, one mean over the transportation types
+    country_values = store.values[[store.country_rows[c] for c in store.country_names]]
+    country_day_means = store.country_day_means
+
+    def build_map_frames():
+        store.country_day_means = day_means(country_values)
+        application.build_map_frames(store, data.fig_map)
+
+    results['map frames/all days'] = summarize(time_call(build_map_frames, repeat))
+    store.country_day_means = country_day_means
+
+    # ranking every country over a picked range, from two weeks of every series
+    transportation = next(iter(store.transport_slots))
+
+    def update_movers_uncached():
+        application.figure_cache.clear()
+        application.update_movers(transportation, history_range[0], history_range[1], 'countries', 'No')
+
+    results['update_movers/uncached'] = summarize(time_call(update_movers_uncached, repeat))
+
+    hover = {'points': [{'hovertext': country}]}
+
+    def update_trend_uncached():
+        application.figure_cache.clear()
+        application.update_trend(hover, 'Yes', None, None)
+
+    results['update_trend/uncached'] = summarize(time_call(update_trend_uncached, repeat))
+
+    # the country under the mouse and 4 pinned countries on a single transportation type
+    pinned = country_names[1:5]
+
+    def update_trend_pinned_uncached():
+        application.figure_cache.clear()
+        application.update_trend(hover, 'Yes', None, None, None, 'daily', pinned, transportation)
+
+    results['update_trend/5 countries uncached'] = summarize(time_call(update_trend_pinned_uncached, repeat))
+    application.update_trend(hover, 'Yes', None, None)
+    results['update_trend/cached'] = summarize(time_call(
+        lambda: application.update_trend(hover, 'Yes', None, None), repeat))
+    for radioitem_value in ['No', 'Yes']:
+        results['update_datepicker_range/' + radioitem_value] = summarize(time_call(
+            lambda: application.update_datepicker_range(radioitem_value), repeat))
+        pass
+
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = REPO, check = True,
+                              stdout = subprocess.PIPE, universal_newlines = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, threshold):
+    """print the change of every benchmark against a baseline
+    Input:
+        results (dict): benchmark name -> summary of this run
+        baseline (dict): benchmark name -> summary of a previous run
+        threshold (float): relative slowdown of the median flagged as a regression
+    Output:
+        regressions (list): names of the benchmarks that regressed
+    """
+    regressions = []
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        ratio = summary['median_ms'] / baseline[name]['median_ms']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        print('{:>36}: {:10.3f} ms -> {:10.3f} ms ({:+6.1%}) {}'.format(
+              name, baseline[name]['median_ms'], summary['median_ms'], ratio - 1, flag))
+        pass
+
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--regions', type = int, default = 300)
+    parser.add_argument('--days', type = int, default = 400)
+    parser.add_argument('--mix', type = parse_mix, default = GEO_MIX)
+    parser.add_argument('--transports', type = lambda text: text.split(','), default = TRANSPORTS)
+    parser.add_argument('--nan-density', type = float, default = 0.01)
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--out', default = os.path.join(REPO, 'benchmarks', 'results'))
+    parser.add_argument('--compare', default = None, help = 'results json of a previous run')
+    parser.add_argument('--threshold', type = float, default = 0.2)
+    args = parser.parse_args()
+
+    params = {'regions': args.regions, 'days': args.days, 'mix': args.mix,
+              'transports': args.transports, 'nan_density': args.nan_density, 'repeat': args.repeat}
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.makedirs(os.path.join(data_dir, 'data'))
+        csv_path = os.path.join(data_dir, 'data', 'applemobilitytrends.csv')
+        generate_report(csv_path, args.regions, args.days, args.mix, args.transports, args.nan_density)
+        # forecast the synthetic trends so the app finds a forecast file
+        trends_countries, _ = clean_data(pd.read_csv(csv_path, low_memory = False))
+        write_forecast(forecast_trends(trends_countries), os.path.join(data_dir, 'data', 'forecasted_trends.csv'))
+
+        results = run_suite(data_dir, args.repeat)
+        os.chdir(REPO)
+        pass
+
+    for name, summary in results.items():
+        print('{:>36}: median {:10.3f} ms, min {:10.3f} ms'.format(name, summary['median_ms'], summary['min_ms']))
+        pass
+
+    run = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'commit': git_commit(),
+           'python': platform.python_version(),
+           'machine': platform.machine(),
+           'params': params,
+           'results': results}
+    os.makedirs(args.out, exist_ok = True)
+    out_path = os.path.join(args.out, '{}-{}-{}r-{}d.json'.format(time.strftime('%Y%m%d-%H%M%S'), run['commit'],
+                                                                  args.regions, args.days))
+    with open(out_path, 'w') as f:
+        json.dump(run, f, indent = 2)
+        pass
+    print('Wrote ' + out_path)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+            pass
+        if baseline['params'] != params:
+            print('warning: baseline was run with different parameters')
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print('{} benchmarks regressed by more than {:.0%}'.format(len(regressions), args.threshold))
+            sys.exit(1)
@@ -0,0 +1,129 @@
+"""Generate a synthetic report in the Apple Mobility Trends format
+
+Usage:
+    python benchmarks/synthetic_report.py out.csv [--regions 5000] [--days 1826]
+        [--mix country/region=0.02,city=0.2,sub-region=0.5,county=0.28]
+        [--transports driving,transit,walking] [--nan-density 0.01]
+"""
+import argparse
+import time
+
+import pandas as pd
+import numpy as np
+
+#---------------------------------------------------------------------------------------------
+
+# share of regions of every geo_type, close to the published report
+GEO_MIX = {'country/region': 0.02, 'city': 0.2, 'sub-region': 0.5, 'county': 0.28}
+TRANSPORTS = ['driving', 'transit', 'walking']
+# countries of the published report, synthetic names are used past these
+COUNTRY_NAMES = ['United States', 'Albania', 'Argentina', 'Australia', 'Austria', 'Belgium', 'Brazil',
+                 'Bulgaria', 'Cambodia', 'Canada', 'Chile', 'Colombia', 'Croatia', 'Czech Republic',
+                 'Denmark', 'Egypt', 'Estonia', 'Finland', 'France', 'Germany', 'Greece', 'Hong Kong',
+                 'Hungary', 'Iceland', 'India', 'Indonesia', 'Ireland', 'Israel', 'Italy', 'Japan',
+                 'Latvia', 'Lithuania', 'Luxembourg', 'Macao', 'Malaysia', 'Mexico', 'Morocco',
+                 'Netherlands', 'New Zealand', 'Norway', 'Philippines', 'Poland', 'Portugal', 'Romania',
+                 'Russia', 'Saudi Arabia', 'Serbia', 'Singapore', 'Slovakia', 'Slovenia', 'South Africa',
+                 'Spain', 'Sweden', 'Switzerland', 'Taiwan', 'Thailand', 'Turkey', 'Ukraine',
+                 'United Arab Emirates', 'United Kingdom', 'Uruguay', 'Vietnam']
+# rows generated and written at once
+CHUNK_ROWS = 2000
+
+#---------------------------------------------------------------------------------------------
+
+def parse_mix(text):
+    """
+    Input:
+        text (string): geo_type=share pairs separated by commas
+    Output:
+        mix (dict): geo_type -> share
+    """
+    return {geo_type: float(share) for geo_type, share in
+            (pair.split('=') for pair in text.split(','))}
+
+def region_rows(n_regions, geo_mix, transports):
+    """
+    Input:
+        n_regions (int): number of regions
+        geo_mix (dict): geo_type -> share of the regions
+        transports (list): transportation types reported for every region
+    Output:
+        rows (dataframe): geo_type, region, transportation_type, alternative_name,
+                          sub-region and country of every row
+    """
+    total = sum(geo_mix.values())
+    counts = {geo_type: int(round(n_regions * share / total)) for geo_type, share in geo_mix.items()}
+    # every report has at least one country, so the dashboard has something to show
+    counts['country/region'] = max(1, counts.get('country/region', 0))
+    countries = [COUNTRY_NAMES[idx] if idx < len(COUNTRY_NAMES) else 'Country {}'.format(idx)
+                 for idx in range(counts['country/region'])]
+
+    rows = []
+    for geo_type, count in counts.items():
+        for idx in range(count):
+            if geo_type == 'country/region':
+                region, sub_region, country = countries[idx], '', ''
+            else:
+                country = countries[idx % len(countries)]
+                region = '{} {} {}'.format(country, geo_type, idx)
+                sub_region = '{} state {}'.format(country, idx % 50)
+            for transportation in transports:
+                rows.append((geo_type, region, transportation, '', sub_region, country))
+                pass
+            pass
+        pass
+
+    return pd.DataFrame(rows, columns = ['geo_type', 'region', 'transportation_type',
+                                         'alternative_name', 'sub-region', 'country'])
+
+def generate_report(path, n_regions = 300, n_days = 400, geo_mix = GEO_MIX, transports = TRANSPORTS,
+                    nan_density = 0.01, start_date = '2020-01-13', seed = 0):
+    """write a synthetic report with the published report's columns
+    every series is a baseline of 100 with a weekly season and a random walk
+    Input:
+        path (string): csv file path
+        n_regions (int): number of regions
+        n_days (int): number of days
+        geo_mix (dict): geo_type -> share of the regions
+        transports (list): transportation types reported for every region
+        nan_density (float): share of missing values
+        start_date (string): first day in %Y-%m-%d
+        seed (int): random seed
+    Output:
+        n_rows (int): number of rows written
+    """
+    rng = np.random.default_rng(seed)
+    rows = region_rows(n_regions, geo_mix, transports)
+    dates = [str(date)[:10] for date in pd.date_range(start_date, periods = n_days)]
+    weekly = 15 * np.sin(2 * np.pi * np.arange(n_days) / 7)
+
+    with open(path, 'w') as f:
+        f.write(','.join(list(rows.columns) + dates) + '\n')
+        for start in range(0, len(rows), CHUNK_ROWS):
+            chunk = rows.iloc[start:start + CHUNK_ROWS]
+            values = 100 + weekly + np.cumsum(rng.normal(0, 2, (len(chunk), n_days)), axis = 1)
+            values[rng.random(values.shape) < nan_density] = np.nan
+            frame = pd.concat([chunk.reset_index(drop = True),
+                               pd.DataFrame(np.round(values, 2), columns = dates)], axis = 1)
+            frame.to_csv(f, header = False, index = False, float_format = '%.2f')
+            pass
+        pass
+
+    return len(rows)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--regions', type = int, default = 300)
+    parser.add_argument('--days', type = int, default = 400)
+    parser.add_argument('--mix', type = parse_mix, default = GEO_MIX)
+    parser.add_argument('--transports', type = lambda text: text.split(','), default = TRANSPORTS)
+    parser.add_argument('--nan-density', type = float, default = 0.01)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    n_rows = generate_report(args.path, args.regions, args.days, args.mix, args.transports,
+                             args.nan_density, seed = args.seed)
+    print('Wrote {} rows x {} days to {} in {:.1f}s'.format(n_rows, args.days, args.path,
+                                                            time.perf_counter() - start))
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+#---------------------------------------------------------------------------------------------
+
+class FigureCache:
+    """size-bounded least-recently-used cache of finished figures
+    keys should include a data version so figures never outlive the data they show
+    """
+    def __init__(self, max_size = 512):
+        """
+        Input:
+            max_size (int): maximum number of cached figures
+        """
+        self.max_size = max_size
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(self, key, build):
+        """return a cached figure, building and caching it on a miss
+        Input:
+            key (tuple): normalized figure inputs, including the data version
+            build (function): function without arguments that returns the figure
+        Output:
+            figure (dict): cached or newly built figure
+        """
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                self.hits += 1
+
+                return self._figures[key]
+            self.misses += 1
+        # build outside the lock so slow figures don't block cache hits
+        figure = build()
+        self.put(key, figure)
+
+        return figure
+
+    def put(self, key, figure):
+        """add a figure, evicting the least recently used ones beyond max_size
+        Input:
+            key (tuple): normalized figure inputs, including the data version
+            figure (dict): figure to cache
+        """
+        with self._lock:
+            self._figures[key] = figure
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.max_size:
+                self._figures.popitem(last = False)
+                self.evictions += 1
+                pass
+
+    def clear(self):
+        """drop every cached figure, e.g. after the data was reloaded"""
+        with self._lock:
+            self._figures.clear()
+
+    def retain_version(self, version):
+        """drop figures of every other data version, keys must start with the version
+        Input:
+            version (string): data version to keep
+        """
+        with self._lock:
+            for key in [key for key in self._figures if key[0] != version]:
+                del self._figures[key]
+                pass
+
+    def stats(self):
+        """
+        Output:
+            stats (dict): cache size and hit, miss and eviction counters
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {'size': len(self._figures),
+                    'max_size': self.max_size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,293 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from mobility_data import load_trends
+from forecast import (holt_winters, fit_forecast, fill_gaps, write_forecast,
+                      ALPHAS, BETAS, GAMMAS, PHIS, HORIZON)
+
+#---------------------------------------------------------------------------------------------
+
+# series sent to a worker at once
+CHUNK_SIZE = 16
+
+#---------------------------------------------------------------------------------------------
+
+def neighbor_params(params):
+    """get the grid neighbors of previously fitted Holt-Winters parameters
+    Input:
+        params (numpy array): fitted parameters shaped (series, 4)
+    Output:
+        candidates (numpy array): previous parameters and their neighbors shaped (81, series, 4),
+                                  one step up or down each parameter's grid
+    """
+    axes = []
+    for idx, grid in enumerate([ALPHAS, BETAS, GAMMAS, PHIS]):
+        grid = np.array(grid)
+        position = np.abs(grid[None, :] - params[:, idx, None]).argmin(axis = 1)
+        axes.append(np.stack([grid[np.clip(position + step, 0, len(grid) - 1)]
+                              for step in [-1, 0, 1]]))
+        pass
+    # every combination of the three candidates per parameter
+    mesh = np.meshgrid(np.arange(3), np.arange(3), np.arange(3), np.arange(3), indexing = 'ij')
+    mesh = [axis.ravel() for axis in mesh]
+
+    return np.stack([axes[idx][mesh[idx]] for idx in range(4)], axis = -1)
+
+def fit_holt_winters(dates, values, warm_params, horizon):
+    """fit a chunk of series with Holt-Winters smoothing
+    series with previous parameters only search their neighborhood in the parameter grid
+    Input:
+        dates (list): historical dates in %Y-%m-%d
+        values (numpy array): series shaped (series, day)
+        warm_params (list): previous parameters of every series, None for a cold start
+        horizon (int): number of days to forecast
+    Output:
+        forecast (numpy array): forecasted series shaped (series, horizon)
+        params (list): fitted parameters of every series
+    """
+    forecast = np.full((len(values), horizon), np.nan)
+    params = np.zeros((len(values), 4))
+    warm = np.array([warm is not None for warm in warm_params], dtype = bool)
+    if (~warm).any():
+        forecast[~warm], params[~warm] = fit_forecast(values[~warm], horizon)
+    if warm.any():
+        filled = fill_gaps(values[warm])
+        filled[np.isnan(filled).all(axis = 1)] = 0
+        candidates = neighbor_params(np.array([warm_params[idx] for idx in np.flatnonzero(warm)]))
+        sse, _, _, _ = holt_winters(filled, candidates)
+        best = candidates[np.argmin(sse, axis = 0), np.arange(warm.sum())]
+        forecast[warm], params[warm] = fit_forecast(values[warm], horizon, params = best)
+
+    return forecast, params.tolist()
+
+def fit_prophet(dates, values, warm_params, horizon):
+    """fit a chunk of series with Prophet, one series at a time
+    previous parameters initialize the optimizer
+    Input:
+        dates (list): historical dates in %Y-%m-%d
+        values (numpy array): series shaped (series, day)
+        warm_params (list): previous parameters of every series, None for a cold start
+        horizon (int): number of days to forecast
+    Output:
+        forecast (numpy array): forecasted series shaped (series, horizon)
+        params (list): fitted parameters of every series
+    """
+    from prophet import Prophet
+
+    forecast = np.full((len(values), horizon), np.nan)
+    params = []
+    for idx, series in enumerate(values):
+        history = pd.DataFrame({'ds': pd.to_datetime(dates), 'y': series}).dropna()
+        if len(history) < 2:
+            params.append(None)
+            continue
+        model = Prophet(weekly_seasonality = True, yearly_seasonality = False, daily_seasonality = False)
+        init = None
+        if warm_params[idx] is not None:
+            init = {name: np.array(value) if isinstance(value, list) else value
+                    for name, value in warm_params[idx].items()}
+        model.fit(history, init = init)
+        future = model.make_future_dataframe(periods = horizon, include_history = False)
+        forecast[idx] = model.predict(future)['yhat'].to_numpy()
+        # keep the point estimates to warm-start the next run
+        params.append({'k': float(model.params['k'][0][0]),
+                       'm': float(model.params['m'][0][0]),
+                       'sigma_obs': float(model.params['sigma_obs'][0][0]),
+                       'delta': model.params['delta'][0].tolist(),
+                       'beta': model.params['beta'][0].tolist()})
+        pass
+
+    return forecast, params
+
+MODELS = {'holt-winters': fit_holt_winters,
+          'prophet': fit_prophet}
+
+def fit_chunk(model, dates, values, warm_params, horizon):
+    """fit a chunk of series in a worker process
+    Input:
+        model (string): name of a model in MODELS
+        dates (list): historical dates in %Y-%m-%d
+        values (numpy array): series shaped (series, day)
+        warm_params (list): previous parameters of every series, None for a cold start
+        horizon (int): number of days to forecast
+    Output:
+        forecast (numpy array): forecasted series shaped (series, horizon)
+        params (list): fitted parameters of every series
+        seconds (float): wall-clock fit time of the chunk
+    """
+    start = time.perf_counter()
+    forecast, params = MODELS[model](dates, values, warm_params, horizon)
+
+    return forecast, params, time.perf_counter() - start
+
+#---------------------------------------------------------------------------------------------
+
+def series_digest(values, model, horizon):
+    """
+    Input:
+        values (numpy array): a single series
+        model (string): name of a model in MODELS
+        horizon (int): number of days to forecast
+    Output:
+        digest (string): changes whenever the fit input does
+    """
+    digest = hashlib.blake2b(digest_size = 16)
+    digest.update('{}:{}:'.format(model, horizon).encode('utf-8'))
+    digest.update(np.ascontiguousarray(values, dtype = '<f8').tobytes())
+
+    return digest.hexdigest()
+
+def read_state(path, model):
+    """read the fitted state of a previous run
+    parameters of one model can't warm-start another, so a state written by another
+    model, or by a version that didn't record its model, is a cold start
+    Input:
+        path (string): state file path
+        model (string): name of the model in MODELS this run fits
+    Output:
+        state (dict): (country, transportation type) -> digest, params and forecast,
+                      empty if there was no previous run of the model
+    """
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        previous = json.load(f)
+        pass
+    if previous.get('model') != model:
+        return {}
+
+    return {(entry['country'], entry['transportation_type']): entry for entry in previous['series']}
+
+def write_state(state, path, model):
+    """write the fitted state of this run
+    Input:
+        state (dict): (country, transportation type) -> digest, params and forecast
+        path (string): state file path
+        model (string): name of the model in MODELS that fitted the params
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'model': model, 'series': list(state.values())}, f)
+        pass
+    os.replace(tmp_path, path)
+
+def run_pipeline(trends, out_path, state_path = None, model = 'holt-winters',
+                 workers = None, chunk_size = CHUNK_SIZE, horizon = HORIZON):
+    """forecast every series across a process pool and write the forecast file
+    series whose input didn't change since the last run reuse their previous forecast,
+    the others are refit starting from their previous parameters
+    Input:
+        trends (dataframe): hierarchical columns by 'country' and 'transportation type'
+                            indexed are dates
+        out_path (string): forecast csv path, written atomically
+        state_path (string): state file path, None to always fit every series from scratch
+        model (string): name of a model in MODELS
+        workers (int): number of worker processes, 1 fits in this process,
+                       None uses every core
+        chunk_size (int): number of series sent to a worker at once
+        horizon (int): number of days to forecast
+    Output:
+        forecast_countries (dataframe): forecasted trends
+        report (dict): wall-clock seconds, number of refit and reused series and
+                       the fit seconds of every chunk with the series in it
+    """
+    start = time.perf_counter()
+    values = trends.to_numpy(dtype = float).T
+    dates = [str(date)[:10] for date in trends.index]
+    previous = read_state(state_path, model)
+
+    # find the series whose input changed since the last run
+    state = {}
+    changed = []
+    for idx, (country, transportation) in enumerate(trends.columns):
+        digest = series_digest(values[idx], model, horizon)
+        entry = previous.get((country, transportation))
+        if entry is not None and entry['digest'] == digest:
+            state[(country, transportation)] = entry
+        else:
+            changed.append(idx)
+            state[(country, transportation)] = {'country': country,
+                                                'transportation_type': transportation,
+                                                'digest': digest,
+                                                'params': entry['params'] if entry else None}
+        pass
+
+    # fit changed series in chunks
+    chunks = [changed[idx:idx + chunk_size] for idx in range(0, len(changed), chunk_size)]
+    tasks = [(model, dates, values[chunk],
+              [state[trends.columns[idx]]['params'] for idx in chunk], horizon)
+             for chunk in chunks]
+    if workers == 1:
+        results = [fit_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            results = list(executor.map(fit_chunk, *zip(*tasks))) if tasks else []
+            pass
+
+    # a chunk is fit at once, holt-winters even in a single array operation, so only chunks are timed
+    chunk_seconds = []
+    for chunk, (forecast, params, seconds) in zip(chunks, results):
+        for position, idx in enumerate(chunk):
+            entry = state[trends.columns[idx]]
+            entry['params'] = params[position]
+            entry['forecast'] = [None if np.isnan(value) else value for value in forecast[position].tolist()]
+            pass
+        chunk_seconds.append({'series': [trends.columns[idx] for idx in chunk], 'seconds': seconds})
+        pass
+
+    last_date = pd.Timestamp(dates[-1])
+    forecast_countries = pd.DataFrame(np.array([state[column]['forecast'] for column in trends.columns],
+                                               dtype = float).T.round(2),
+                                      index = pd.date_range(last_date + pd.Timedelta(days = 1), periods = horizon),
+                                      columns = trends.columns)
+    forecast_countries.columns.names = ['country', 'transportation_type']
+    write_forecast(forecast_countries, out_path)
+    if state_path is not None:
+        write_state(state, state_path, model)
+
+    report = {'seconds': time.perf_counter() - start,
+              'refit': len(changed),
+              'reused': len(state) - len(changed),
+              'chunk_seconds': chunk_seconds}
+
+    return forecast_countries, report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Forecast every series across a process pool.')
+    parser.add_argument('csv_path', nargs = '?', default = './data/applemobilitytrends.csv')
+    parser.add_argument('forecast_path', nargs = '?', default = './data/forecasted_trends.csv')
+    parser.add_argument('--state', default = None, help = 'defaults to <forecast_path>.state.json')
+    parser.add_argument('--model', choices = sorted(MODELS), default = 'holt-winters')
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--chunk-size', type = int, default = CHUNK_SIZE)
+    parser.add_argument('--horizon', type = int, default = HORIZON)
+    args = parser.parse_args()
+
+    trends_countries, _ = load_trends(args.csv_path)
+    _, report = run_pipeline(trends_countries, args.forecast_path,
+                             state_path = args.state or args.forecast_path + '.state.json',
+                             model = args.model,
+                             workers = args.workers,
+                             chunk_size = args.chunk_size,
+                             horizon = args.horizon)
+
+    print('Refit {} series, reused {} in {:.2f}s'.format(report['refit'], report['reused'], report['seconds']))
+    if report['chunk_seconds']:
+        chunks = sorted(report['chunk_seconds'], key = lambda chunk: chunk['seconds'], reverse = True)
+        chunk_seconds = pd.Series([chunk['seconds'] for chunk in chunks])
+        print('per-chunk fit time (up to {} series): median {:.1f} ms, p95 {:.1f} ms, max {:.1f} ms'.format(
+              args.chunk_size, chunk_seconds.median() * 1e3, chunk_seconds.quantile(0.95) * 1e3,
+              chunk_seconds.max() * 1e3))
+        print('slowest chunks:')
+        for chunk in chunks[:5]:
+            first, last = chunk['series'][0], chunk['series'][-1]
+            print('  {} / {} to {} / {} ({} series): {:.1f} ms'.format(
+                  *first, *last, len(chunk['series']), chunk['seconds'] * 1e3))
+            pass
@@ -0,0 +1,199 @@
+import numpy as np
+
+from mobility_data import REPORT_COLUMNS, to_day
+
+#---------------------------------------------------------------------------------------------
+
+class GeoIndex:
+    """hierarchy of the report's regions within countries, pointing at rows of a compact value array
+    every geography is a sub-region, city or county under a country, or under a sub-region of
+    it. values are shaped (series, day) with one row per reported series, so nothing is padded
+    for transportation types a region doesn't report. sub-regions that only appear as the
+    sub-region of a city or county have no series of their own.
+    geographies are numbered in report order; keys, names and aliases resolve to numbers
+    through dictionaries, so lookups never filter a dataframe
+    """
+    def __init__(self, region_data, dtype = np.float64):
+        """
+        Input:
+            region_data (dataframe): sub-region, city and county rows of the report
+                                     with all of its columns
+            dtype (numpy dtype): dtype of the values
+        """
+        self.keys, self.names, self.geo_types, self.countries = [], [], [], []
+        self.parents, self.alternative_names, self.series_rows = [], [], []
+        ids = {}
+
+        def add(geo_type, country, sub_region, name, alternative_name):
+            key = '|'.join([geo_type, country, sub_region, name])
+            if key not in ids:
+                # cities, counties and nested sub-regions are under the sub-region they're in
+                parent = add('sub-region', country, '', sub_region, '') if sub_region else -1
+                ids[key] = len(self.keys)
+                self.keys.append(key)
+                self.names.append(name)
+                self.geo_types.append(geo_type)
+                self.countries.append(country)
+                self.parents.append(parent)
+                self.alternative_names.append('')
+                self.series_rows.append({})
+            geo = ids[key]
+            if alternative_name:
+                self.alternative_names[geo] = alternative_name
+
+            return geo
+
+        meta = region_data[REPORT_COLUMNS].fillna('').astype(str)
+        for row, (geo_type, name, transportation, alternative_name, sub_region, country) in \
+                enumerate(meta.itertuples(index = False)):
+            # a sub-region row may name itself as its sub-region
+            if geo_type == 'sub-region' and sub_region == name:
+                sub_region = ''
+            self.series_rows[add(geo_type, country, sub_region, name, alternative_name)][transportation] = row
+            pass
+
+        # report values are % of baseline, shift them to % change like the country trends
+        dates = region_data.columns.drop(REPORT_COLUMNS)
+        # one contiguous row per series, so slicing a series reads adjacent memory
+        self.values = np.ascontiguousarray(region_data[dates].to_numpy(dtype = dtype))
+        self.values -= 100
+        self.days = np.array([to_day(date) for date in dates], dtype = 'datetime64[D]')
+        self._index()
+
+    def to_header(self):
+        """
+        Output:
+            header (dict): json-serializable geographies and days, everything but the values
+        """
+        return {'keys': self.keys,
+                'names': self.names,
+                'geo_types': self.geo_types,
+                'countries': self.countries,
+                'parents': self.parents,
+                'alternative_names': self.alternative_names,
+                'series_rows': self.series_rows,
+                'days': self.day_labels.tolist()}
+
+    @classmethod
+    def from_header(cls, header, values):
+        """
+        Input:
+            header (dict): header written by to_header
+            values (numpy array): values shaped (series, day), e.g. memory-mapped
+        Output:
+            regions (GeoIndex): index over the values
+        """
+        regions = cls.__new__(cls)
+        for name in ['keys', 'names', 'geo_types', 'countries', 'parents', 'alternative_names', 'series_rows']:
+            setattr(regions, name, header[name])
+            pass
+        regions.values = values
+        regions.days = np.array(header['days'], dtype = 'datetime64[D]')
+        regions._index()
+
+        return regions
+
+    def _index(self):
+        self.day_labels = self.days.astype(str).astype(object)
+        self.ids = {key: geo for geo, key in enumerate(self.keys)}
+        # names and alternative names, case-insensitive; names like Springfield are shared
+        self.by_name = {}
+        for geo, (name, alternative_name) in enumerate(zip(self.names, self.alternative_names)):
+            for alias in {name.casefold(), alternative_name.casefold()} - {''}:
+                self.by_name.setdefault(alias, []).append(geo)
+                pass
+            pass
+        # geographies reporting each transportation type and the rows of their series,
+        # for comparing all of them at once
+        transport_series = {}
+        for geo, series_rows in enumerate(self.series_rows):
+            for transportation, row in series_rows.items():
+                transport_series.setdefault(transportation, []).append((geo, row))
+                pass
+            pass
+        self.transport_series = {transportation: tuple(np.array(column, dtype = np.int64) for column in zip(*pairs))
+                                 for transportation, pairs in transport_series.items()}
+        self.children = [[] for _ in self.keys]
+        top_level = {}
+        for geo, parent in enumerate(self.parents):
+            if parent < 0:
+                top_level.setdefault(self.countries[geo], []).append(geo)
+            else:
+                self.children[parent].append(geo)
+            pass
+        # every region of a country, each sub-region followed by the regions in it
+        self.country_regions = {}
+        self.labels = [None] * len(self.keys)
+
+        def walk(geo, path, regions):
+            self.labels[geo] = path + self.names[geo]
+            regions.append(geo)
+            for child in self.children[geo]:
+                walk(child, self.labels[geo] + ' / ', regions)
+                pass
+
+        for country, geos in top_level.items():
+            self.country_regions[country] = []
+            for geo in geos:
+                walk(geo, '', self.country_regions[country])
+                pass
+            pass
+
+    def lookup(self, key):
+        """
+        Input:
+            key (string): geography key, see keys
+        Output:
+            geo (int): geography number, None if there is no such geography
+        """
+        return self.ids.get(key)
+
+    def find(self, name):
+        """
+        Input:
+            name (string): name or alternative name of a geography, in any case
+        Output:
+            geos (list): numbers of every geography with that name
+        """
+        return self.by_name.get(name.casefold(), [])
+
+    def regions_of(self, country):
+        """
+        Input:
+            country (string): country name
+        Output:
+            geos (list): every region of the country, each sub-region followed by the regions in it
+        """
+        return self.country_regions.get(country, [])
+
+    def day_range(self, start_date, end_date):
+        """resolve a date range to day offsets
+        Input:
+            start_date (string): start date in %Y-%m-%d, None for the first day
+            end_date (string): end date in %Y-%m-%d, None for the last day
+        Output:
+            first_day (int): offset of the first selected day
+            last_day (int): offset after the last selected day
+        """
+        first_day = 0 if start_date is None else int(np.searchsorted(self.days, to_day(start_date), 'left'))
+        last_day = len(self.days) if end_date is None else int(np.searchsorted(self.days, to_day(end_date), 'right'))
+
+        return min(first_day, last_day), last_day
+
+    def series(self, geo, transportation, first_day, last_day):
+        """get a single series
+        Input:
+            geo (int): geography number
+            transportation (string): transportation type
+            first_day (int): offset of the first day
+            last_day (int): offset after the last day
+        Output:
+            x (numpy array): date labels in %Y-%m-%d
+            y (numpy array): % change from baseline
+        """
+        y = self.values[self.series_rows[geo][transportation], first_day:last_day]
+        # float32 values are widened and rounded to the report's 2 decimals like the trend store's
+        if y.dtype != np.float64:
+            y = np.round(y.astype(np.float64), 2)
+
+        return self.day_labels[first_day:last_day], y
@@ -0,0 +1,30 @@
+import argparse
+import time
+
+from mobility_data import read_country_rows, clean_data, write_snapshot
+
+#---------------------------------------------------------------------------------------------
+
+def make_snapshot(csv_path, snapshot_path):
+    """convert an Apple Mobility Trends report into a binary snapshot
+    Input:
+        csv_path (string): path to the Apple Mobility Trends report
+        snapshot_path (string): path of the snapshot file to write
+    """
+    start = time.perf_counter()
+    trend_data = read_country_rows(csv_path)
+    trends_countries, country_names = clean_data(trend_data)
+    write_snapshot(trends_countries, country_names, snapshot_path)
+    print('Wrote {} series x {} days to {} in {:.2f}s'.format(trends_countries.shape[1],
+                                                              trends_countries.shape[0],
+                                                              snapshot_path,
+                                                              time.perf_counter() - start))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Convert an Apple Mobility Trends report into a snapshot.')
+    parser.add_argument('csv_path', nargs = '?', default = './data/applemobilitytrends.csv')
+    parser.add_argument('snapshot_path', nargs = '?', default = None,
+                        help = 'defaults to <csv_path>.snapshot')
+    args = parser.parse_args()
+
+    make_snapshot(args.csv_path, args.snapshot_path or args.csv_path + '.snapshot')
@@ -0,0 +1,140 @@
+import bisect
+import os
+import resource
+import sys
+import threading
+import time
+
+#---------------------------------------------------------------------------------------------
+
+# upper bounds in seconds of the stage timing histogram buckets
+SECONDS_BUCKETS = [0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+#---------------------------------------------------------------------------------------------
+
+def memory_usage():
+    """
+    Output:
+        rss (int): resident memory of this process in bytes, None without /proc
+        peak_rss (int): highest resident memory of this process so far in bytes
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    if sys.platform != 'darwin':
+        peak_rss *= 1024
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        rss = None
+
+    return rss, peak_rss
+
+class StageTimer:
+    """context manager recording the time spent in its block to a stage"""
+    __slots__ = ['metrics', 'stage', 'start']
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+class Metrics:
+    """stage timings and payload sizes, exposed in the Prometheus text format
+    recording only adds to a few counters; the text is only built when it's scraped
+    """
+    def __init__(self, prefix = 'mobility'):
+        """
+        Input:
+            prefix (string): prefix of every metric name
+        """
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # stage -> [per-bucket counts, sum, count]
+        self._stages = {}
+        # name -> [sum, count]
+        self._payloads = {}
+
+    def timer(self, stage):
+        """
+        Input:
+            stage (string): stage name
+        Output:
+            timer (StageTimer): context manager timing its block
+        """
+        return StageTimer(self, stage)
+
+    def observe(self, stage, seconds):
+        """record the duration of a stage
+        Input:
+            stage (string): stage name
+            seconds (float): wall-clock duration
+        """
+        bucket = bisect.bisect_left(SECONDS_BUCKETS, seconds)
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = [[0] * (len(SECONDS_BUCKETS) + 1), 0.0, 0]
+            entry[0][bucket] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    def observe_payload(self, name, size):
+        """record the size of a payload
+        Input:
+            name (string): what the payload is, e.g. a callback output
+            size (int): payload size in bytes
+        """
+        with self._lock:
+            entry = self._payloads.setdefault(name, [0, 0])
+            entry[0] += size
+            entry[1] += 1
+
+    def render(self, extra = None):
+        """
+        Input:
+            extra (dict): other counters and gauges to include, metric name -> value
+        Output:
+            text (string): every metric in the Prometheus text exposition format
+        """
+        with self._lock:
+            stages = {stage: (list(counts), total, count) for stage, (counts, total, count) in self._stages.items()}
+            payloads = {name: tuple(entry) for name, entry in self._payloads.items()}
+
+        name = self.prefix + '_stage_seconds'
+        lines = ['# HELP {} Time spent in every startup, reload and callback stage.'.format(name),
+                 '# TYPE {} histogram'.format(name)]
+        for stage, (counts, total, count) in sorted(stages.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(SECONDS_BUCKETS + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(name, stage, bound, cumulative))
+                pass
+            lines.append('{}_sum{{stage="{}"}} {!r}'.format(name, stage, total))
+            lines.append('{}_count{{stage="{}"}} {}'.format(name, stage, count))
+            pass
+
+        name = self.prefix + '_payload_bytes'
+        lines += ['# HELP {} Uncompressed size of responses.'.format(name),
+                  '# TYPE {} summary'.format(name)]
+        for payload, (total, count) in sorted(payloads.items()):
+            lines.append('{}_sum{{payload="{}"}} {}'.format(name, payload, total))
+            lines.append('{}_count{{payload="{}"}} {}'.format(name, payload, count))
+            pass
+
+        for metric, value in sorted((extra or {}).items()):
+            lines.append('{}_{} {!r}'.format(self.prefix, metric, value))
+            pass
+
+        return '\n'.join(lines) + '\n'
+
+# shared by the app and the data loaders
+stage_metrics = Metrics()
@@ -0,0 +1,91 @@
+import cProfile
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+
+import flask
+
+#---------------------------------------------------------------------------------------------
+
+class RequestProfiler:
+    """profile sampled requests with cProfile and keep the latest profiles in a directory
+    every profile is saved as <name>.prof, readable with pstats or snakeviz, next to
+    <name>.json holding the request body that produced it. nothing is registered on the
+    app unless the profiler is attached, so a disabled profiler costs nothing
+    """
+    def __init__(self, directory, sample_every = 0, header = 'X-Profile', keep = 100):
+        """
+        Input:
+            directory (string): directory the profiles are written to
+            sample_every (int): profile 1 in this many requests, 0 only profiles
+                                requests with the header
+            header (string): requests with this header are always profiled
+            keep (int): number of most recent profiles kept
+        """
+        os.makedirs(directory, exist_ok = True)
+        self.directory = directory
+        self.sample_every = sample_every
+        self.header = header
+        self.keep = keep
+        self._requests = itertools.count(1)
+        self._profiles = itertools.count(1)
+        # only one profile at a time, newer pythons allow a single active profiler
+        self._busy = threading.Lock()
+
+    def init_app(self, server, path):
+        """profile requests to a path of a flask server
+        Input:
+            server (flask app): server to attach to
+            path (string): request path to profile, e.g. the dash callback route
+        """
+        @server.before_request
+        def start_profile():
+            if flask.request.path != path:
+                return
+            sampled = self.sample_every and next(self._requests) % self.sample_every == 0
+            if not (sampled or self.header in flask.request.headers):
+                return
+            if not self._busy.acquire(blocking = False):
+                return
+            flask.g.profile = cProfile.Profile()
+            flask.g.profile_start = time.perf_counter()
+            flask.g.profile.enable()
+
+        @server.after_request
+        def stop_profile(response):
+            profile = flask.g.pop('profile', None)
+            if profile is None:
+                return response
+            profile.disable()
+            try:
+                self.save(profile, time.perf_counter() - flask.g.profile_start, flask.request.get_json(silent = True))
+            finally:
+                self._busy.release()
+
+            return response
+
+    def save(self, profile, seconds, request_body):
+        """write a profile and the request that produced it, then drop the oldest profiles
+        Input:
+            profile (cProfile.Profile): finished profile
+            seconds (float): wall-clock duration of the request
+            request_body (dict): callback request body
+        """
+        output = (request_body or {}).get('output', 'request')
+        name = '{}-{}-{:.0f}ms-{}'.format(time.strftime('%Y%m%d-%H%M%S'), next(self._profiles), seconds * 1e3,
+                                          ''.join(c if c.isalnum() else '_' for c in output).strip('_')[:60])
+        path = os.path.join(self.directory, name)
+        profile.dump_stats(path + '.prof')
+        with open(path + '.json', 'w') as f:
+            json.dump({'seconds': seconds, 'request': request_body}, f, indent = 2)
+            pass
+
+        profiles = sorted(glob.glob(os.path.join(self.directory, '*.prof')), key = os.path.getmtime)
+        for old_path in profiles[:-self.keep] if self.keep else []:
+            os.remove(old_path)
+            if os.path.exists(old_path[:-len('.prof')] + '.json'):
+                os.remove(old_path[:-len('.prof')] + '.json')
+            pass
@@ -0,0 +1,91 @@
+import fcntl
+import glob
+import json
+import os
+from contextlib import contextmanager
+
+from trend_store import TrendStore
+
+#---------------------------------------------------------------------------------------------
+
+class SharedStore:
+    """trend stores published as memory-mapped files in a directory shared by worker processes
+    one process loads a data version and publishes it, every process attaches to the current
+    file read-only, so the values are in memory once however many workers there are.
+    the current version is a pointer file swapped atomically; older files are removed after
+    the swap, so processes attach while holding the loader lock and keep the files they
+    mapped alive until they attach to a new one
+    """
+    def __init__(self, directory):
+        """
+        Input:
+            directory (string): directory shared by the workers, e.g. /dev/shm/mobility
+        """
+        os.makedirs(directory, exist_ok = True)
+        self.directory = directory
+        self.pointer_path = os.path.join(directory, 'current.json')
+        self.lock_path = os.path.join(directory, 'loader.lock')
+
+    @contextmanager
+    def lock(self):
+        """hold the loader lock, so only one process loads a data version at a time"""
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            pass
+
+    def current(self):
+        """
+        Output:
+            pointer (dict): file name and source stamp of the current store,
+                            None before the first publish
+        """
+        try:
+            with open(self.pointer_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def is_current(self, stamp):
+        """
+        Input:
+            stamp (tuple): stamp of the data source
+        Output:
+            current (boolean): whether or not the current store was loaded from that stamp
+        """
+        pointer = self.current()
+
+        return pointer is not None and pointer['stamp'] == list(stamp)
+
+    def publish(self, store, stamp):
+        """write a store and make it the current one
+        Input:
+            store (TrendStore): store to publish
+            stamp (tuple): stamp of the data source the store was loaded from
+        """
+        file_name = 'store-{}.bin'.format(store.version)
+        path = os.path.join(self.directory, file_name)
+        if not os.path.exists(path):
+            store.save(path)
+        # swap the pointer in a single rename so attaching workers never see a partial one
+        tmp_path = self.pointer_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'file': file_name, 'stamp': list(stamp)}, f)
+            pass
+        os.replace(tmp_path, self.pointer_path)
+
+        # remove stores no worker will attach to anymore
+        for old_path in glob.glob(os.path.join(self.directory, 'store-*.bin')):
+            if os.path.basename(old_path) != file_name:
+                os.remove(old_path)
+            pass
+
+    def attach(self):
+        """map the current store, call it while holding the lock so no publish removes its file first
+        Output:
+            store (TrendStore): current store, memory-mapped read-only
+        """
+        return TrendStore.open(os.path.join(self.directory, self.current()['file']))
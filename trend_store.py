@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from mobility_data import SNAPSHOT_ALIGN, to_day
+from geo_index import GeoIndex
+from analytics import RangeMeans
+
+#---------------------------------------------------------------------------------------------
+
+# every store file starts with this tag followed by the header length
+STORE_MAGIC = b'MTSTORE1'
+
+#---------------------------------------------------------------------------------------------
+
+class TrendStore:
+    """dense array of historical and forecasted trends on one stitched timeline
+    values are shaped (country, transportation type, day); days before n_history are
+    historical, the rest are forecasted. series missing from the report are NaN
+    version is a digest of the timeline and values, it changes whenever the data does.
+    regions within countries are kept in a geo index next to the countries, if loaded,
+    and views derived from the values in analytics, mode -> array shaped like the values, if built.
+    country_means are the range means of the countries in country_names and country_day_means
+    their means on every day, shaped (country, day), if built
+    """
+    def __init__(self, trends, forecast, country_names, default_country = 'United States',
+                 dtype = np.float64, regions = None):
+        """
+        Input:
+            trends (dataframe): historical trends for all countries
+                                hierarchical columns by 'country' and 'transportation type'
+                                indexed are dates
+            forecast (dataframe): forecasted trends for all countries
+                                  hierarchical columns by 'country' and 'transportation type'
+                                  indexed are dates
+            country_names (list): a list of all country names in the Trends report
+            default_country (string): country shown when a country has no data
+            dtype (numpy dtype): dtype of the values, float32 halves the store
+            regions (GeoIndex): historical trends of regions within countries, None without regions
+        """
+        self.country_names = list(country_names)
+        self.regions = regions
+        self.analytics = None
+        self.country_means = None
+        self.country_day_means = None
+        self.default_country = default_country
+        # stitch historical and forecasted dates, forecast only covers days after history
+        history_days = np.array([to_day(date) for date in trends.index], dtype = 'datetime64[D]')
+        forecast_days = np.array([to_day(date) for date in forecast.index], dtype = 'datetime64[D]')
+        forecast_days = forecast_days[forecast_days > history_days[-1]]
+        self.n_history = len(history_days)
+        self.days = np.concatenate([history_days, forecast_days])
+        self.labels = self.days.astype(str).astype(object)
+
+        # map countries to rows and transportation types to slots
+        countries = list(dict.fromkeys(list(trends.columns.get_level_values(0)) +
+                                       list(forecast.columns.get_level_values(0))))
+        transportation_types = sorted(set(trends.columns.get_level_values(1)) |
+                                      set(forecast.columns.get_level_values(1)))
+        self.country_rows = {country: idx for idx, country in enumerate(countries)}
+        self.transport_slots = {transportation: idx for idx, transportation in enumerate(transportation_types)}
+
+        # scatter both timelines into the dense array
+        self.values = np.full((len(countries), len(transportation_types), len(self.days)), np.nan,
+                              dtype = dtype)
+        self._scatter(trends, 0, self.n_history)
+        self._scatter(forecast.iloc[len(forecast) - len(forecast_days):, :],
+                      self.n_history, len(self.days))
+
+        # transportation types reported for each country, in report order
+        self.country_transports = {}
+        for country, transportation in trends.columns:
+            self.country_transports.setdefault(country, []).append(transportation)
+            pass
+
+        # stamp the data so caches can tell versions apart
+        digest = hashlib.blake2b(digest_size = 8)
+        digest.update(self.days.tobytes())
+        digest.update(self.values.tobytes())
+        if regions is not None:
+            digest.update(json.dumps(regions.keys).encode('utf-8'))
+            digest.update(np.ascontiguousarray(regions.values).data)
+        self.version = digest.hexdigest()
+
+    def save(self, path):
+        """write the store to a file that processes can memory-map with open
+        the file holds a magic tag, the header length, a json header and then the
+        little-endian values array, aligned like a trends snapshot, followed by the
+        aligned arrays of the analytics, the country means and the values of the regions
+        if there are any
+        Input:
+            path (string): store file path
+        """
+        dtype = self.values.dtype.newbyteorder('<').str
+        header = {'dtype': dtype,
+                  'shape': list(self.values.shape),
+                  'version': self.version,
+                  'days': self.labels.tolist(),
+                  'n_history': self.n_history,
+                  'countries': list(self.country_rows),
+                  'transportation_types': list(self.transport_slots),
+                  'country_transports': self.country_transports,
+                  'country_names': self.country_names,
+                  'default_country': self.default_country}
+        # every array after the values starts at the next aligned offset, counted from the values
+        sections = []
+        end = self.values.nbytes
+
+        def section(values, section_dtype):
+            nonlocal end
+            offset = end + (-end % SNAPSHOT_ALIGN)
+            sections.append((values, section_dtype))
+            end = offset + np.dtype(section_dtype).itemsize * values.size
+
+            return offset
+
+        if self.analytics is not None:
+            # written in the values' dtype
+            header['analytics'] = {mode: section(derived, dtype) for mode, derived in self.analytics.items()}
+        if self.country_means is not None:
+            header['country_means'] = {'shape': list(self.country_means.sums.shape),
+                                       'sums': section(self.country_means.sums, '<f8'),
+                                       'counts': section(self.country_means.counts, '<i8')}
+        if self.country_day_means is not None:
+            header['country_day_means'] = {'shape': list(self.country_day_means.shape),
+                                           'offset': section(self.country_day_means, '<f8')}
+        if self.regions is not None:
+            header['regions'] = dict(self.regions.to_header(), shape = list(self.regions.values.shape),
+                                     offset = section(self.regions.values, dtype))
+        header = json.dumps(header).encode('utf-8')
+        # pad the header so the array starts on an aligned offset
+        header = header + b' ' * (-(len(STORE_MAGIC) + 8 + len(header)) % SNAPSHOT_ALIGN)
+
+        # write to a temporary file first so readers never see a partial store
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(STORE_MAGIC)
+            f.write(len(header).to_bytes(8, 'little'))
+            f.write(header)
+            f.write(np.ascontiguousarray(self.values, dtype = dtype).tobytes())
+            for values, section_dtype in sections:
+                f.write(b'\0' * (-f.tell() % SNAPSHOT_ALIGN))
+                # written from the arrays' buffers, regions are the bulk of the file
+                f.write(np.ascontiguousarray(values, dtype = section_dtype).data)
+                pass
+            pass
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path):
+        """memory-map a store written by save, the values are shared with every process
+        that opens the same file and are read-only
+        Input:
+            path (string): store file path
+        Output:
+            store (TrendStore): store backed by the file
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+                raise ValueError(path + ' is not a trend store.')
+            header_size = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_size).decode('utf-8'))
+            pass
+
+        def section(dtype, offset, shape):
+            return np.memmap(path, dtype = dtype, mode = 'r', offset = len(STORE_MAGIC) + 8 + header_size + offset,
+                             shape = tuple(shape))
+
+        store = cls.__new__(cls)
+        store.country_names = header['country_names']
+        store.default_country = header['default_country']
+        store.n_history = header['n_history']
+        store.days = np.array(header['days'], dtype = 'datetime64[D]')
+        store.labels = store.days.astype(str).astype(object)
+        store.country_rows = {country: idx for idx, country in enumerate(header['countries'])}
+        store.transport_slots = {transportation: idx for idx, transportation
+                                 in enumerate(header['transportation_types'])}
+        store.values = section(header['dtype'], 0, header['shape'])
+        store.country_transports = header['country_transports']
+        store.version = header['version']
+        store.analytics = None
+        if 'analytics' in header:
+            store.analytics = {mode: section(header['dtype'], offset, header['shape'])
+                               for mode, offset in header['analytics'].items()}
+        store.country_means = None
+        if 'country_means' in header:
+            means = header['country_means']
+            store.country_means = RangeMeans.from_sums(section('<f8', means['sums'], means['shape']),
+                                                       section('<i8', means['counts'], means['shape']))
+        store.country_day_means = None
+        if 'country_day_means' in header:
+            store.country_day_means = section('<f8', header['country_day_means']['offset'],
+                                              header['country_day_means']['shape'])
+        store.regions = None
+        if 'regions' in header:
+            store.regions = GeoIndex.from_header(header['regions'], section(header['dtype'], header['regions']['offset'],
+                                                                            header['regions']['shape']))
+
+        return store
+
+    def _scatter(self, frame, first_day, last_day):
+        rows = [self.country_rows[country] for country, _ in frame.columns]
+        slots = [self.transport_slots[transportation] for _, transportation in frame.columns]
+        self.values[rows, slots, first_day:last_day] = frame.to_numpy(dtype = self.values.dtype).T
+
+    def resolve_country(self, country_name):
+        """fall back to the default country if a country has no data
+        Input:
+            country_name (string): user defined country name
+        Output:
+            country_name (string): a country with data
+        """
+        if country_name in self.country_names:
+            return country_name
+        print('No Data available for ' + str(country_name) + '.')
+
+        return self.default_country
+
+    def day_range(self, start_date, end_date, include_forecast):
+        """resolve a date range to day offsets on the stitched timeline
+        Input:
+            start_date (string): start date in %Y-%m-%d, None for the first day
+            end_date (string): end date in %Y-%m-%d, None for the last day
+            include_forecast (boolean): whether or not forecasted days may be selected
+        Output:
+            first_day (int): offset of the first selected day
+            last_day (int): offset after the last selected day
+        """
+        n_days = len(self.days) if include_forecast else self.n_history
+        first_day = 0 if start_date is None else int(np.searchsorted(self.days, to_day(start_date), 'left'))
+        last_day = n_days if end_date is None else int(np.searchsorted(self.days, to_day(end_date), 'right'))
+
+        return min(first_day, n_days), min(last_day, n_days)
+
+    def series(self, country, transportation, first_day, last_day, values = None):
+        """get a view of a single series
+        Input:
+            country (string): country name
+            transportation (string): transportation type
+            first_day (int): offset of the first day
+            last_day (int): offset after the last day
+            values (numpy array): array shaped like the store's values to read instead,
+                                  e.g. a derived view of the trends, None reads the trends
+        Output:
+            x (numpy array): date labels in %Y-%m-%d
+            y (numpy array): % change from baseline
+        """
+        row = self.country_rows[country]
+        slot = self.transport_slots[transportation]
+        y = (self.values if values is None else values)[row, slot, first_day:last_day]
+        # float32 values are widened and rounded to the report's 2 decimals, so they
+        # serialize as short as float64 values do
+        if y.dtype != np.float64:
+            y = np.round(y.astype(np.float64), 2)
+
+        return self.labels[first_day:last_day], y
+
+    def to_payload(self):
+        """export the store as plain lists for drawing trends in the browser
+        Output:
+            payload (dict): date labels, number of historical days, default country,
+                            transportation types per country and the series values
+                            of every country, missing values are None
+        """
+        series = {}
+        for country in self.country_names:
+            series[country] = {}
+            for transportation in self.country_transports[country]:
+                values = self.values[self.country_rows[country], self.transport_slots[transportation], :]
+                series[country][transportation] = [None if np.isnan(value) else value
+                                                   for value in np.round(values.astype(np.float64), 2).tolist()]
+                pass
+            pass
+
+        return {'dates': self.labels.tolist(),
+                'n_history': self.n_history,
+                'default_country': self.default_country,
+                'transports': {country: self.country_transports[country] for country in self.country_names},
+                'series': series}